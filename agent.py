@@ -0,0 +1,408 @@
+import contextvars
+import functools
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage, message_chunk_to_message
+
+from instrumentation import tracer
+from intent import parse_conversion, tool_families
+from plan_cache import plan_cache
+from tool_results import RateQuote, CryptoQuote, Conversion, BtcConversion, HistoricalConversion, BatchConversion
+from main import (
+    OPENAI_MODEL,
+    llm_with_tools,
+    get_conversion_factor,
+    convert,
+    get_crypto_rate,
+    convert_fiat_to_btc,
+    convert_batch,
+    convert_on_date,
+    convert_any
+)
+
+# Tool calls from a single model turn run concurrently, bounded by this pool size
+MAX_PARALLEL_TOOL_CALLS = int(os.getenv("MAX_PARALLEL_TOOL_CALLS", "8"))
+# Seconds each tool call may take before it is reported back to the model as timed out
+TOOL_CALL_TIMEOUT = float(os.getenv("TOOL_CALL_TIMEOUT", "15"))
+
+# How replies built directly from tool responses label each tool's output
+TOOL_RESPONSE_PREFIXES = {
+    'convert': "💰",
+    'convert_batch': "💰",
+    'convert_on_date': "💰",
+    'convert_any': "💰",
+    'convert_fiat_to_btc': "₿",
+    'get_conversion_factor': "📊 Current exchange rate:",
+    'get_crypto_rate': "📊 Current exchange rate:",
+}
+
+TOOLS_BY_NAME = {
+    tool.name: tool
+    for tool in (get_conversion_factor, convert, get_crypto_rate, convert_fiat_to_btc, convert_batch, convert_on_date, convert_any)
+}
+
+# Lean mode sends only the tool schemas the prompt needs, compacts older tool
+# results and skips the final LLM call when a single tool result already answers
+AGENT_LEAN_MODE = os.getenv("AGENT_LEAN_MODE", "1") != "0"
+
+# Tools offered to the model for each family detected in the prompt
+TOOL_FAMILIES = {
+    'fiat': ('get_conversion_factor', 'convert', 'convert_batch'),
+    'crypto': ('get_crypto_rate', 'convert_fiat_to_btc', 'convert_any'),
+    'history': ('convert_on_date',),
+}
+
+# Tool results older than the latest round are cut to this many characters
+COMPACT_RESULT_CHARS = 120
+
+@functools.cache
+def tool_schema_chars():
+    """Rough size of each tool's JSON schema, used to estimate the tokens lean mode saves; built on first use"""
+    from langchain_core.utils.function_calling import convert_to_openai_tool
+    return {name: len(json.dumps(convert_to_openai_tool(tool))) for name, tool in TOOLS_BY_NAME.items()}
+
+def _invoke_traced(tool, args):
+    """Invoke a tool inside its own trace span"""
+    with tracer.span(f"tool {tool.name}", kind="tool") as span:
+        response = tool.invoke(args)
+        if str(response).startswith('Error'):
+            span.attributes['error'] = True
+        return response
+
+# Helper function to run a model turn's tool calls concurrently
+def invoke_tool_calls(tool_calls, timeout=TOOL_CALL_TIMEOUT):
+    """Invoke tool calls in parallel and return their responses in call order.
+
+    A call that raises or exceeds its timeout yields the exception in its slot.
+    """
+    known_calls = [tool_call for tool_call in tool_calls if tool_call['name'] in TOOLS_BY_NAME]
+    if not known_calls:
+        return [None] * len(tool_calls)
+
+    pool = ThreadPoolExecutor(max_workers=min(MAX_PARALLEL_TOOL_CALLS, len(known_calls)))
+    try:
+        futures = []
+        for tool_call in tool_calls:
+            tool = TOOLS_BY_NAME.get(tool_call['name'])
+            # Each call runs in a copy of the current context so its span nests under this turn
+            futures.append(
+                pool.submit(contextvars.copy_context().run, _invoke_traced, tool, tool_call['args']) if tool else None
+            )
+        # Every call starts together, so they share one deadline
+        deadline = time.monotonic() + timeout
+
+        responses = []
+        for future in futures:
+            if future is None:
+                responses.append(None)
+                continue
+            try:
+                responses.append(future.result(timeout=max(0.0, deadline - time.monotonic())))
+            except FutureTimeoutError:
+                responses.append(TimeoutError(f"Tool call timed out after {timeout:g}s"))
+            except Exception as e:
+                responses.append(e)
+        return responses
+    finally:
+        # Don't let a hung call block the turn; it finishes in the background
+        pool.shutdown(wait=False, cancel_futures=True)
+
+# Helper function to record one tool response in the results and conversation
+def record_tool_response(tool_call, tool_response, results, messages):
+    """Update results from a tool's typed response and append its ToolMessage"""
+    try:
+        if isinstance(tool_response, Exception):
+            raise tool_response
+
+        # Tools return typed results; failures come back as "Error: ..." strings
+        if isinstance(tool_response, Conversion):
+            results['amount'] = tool_response.amount
+            results['from_currency'] = tool_response.from_currency
+            results['to_currency'] = tool_response.to_currency
+            key = 'btc_equivalent' if isinstance(tool_response, BtcConversion) else 'conversion_result'
+            results[key] = tool_response.result
+            results['decimals'] = tool_response.decimals
+            results['age_note'] = tool_response.age_note()
+            if isinstance(tool_response, HistoricalConversion):
+                results['date'] = tool_response.date.isoformat()
+
+        elif isinstance(tool_response, RateQuote):
+            results['from_currency'] = tool_response.from_currency
+            results['to_currency'] = tool_response.to_currency
+            key = 'crypto_rate' if isinstance(tool_response, CryptoQuote) else 'conversion_rate'
+            results[key] = tool_response.rate
+            results['age_note'] = tool_response.age_note()
+
+        elif isinstance(tool_response, BatchConversion):
+            results['batch_result'] = tool_response
+
+        # The model only ever sees the string form
+        messages.append(ToolMessage(content=str(tool_response), tool_call_id=tool_call['id']))
+
+    except Exception as e:
+        # Silently handle tool errors and continue
+        error_message = ToolMessage(
+            content=f"Error: {str(e)}",
+            tool_call_id=tool_call['id']
+        )
+        messages.append(error_message)
+
+def select_tools(prompt):
+    """Names of the tools relevant to a prompt, or None to offer every tool"""
+    families = tool_families(prompt)
+    if families is None:
+        return None
+    return {name for family in families for name in TOOL_FAMILIES[family]}
+
+def compact_messages(messages):
+    """Copy of the conversation with tool results before the latest round cut down to short summaries.
+
+    AI messages keep their tool calls, since every ToolMessage must follow the
+    call it answers.
+    """
+    last_round = max((i for i, message in enumerate(messages) if getattr(message, 'tool_calls', None)), default=len(messages))
+    compacted = []
+    for i, message in enumerate(messages):
+        content = str(message.content)
+        if i < last_round and isinstance(message, (ToolMessage, AIMessage)) and len(content) > COMPACT_RESULT_CHARS:
+            lines = content.splitlines()
+            summary = lines[0][:COMPACT_RESULT_CHARS]
+            if len(lines) > 1:
+                summary += f" (+{len(lines) - 1} more lines)"
+            message = message.model_copy(update={'content': summary})
+        compacted.append(message)
+    return compacted
+
+def estimate_input_tokens(messages, tool_names):
+    """Rough prompt size in tokens (about four characters each) for messages plus tool schemas"""
+    chars = sum(len(str(message.content)) + len(json.dumps(getattr(message, 'tool_calls', None) or [])) for message in messages)
+    schema_chars = tool_schema_chars()
+    chars += sum(schema_chars[name] for name in (tool_names or schema_chars))
+    return chars // 4 + 4 * len(messages)
+
+def _normalized_args(args):
+    """Tool args with codes upper-cased and numbers as floats, so equivalent calls compare equal"""
+    return {
+        key: value.strip().upper() if isinstance(value, str) else float(value) if isinstance(value, (int, float)) else value
+        for key, value in args.items()
+    }
+
+def _answers_prompt(prompt, tool_call):
+    """Whether the prompt parses as a single conversion that is exactly this tool call"""
+    parsed = parse_conversion(prompt)
+    return (
+        parsed is not None
+        and parsed['name'] == tool_call['name']
+        and _normalized_args(parsed['args']) == _normalized_args(tool_call['args'])
+    )
+
+def _next_ai_message(messages, stream, llm=None):
+    """Get the model's next message, yielding ('token', text) events while streaming"""
+    llm = llm or llm_with_tools
+    with tracer.span("llm", kind="llm", model=OPENAI_MODEL, messages=len(messages)) as span:
+        if not stream:
+            ai_message = llm.invoke(messages)
+        else:
+            gathered = None
+            for chunk in llm.stream(messages):
+                if chunk.content:
+                    span.attributes.setdefault('first_token_ms', round((time.perf_counter() - span._t0) * 1e3, 1))
+                    yield ('token', chunk.content)
+                gathered = chunk if gathered is None else gathered + chunk
+            ai_message = message_chunk_to_message(gathered)
+
+        usage = ai_message.usage_metadata or {}
+        span.attributes.update(
+            input_tokens=usage.get('input_tokens', 0),
+            output_tokens=usage.get('output_tokens', 0),
+            tool_calls=len(ai_message.tool_calls),
+        )
+    return ai_message
+
+def stream_all_tool_calls(messages, max_iterations=5, stream=True, lean=AGENT_LEAN_MODE):
+    """Run the agent loop as a generator of progress events.
+
+    Yields ('token', text) for model output as it arrives, ('tool_start', tool_call)
+    before each tool runs, ('tool_end', tool_call, response) after it finishes,
+    and finally ('results', results).
+
+    In lean mode the model only sees the tools the prompt needs and compacted
+    older tool results, and the loop stops as soon as a single tool result
+    answers the question. results['token_report'] then estimates the input
+    tokens this saved against a full-context, all-tools run.
+    """
+    results = {
+        'conversion_rate': None,
+        'crypto_rate': None,
+        'btc_equivalent': None,
+        'conversion_result': None,
+        'batch_result': None,
+        'from_currency': None,
+        'to_currency': None,
+        'amount': None,
+        'date': None,
+        'decimals': None,
+        'age_note': "",
+        'final_response': None,
+        'stopped_early': False,
+        'token_report': None
+    }
+
+    llm, tool_names = None, None
+    if lean:
+        prompt = next((str(m.content) for m in reversed(messages) if isinstance(m, HumanMessage)), '')
+        tool_names = select_tools(prompt)
+        if tool_names is not None:
+            llm = llm_with_tools.with_tools(tool_names)
+        report = {'baseline_tokens': 0, 'sent_tokens': 0, 'llm_calls': 0, 'llm_calls_saved': 0}
+        results['token_report'] = report
+
+    for iteration in range(max_iterations):
+        with tracer.span(f"iteration {iteration + 1}", kind="iteration"):
+            try:
+                # Get AI response
+                if lean:
+                    sent = compact_messages(messages)
+                    report['baseline_tokens'] += estimate_input_tokens(messages, None)
+                    report['sent_tokens'] += estimate_input_tokens(sent, tool_names)
+                    report['llm_calls'] += 1
+                    ai_message = yield from _next_ai_message(sent, stream, llm)
+                else:
+                    ai_message = yield from _next_ai_message(messages, stream)
+
+                # If no tool calls, this is the final response
+                if not ai_message.tool_calls:
+                    results['final_response'] = ai_message.content
+                    break
+
+                # Add AI message to conversation
+                messages.append(ai_message)
+
+                # Run the tool calls concurrently, then process their responses in order
+                for tool_call in ai_message.tool_calls:
+                    yield ('tool_start', tool_call)
+                tool_responses = invoke_tool_calls(ai_message.tool_calls)
+                for tool_call, tool_response in zip(ai_message.tool_calls, tool_responses):
+                    record_tool_response(tool_call, tool_response, results, messages)
+                    yield ('tool_end', tool_call, tool_response)
+
+                # A lone first-round call is the answer only when the prompt asks for exactly that one
+                # conversion; multi-step requests ("... then convert that to BTC") need the next round
+                reply = None
+                if lean and iteration == 0 and len(ai_message.tool_calls) == 1 and _answers_prompt(prompt, ai_message.tool_calls[0]):
+                    reply = format_tool_responses(ai_message.tool_calls, tool_responses)
+                if reply is not None:
+                    results['final_response'] = reply
+                    results['stopped_early'] = True
+                    report['llm_calls_saved'] += 1
+                    report['baseline_tokens'] += estimate_input_tokens(messages, None)
+                    break
+            except Exception as e:
+                # Handle API key or other errors
+                results['final_response'] = f"Error: {str(e)}. Please check your API keys."
+                break
+
+    if lean:
+        report['saved_tokens'] = report['baseline_tokens'] - report['sent_tokens']
+        tracer.annotate(est_tokens_saved=report['saved_tokens'], llm_calls_saved=report['llm_calls_saved'])
+    yield ('results', results)
+
+# Helper function to process all tool calls recursively
+def process_all_tool_calls(messages, max_iterations=5):
+    """Process tool calls until no more are needed or max iterations reached"""
+    for event in stream_all_tool_calls(messages, max_iterations, stream=False):
+        if event[0] == 'results':
+            return event[1]
+
+# Helper function to turn tool results into a chat response
+def format_results(results):
+    """Build the assistant's reply from the results of process_all_tool_calls"""
+    if results['final_response']:
+        response_content = results['final_response']
+    elif results['batch_result'] is not None:
+        response_content = "💰 " + "  \n".join(f"**{line}**" for line in str(results['batch_result']).splitlines())
+    elif results['conversion_result'] is not None:
+        response_content = f"💰 **{results['amount']} {results['from_currency']} = {results['conversion_result']:.{results['decimals'] or 2}f} {results['to_currency']}**"
+        if results['date']:
+            response_content += f" on {results['date']}"
+        response_content += results['age_note']
+    elif results['btc_equivalent'] is not None:
+        response_content = f"₿ **{results['amount']} {results['from_currency']} = {results['btc_equivalent']:.8f} {results['to_currency']}**{results['age_note']}"
+    elif results['conversion_rate'] is not None:
+        if results['amount'] is not None:
+            converted_amount = results['amount'] * results['conversion_rate']
+            response_content = f"💰 **{results['amount']} {results['from_currency']} = {converted_amount:.2f} {results['to_currency']}**{results['age_note']}"
+        else:
+            response_content = f"📊 Current exchange rate: **1 {results['from_currency']} = {results['conversion_rate']:.4f} {results['to_currency']}**{results['age_note']}"
+    elif results['crypto_rate'] is not None:
+        response_content = f"📊 Current exchange rate: **1 {results['from_currency']} = {results['crypto_rate']:,.2f} {results['to_currency']}**{results['age_note']}"
+    else:
+        response_content = "❌ I apologize, but I couldn't complete the conversion. Please try again with a different format or check if the currencies are supported."
+
+    return response_content
+
+# Helper function to build a reply straight from tool responses
+def format_tool_responses(tool_calls, tool_responses):
+    """Render tool responses as the reply, or return None if any call failed"""
+    lines = []
+    for tool_call, tool_response in zip(tool_calls, tool_responses):
+        if isinstance(tool_response, Exception) or str(tool_response).startswith('Error'):
+            return None
+        prefix = TOOL_RESPONSE_PREFIXES.get(tool_call['name'])
+        if prefix is None:
+            return None
+        lines.append(f"{prefix} " + "  \n".join(f"**{line}**" for line in str(tool_response).splitlines()))
+    return "  \n".join(lines)
+
+# Helper function to answer simple conversions without the LLM
+def answer_with_fast_path(prompt):
+    """Answer a simple conversion query by calling its tool directly.
+
+    Returns None when the prompt can't be parsed or the tool fails, so the
+    caller can fall back to the LLM.
+    """
+    tool_call = parse_conversion(prompt)
+    if tool_call is None:
+        return None
+    tool_call['id'] = 'fast-path'
+    return format_tool_responses([tool_call], invoke_tool_calls([tool_call]))
+
+# Helper function to answer repeated prompts by replaying a cached tool plan
+def answer_from_plan_cache(prompt):
+    """Replay the cached tool plan for a prompt against current rates.
+
+    Returns None on a cache miss or if any replayed call fails.
+    """
+    tool_calls = plan_cache.lookup(prompt)
+    if tool_calls is None:
+        return None
+    return format_tool_responses(tool_calls, invoke_tool_calls(tool_calls))
+
+# Helper function to cache the tool plan the LLM used for a prompt
+def remember_plan(prompt, messages):
+    """Store the tool calls from a finished agent run so similar prompts can skip the LLM"""
+    if any(isinstance(message, ToolMessage) and str(message.content).startswith('Error') for message in messages):
+        return False
+    tool_calls = [tool_call for message in messages for tool_call in getattr(message, 'tool_calls', None) or []]
+    return plan_cache.store(prompt, tool_calls)
+
+# Helper function to answer a prompt end to end without streaming
+def answer(prompt):
+    """Answer a chat prompt through the fast path, the plan cache, then the LLM.
+
+    Returns (reply, path) where path names the route that produced the reply.
+    """
+    reply = answer_with_fast_path(prompt)
+    if reply is not None:
+        return reply, "fast_path"
+    reply = answer_from_plan_cache(prompt)
+    if reply is not None:
+        return reply, "plan_cache"
+    messages = [HumanMessage(content=prompt)]
+    results = process_all_tool_calls(messages)
+    if results['final_response'] and not results['final_response'].startswith('Error'):
+        remember_plan(prompt, messages)
+    return format_results(results), "llm"
@@ -1,17 +1,22 @@
 import streamlit as st
-from main import (
-    llm_with_tools, 
-    HumanMessage, 
-    ToolMessage,
-    get_conversion_factor,
-    convert,
-    get_crypto_rate,
-    convert_fiat_to_btc
-)
 import json
-import os
+import sys
 import traceback
-import re
+from credentials import Credentials, use_credentials
+from instrumentation import tracer, memory_exporter, format_waterfall
+from prefetch import prefetcher
+from quota import quotas
+
+@st.cache_resource(show_spinner="Loading the converter...")
+def load_agent():
+    """Import the agent, its tools and the LLM client cache once per process.
+
+    Streamlit re-executes this script on every interaction, and LangChain takes
+    most of a second to import, so it's loaded on the first conversion instead
+    of before the page can render.
+    """
+    import agent
+    return agent
 
 # Set page config
 st.set_page_config(
@@ -83,24 +88,24 @@ if "user_openai_key" not in st.session_state:
     st.session_state.user_openai_key = ""
 if "user_exchange_key" not in st.session_state:
     st.session_state.user_exchange_key = ""
+if "last_waterfall" not in st.session_state:
+    st.session_state.last_waterfall = ""
 
 def check_api_keys():
     """Check if user has provided API keys"""
     return bool(st.session_state.user_openai_key and st.session_state.user_exchange_key)
 
-def set_api_keys():
-    """Set user-provided API keys in environment for the session"""
-    if st.session_state.user_openai_key:
-        os.environ["OPENAI_API_KEY"] = st.session_state.user_openai_key
-    if st.session_state.user_exchange_key:
-        os.environ["EXCHANGE_RATE_API_KEY"] = st.session_state.user_exchange_key
+def session_credentials():
+    """This session's API keys; passed to the agent explicitly so concurrent sessions never share keys"""
+    return Credentials(st.session_state.user_openai_key, st.session_state.user_exchange_key)
 
 def clear_api_keys():
-    """Clear API keys from environment when user leaves"""
-    if "OPENAI_API_KEY" in os.environ:
-        del os.environ["OPENAI_API_KEY"]
-    if "EXCHANGE_RATE_API_KEY" in os.environ:
-        del os.environ["EXCHANGE_RATE_API_KEY"]
+    """Drop the cached LLM client and background refreshes for this session's keys when the user clears them"""
+    # Without a conversion yet there's no client to drop, and loading the agent would pull in LangChain
+    agent = sys.modules.get("agent")
+    if agent is not None and st.session_state.user_openai_key:
+        agent.llm_with_tools.forget(st.session_state.user_openai_key)
+    prefetcher.forget(st.session_state.user_exchange_key)
 
 # App title and description
 st.title("💱 Currency Converter Chat")
@@ -152,16 +157,15 @@ with st.container():
     st.session_state.api_keys_configured = check_api_keys()
     
     if st.session_state.api_keys_configured:
-        set_api_keys()
         st.success("🎉 API keys configured successfully! You can now use the converter.")
         
         # Add clear keys button
         if st.button("🗑️ Clear API Keys", help="Clear your API keys from memory"):
+            clear_api_keys()
             st.session_state.user_openai_key = ""
             st.session_state.user_exchange_key = ""
             st.session_state.api_keys_configured = False
             st.session_state.messages = []  # Clear chat history too
-            clear_api_keys()
             st.rerun()
     else:
         st.markdown('<div class="warning-box">⚠️ Both API keys are required to use the currency converter.</div>', unsafe_allow_html=True)
@@ -170,9 +174,6 @@ with st.container():
 
 # Only show the chat interface if API keys are configured
 if st.session_state.api_keys_configured:
-    # Set API keys for this session
-    set_api_keys()
-    
     st.markdown("---")
     st.markdown("""
         Ask me to convert currencies or cryptocurrencies! For example:
@@ -181,124 +182,30 @@ if st.session_state.api_keys_configured:
         - Convert 1000 INR to ETH
     """)
 
-    # Helper function to extract numeric value from string
-    def extract_numeric_value(text):
-        """Extract numeric value from text, handling various formats"""
-        if isinstance(text, (int, float)):
-            return float(text)
-        
-        # Remove backticks, commas, and other formatting
-        clean_text = str(text).replace('`', '').replace(',', '').strip()
-        
-        # Try to extract number using regex
-        number_match = re.search(r'[\d.]+', clean_text)
-        if number_match:
-            try:
-                return float(number_match.group())
-            except ValueError:
-                pass
-        
-        # Try direct conversion
-        try:
-            return float(clean_text)
-        except ValueError:
-            return None
+    # Helper function to stream the agent's reply into the chat
+    def render_agent_stream(messages):
+        """Stream model tokens into the chat and tool progress into a status box.
 
-    # Helper function to process all tool calls recursively
-    def process_all_tool_calls(messages, max_iterations=5):
-        """Process tool calls until no more are needed or max iterations reached"""
-        results = {
-            'conversion_rate': None,
-            'crypto_rate': None,
-            'btc_equivalent': None,
-            'conversion_result': None,
-            'from_currency': None,
-            'to_currency': None,
-            'amount': None,
-            'final_response': None
-        }
-        
-        for iteration in range(max_iterations):
-            try:
-                # Get AI response
-                ai_message = llm_with_tools.invoke(messages)
-                
-                # If no tool calls, this is the final response
-                if not ai_message.tool_calls:
-                    results['final_response'] = ai_message.content
-                    break
-                
-                # Add AI message to conversation
-                messages.append(ai_message)
-                
-                # Process each tool call
-                for tool_call in ai_message.tool_calls:
-                    try:
-                        # Process different tool types
-                        if tool_call['name'] == 'get_conversion_factor':
-                            results['from_currency'] = tool_call['args']['from_currency']
-                            results['to_currency'] = tool_call['args']['to_currency']
-                            tool_response = get_conversion_factor.invoke(tool_call['args'])
-                            
-                            # Extract conversion rate
-                            rate = extract_numeric_value(tool_response)
-                            if rate is not None:
-                                results['conversion_rate'] = rate
-                            
-                            messages.append(ToolMessage(content=str(tool_response), tool_call_id=tool_call['id']))
-                        
-                        elif tool_call['name'] == 'convert':
-                            results['amount'] = tool_call['args']['amount']
-                            results['from_currency'] = tool_call['args']['from_currency']
-                            results['to_currency'] = tool_call['args']['to_currency']
-                            tool_response = convert.invoke(tool_call['args'])
-                            
-                            # Only extract result if no error occurred
-                            if not str(tool_response).startswith('Error'):
-                                result = extract_numeric_value(tool_response)
-                                if result is not None:
-                                    results['conversion_result'] = result
-                            
-                            messages.append(ToolMessage(content=str(tool_response), tool_call_id=tool_call['id']))
-                        
-                        elif tool_call['name'] == 'get_crypto_rate':
-                            results['from_currency'] = tool_call['args']['base_currency']
-                            results['to_currency'] = tool_call['args']['target_currency']
-                            tool_response = get_crypto_rate.invoke(tool_call['args'])
-                            
-                            # Extract crypto rate
-                            rate = extract_numeric_value(tool_response)
-                            if rate is not None:
-                                results['crypto_rate'] = rate
-                            
-                            messages.append(ToolMessage(content=str(tool_response), tool_call_id=tool_call['id']))
+        Returns the agent results and whether the final answer was already rendered.
+        """
+        outcome = {}
+        status = st.status("Converting currencies...")
 
-                        elif tool_call['name'] == 'convert_fiat_to_btc':
-                            results['amount'] = tool_call['args']['amount']
-                            results['from_currency'] = tool_call['args']['fiat_currency']
-                            results['to_currency'] = tool_call['args']['base_currency']
-                            tool_response = convert_fiat_to_btc.invoke(tool_call['args'])
-                            
-                            # Extract BTC equivalent
-                            btc_amount = extract_numeric_value(tool_response)
-                            if btc_amount is not None:
-                                results['btc_equivalent'] = btc_amount
-                            
-                            messages.append(ToolMessage(content=str(tool_response), tool_call_id=tool_call['id']))
+        def token_stream():
+            for event in load_agent().stream_all_tool_calls(messages):
+                if event[0] == 'token':
+                    yield event[1]
+                elif event[0] == 'tool_start':
+                    status.write(f"🔧 Calling `{event[1]['name']}`...")
+                elif event[0] == 'tool_end':
+                    status.write(f"✅ {event[2]}")
+                elif event[0] == 'results':
+                    outcome['results'] = event[1]
 
-                    except Exception as e:
-                        # Silently handle tool errors and continue
-                        error_message = ToolMessage(
-                            content=f"Error: {str(e)}",
-                            tool_call_id=tool_call['id']
-                        )
-                        messages.append(error_message)
-            except Exception as e:
-                # Handle API key or other errors
-                results['final_response'] = f"Error: {str(e)}. Please check your API keys."
-                break
-        
-        return results
+        streamed = st.write_stream(token_stream())
+        status.update(label="Done", state="complete")
+        results = outcome['results']
+        return results, bool(streamed) and streamed == results['final_response']
 
     # Display chat messages
     for message in st.session_state.messages:
@@ -314,50 +221,59 @@ if st.session_state.api_keys_configured:
         with st.chat_message("user"):
             st.markdown(prompt)
         
-        # Get AI response
-        with st.chat_message("assistant"):
-            with st.spinner("Converting currencies..."):
-                try:
-                    # Create initial message
-                    messages = [HumanMessage(content=prompt)]
-                    
-                    # Process all tool calls
-                    results = process_all_tool_calls(messages)
-                    
-                    # Generate response based on results
-                    response_content = ""
+        # Get AI response with this session's keys; tool threads inherit them from the context
+        with st.chat_message("assistant"), use_credentials(session_credentials()):
+            try:
+                agent = load_agent()
+                # Time the whole turn so the debug panel can show where it went
+                with tracer.span("turn", kind="turn") as turn:
+                    # Other sessions' turns finish in the same exporter, so remember which trace is ours
+                    trace_id = turn.trace_id
+                    # Answer simple conversions and repeated prompts directly, without the LLM
+                    with st.spinner("Converting currencies..."):
+                        response_content = agent.answer_with_fast_path(prompt)
+                        turn.attributes['path'] = "fast_path"
+                        if response_content is None:
+                            response_content = agent.answer_from_plan_cache(prompt)
+                            turn.attributes['path'] = "plan_cache"
+                    already_rendered = False
+                
+                    if response_content is None:
+                        turn.attributes['path'] = "llm"
                     
-                    if results['final_response']:
-                        response_content = results['final_response']
-                    elif results['conversion_result'] is not None:
-                        response_content = f"💰 **{results['amount']} {results['from_currency']} = {results['conversion_result']:.2f} {results['to_currency']}**"
-                    elif results['btc_equivalent'] is not None:
-                        response_content = f"₿ **{results['amount']} {results['from_currency']} = {results['btc_equivalent']:.8f} {results['to_currency']}**"
-                    elif results['conversion_rate'] is not None:
-                        if results['amount'] is not None:
-                            converted_amount = results['amount'] * results['conversion_rate']
-                            response_content = f"💰 **{results['amount']} {results['from_currency']} = {converted_amount:.2f} {results['to_currency']}**"
-                        else:
-                            response_content = f"📊 Current exchange rate: **1 {results['from_currency']} = {results['conversion_rate']:.4f} {results['to_currency']}**"
-                    elif results['crypto_rate'] is not None:
-                        response_content = f"📊 Current exchange rate: **1 {results['from_currency']} = {results['crypto_rate']:,.2f} {results['to_currency']}**"
-                    else:
-                        response_content = "❌ I apologize, but I couldn't complete the conversion. Please try again with a different format or check if the currencies are supported."
+                        # Create initial message
+                        messages = [agent.HumanMessage(content=prompt)]
                     
-                    # Display response with success styling for conversions
-                    if "=" in response_content and any(symbol in response_content for symbol in ["💰", "₿"]):
-                        st.markdown(f'<div class="success-message">{response_content}</div>', unsafe_allow_html=True)
-                    else:
-                        st.markdown(response_content)
+                        # Stream the agent's progress and reply as it arrives
+                        results, already_rendered = render_agent_stream(messages)
                     
-                    # Store clean version without HTML for chat history
-                    clean_response = response_content.replace('<div class="success-message">', '').replace('</div>', '')
-                    st.session_state.messages.append({"role": "assistant", "content": clean_response})
+                        # Generate response based on results
+                        response_content = agent.format_results(results)
                     
-                except Exception as e:
-                    error_message = "❌ An error occurred while processing your request. Please check your API keys and try again."
-                    st.error(error_message)
-                    st.session_state.messages.append({"role": "assistant", "content": error_message})
+                        # Let similar prompts replay this tool plan instead of calling the LLM
+                        if results['final_response'] and not results['final_response'].startswith('Error'):
+                            agent.remember_plan(prompt, messages)
+                
+                # Keep this turn's timing breakdown for the debug panel
+                st.session_state.last_waterfall = format_waterfall(memory_exporter.trace(trace_id))
+                
+                # Display response with success styling for conversions
+                if already_rendered:
+                    # The model's answer was streamed into the chat already
+                    pass
+                elif "=" in response_content and any(symbol in response_content for symbol in ["💰", "₿"]):
+                    st.markdown(f'<div class="success-message">{response_content}</div>', unsafe_allow_html=True)
+                else:
+                    st.markdown(response_content)
+                
+                # Store clean version without HTML for chat history
+                clean_response = response_content.replace('<div class="success-message">', '').replace('</div>', '')
+                st.session_state.messages.append({"role": "assistant", "content": clean_response})
+                
+            except Exception as e:
+                error_message = "❌ An error occurred while processing your request. Please check your API keys and try again."
+                st.error(error_message)
+                st.session_state.messages.append({"role": "assistant", "content": error_message})
 
 else:
     # Show instructions when API keys are not configured
@@ -445,6 +361,24 @@ with st.sidebar:
     **Exchange Rate API:** {"🟢 Provided" if exchange_configured else "🔴 Missing"}
     """)
     
+    # Monthly quota of this session's Exchange Rate API key, as counted by this server
+    quota = quotas.quota("exchangerate", st.session_state.user_exchange_key) if exchange_configured else None
+    if quota is not None and quota.monthly is not None:
+        usage = quota.stats()
+        st.caption(f"Exchange Rate API quota: {usage['remaining']:,} of {usage['monthly']:,.0f} requests left this month")
+        if usage['remaining'] == 0:
+            st.error("🔴 Monthly quota used up; serving cached rates until it resets")
+        elif usage['low']:
+            runs_out = f" around {usage['projected_exhaustion'][:10]}" if usage['projected_exhaustion'] else ""
+            st.warning(f"🟡 Quota running low{runs_out}; cached rates are refreshed less often to stretch it")
+    
+    # Optional per-turn timing breakdown
+    if st.checkbox("🐞 Show timing breakdown", key="show_timing", help="Waterfall of LLM, tool and upstream calls for the last turn"):
+        if st.session_state.last_waterfall:
+            st.code(st.session_state.last_waterfall, language=None)
+        else:
+            st.caption("Send a message to see its timing breakdown.")
+    
     st.markdown("---")
     
     st.title("🔒 Privacy & Security")
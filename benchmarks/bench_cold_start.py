@@ -0,0 +1,78 @@
+"""First-request latency of a freshly started process, with and without rate snapshots.
+
+Each scenario starts a new Python process that imports the app and times its
+first fiat and crypto conversions against the local mock upstreams:
+
+    no snapshot       RATE_SNAPSHOT_PATH disabled, every first request goes upstream
+    snapshot (cold)   empty snapshot file; this run populates it
+    snapshot (warm)   restart with the populated file
+    upstream down     restart with the file, expired TTLs and every upstream failing
+
+    python benchmarks/bench_cold_start.py --latency-ms 200
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from mock_servers import MockUpstreams
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+CHILD = """
+import json, sys, time
+sys.path.insert(0, {root!r})
+import main
+from snapshots import snapshots
+timings = {{}}
+for name, tool, args in [
+    ("fiat", main.convert, {{"amount": 100, "from_currency": "USD", "to_currency": "EUR"}}),
+    ("crypto", main.get_crypto_rate, {{"base_currency": "BTC", "target_currency": "USD"}}),
+]:
+    start = time.perf_counter()
+    response = tool.invoke(args)
+    timings[name] = [(time.perf_counter() - start) * 1e3, str(response)]
+if snapshots is not None:
+    snapshots.flush()
+print(json.dumps(timings))
+"""
+
+
+def run_child(env):
+    output = subprocess.run(
+        [sys.executable, "-c", CHILD.format(root=ROOT)], env=env, capture_output=True, text=True, check=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--latency-ms", type=float, default=200.0)
+    args = parser.parse_args()
+
+    latency = {"exchangerate": args.latency_ms / 1e3, "coingecko": args.latency_ms / 1e3}
+    with MockUpstreams(latency=latency) as upstreams, tempfile.TemporaryDirectory() as path:
+        env = dict(os.environ, **upstreams.environ())
+        snapshot_env = dict(env, RATE_SNAPSHOT_PATH=os.path.join(path, "snapshots.sqlite3"))
+        scenarios = [
+            ("no snapshot", env, None),
+            ("snapshot (cold)", snapshot_env, None),
+            ("snapshot (warm)", snapshot_env, None),
+            ("upstream down", dict(snapshot_env, RATE_CACHE_TTL="0", CRYPTO_CACHE_TTL="0"), 1.0),
+        ]
+        print(f"mock upstream latency {args.latency_ms:g} ms\n")
+        print(f"{'scenario':<18}{'fiat ms':>10}{'crypto ms':>11}{'upstream':>10}  first answer")
+        for name, scenario_env, error_rate in scenarios:
+            upstreams.error_rate = dict.fromkeys(latency, error_rate or 0.0)
+            upstreams.reset_counts()
+            timings = run_child(scenario_env)
+            calls = sum(upstreams.counts().values())
+            print(f"{name:<18}{timings['fiat'][0]:>10.1f}{timings['crypto'][0]:>11.1f}{calls:>10}  {timings['fiat'][1]}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""Bulk file conversion: throughput and memory of convert_file.py.
+
+Writes a CSV ledger of --rows random (amount, currency, date) rows, then
+streams it through convert_file against the local mock exchangerate-api:
+CSV to CSV and CSV to Parquet at the latest rates, and CSV to Parquet at each
+row's historical rate. Peak RSS is reported after each pass. It should stay
+flat as --rows grows, because only one chunk is held in memory at a time.
+
+    python benchmarks/bench_file_convert.py --rows 5000000
+"""
+import argparse
+import datetime
+import os
+import resource
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from mock_servers import MockUpstreams, USD_RATES
+
+
+def rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def write_ledger(path, rows, days, seed, chunk=500_000):
+    """Write the input CSV chunk by chunk so generating it doesn't dominate peak RSS"""
+    rng = np.random.default_rng(seed)
+    # One code in a thousand is unknown, to exercise the blank-result path
+    codes = np.array(list(USD_RATES) + ["XXX"])
+    weights = np.full(len(codes), 0.999 / (len(codes) - 1))
+    weights[-1] = 0.001
+    end = np.datetime64(datetime.date.today() - datetime.timedelta(days=1), "D")
+    writer = None
+    for offset in range(0, rows, chunk):
+        n = min(chunk, rows - offset)
+        batch = pa.record_batch({
+            "id": np.arange(offset, offset + n),
+            "amount": np.round(rng.uniform(1, 10_000, n), 2),
+            "currency": codes[rng.choice(len(codes), n, p=weights)],
+            "booked_on": end - rng.integers(0, days, n).astype("timedelta64[D]"),
+        })
+        writer = writer or pa_csv.CSVWriter(path, batch.schema)
+        writer.write_batch(batch)
+    writer.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=2_000_000)
+    parser.add_argument("--days", type=int, default=90, help="distinct booking dates in the ledger")
+    parser.add_argument("--seed", type=int, default=1234)
+    args = parser.parse_args()
+
+    with MockUpstreams() as upstreams, tempfile.TemporaryDirectory() as path:
+        os.environ.update(upstreams.environ())
+        os.environ["RATE_HISTORY_DIR"] = path
+        os.environ["PREFETCH_INTERVAL"] = "0"
+        import convert_file
+
+        ledger = os.path.join(path, "ledger.csv")
+        write_ledger(ledger, args.rows, args.days, args.seed)
+        print(f"input        {args.rows:,} rows, {os.path.getsize(ledger) / 1e6:.0f} MB CSV, peak RSS {rss_mb():.0f} MB")
+
+        runs = [
+            ("csv->csv", ["out.csv", "--to", "EUR"]),
+            ("csv->parquet", ["out.parquet", "--to", "EUR"]),
+            ("dated", ["dated.parquet", "--to", "EUR", "--date-column", "booked_on"]),
+        ]
+        for label, extra in runs:
+            output = os.path.join(path, extra[0])
+            argv = [ledger, output, "--amount", "amount", "--from-column", "currency"] + extra[1:]
+            upstreams.reset_counts()
+            start = time.perf_counter()
+            rows, converted, _ = convert_file.convert_file(convert_file.parse_args(argv))
+            elapsed = time.perf_counter() - start
+            print(f"{label:<12} {rows:,} rows in {elapsed:.2f}s ({rows / elapsed * 60 / 1e6:,.1f}M rows/min), "
+                  f"{rows - converted:,} blank, {upstreams.counts().get('exchangerate', 0)} upstream calls, "
+                  f"peak RSS {rss_mb():.0f} MB")
+
+
+if __name__ == "__main__":
+    main()
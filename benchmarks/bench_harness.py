@@ -0,0 +1,170 @@
+"""Load benchmark for the tools and the agent loop against local mock upstreams.
+
+Starts the mocks from mock_servers.py, points main.py at them, then drives the
+tools and process_all_tool_calls at the requested concurrency and reports
+latency percentiles, throughput, upstream call counts and cache statistics.
+
+    python benchmarks/bench_harness.py --requests 2000 --concurrency 32 --latency-ms 80
+    python benchmarks/bench_harness.py --scenario agent --openai-latency-ms 400 --error-rate 0.02
+    python benchmarks/bench_harness.py --scenario agent --agent-mode full   # disable AGENT_LEAN_MODE
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from mock_servers import MockUpstreams, USD_RATES
+
+CRYPTO_SYMBOLS = ['BTC', 'ETH', 'SOL', 'ADA', 'XRP', 'LTC']
+VS_CURRENCIES = ['USD', 'EUR', 'GBP', 'INR', 'JPY']
+PROMPTS = [
+    "Convert {amount} USD to EUR",
+    "What is {amount} EUR in BTC?",
+    "What's the current GBP to JPY rate?",
+    "How much is {amount} CAD in Japanese Yen",
+    "ETH price in USD",
+    "Please help me figure out {amount} INR in US dollars",
+]
+
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+def tool_workload(rng):
+    """Pick a random tool call, shaped like what the model sends"""
+    import main
+
+    fiat = list(USD_RATES)
+    choice = rng.randrange(4)
+    if choice == 0:
+        return main.get_conversion_factor, {'from_currency': rng.choice(fiat), 'to_currency': rng.choice(fiat)}
+    if choice == 1:
+        return main.convert, {
+            'amount': round(rng.uniform(1, 10000), 2), 'from_currency': rng.choice(fiat), 'to_currency': rng.choice(fiat)
+        }
+    if choice == 2:
+        return main.get_crypto_rate, {'base_currency': rng.choice(CRYPTO_SYMBOLS), 'target_currency': rng.choice(VS_CURRENCIES)}
+    return main.convert_fiat_to_btc, {'amount': round(rng.uniform(1, 10000), 2), 'fiat_currency': rng.choice(fiat)}
+
+
+def run_tool(rng):
+    tool, args = tool_workload(rng)
+    response = tool.invoke(args)
+    return not str(response).startswith('Error')
+
+
+# Estimated token savings summed over every agent request in the run
+token_totals = Counter()
+_token_lock = threading.Lock()
+
+
+def run_agent(rng):
+    from agent import process_all_tool_calls
+    from main import HumanMessage
+
+    prompt = rng.choice(PROMPTS).format(amount=rng.randint(1, 5000))
+    results = process_all_tool_calls([HumanMessage(content=prompt)])
+    if results['token_report']:
+        with _token_lock:
+            for name in ('baseline_tokens', 'sent_tokens', 'llm_calls_saved'):
+                token_totals[name] += results['token_report'][name]
+    return not str(results['final_response'] or '').startswith('Error')
+
+
+def drive(fn, requests, concurrency, seed):
+    """Run fn(rng) requests times across a thread pool; return latencies, error count and wall time"""
+    def one(i):
+        rng = random.Random(seed + i)
+        start = time.perf_counter()
+        ok = fn(rng)
+        return time.perf_counter() - start, ok
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        outcomes = list(pool.map(one, range(requests)))
+    wall = time.perf_counter() - start
+    latencies = [latency for latency, _ in outcomes]
+    errors = sum(1 for _, ok in outcomes if not ok)
+    return latencies, errors, wall
+
+
+def report(name, latencies, errors, wall, upstream_counts, extra=None):
+    print(f"\n== {name} ==")
+    print(f"requests     {len(latencies)}  errors {errors}")
+    print(f"throughput   {len(latencies) / wall:,.1f} req/s  (wall {wall:.2f}s)")
+    print(
+        f"latency ms   p50 {percentile(latencies, 0.50) * 1e3:.2f}  p95 {percentile(latencies, 0.95) * 1e3:.2f}"
+        f"  p99 {percentile(latencies, 0.99) * 1e3:.2f}  mean {statistics.mean(latencies) * 1e3:.2f}"
+    )
+    print("upstream     " + ("  ".join(f"{name} {count}" for name, count in sorted(upstream_counts.items())) or "none"))
+    for label, value in (extra or {}).items():
+        print(f"{label:<12} {value}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenario", choices=["tools", "agent", "all"], default="all")
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--latency-ms", type=float, default=50.0, help="exchangerate-api and CoinGecko latency")
+    parser.add_argument("--openai-latency-ms", type=float, default=300.0)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="failure probability for every upstream")
+    parser.add_argument("--rate-cache-ttl", type=float, default=None, help="override RATE_CACHE_TTL (0 disables caching)")
+    parser.add_argument("--agent-mode", choices=["lean", "full"], default="lean", help="sets AGENT_LEAN_MODE")
+    parser.add_argument("--seed", type=int, default=1234)
+    args = parser.parse_args()
+
+    latency = {
+        "exchangerate": args.latency_ms / 1e3,
+        "coingecko": args.latency_ms / 1e3,
+        "openai": args.openai_latency_ms / 1e3,
+    }
+    error_rate = dict.fromkeys(latency, args.error_rate)
+
+    with MockUpstreams(latency=latency, error_rate=error_rate) as upstreams:
+        os.environ.update(upstreams.environ())
+        if args.rate_cache_ttl is not None:
+            os.environ["RATE_CACHE_TTL"] = str(args.rate_cache_ttl)
+            os.environ["CRYPTO_CACHE_TTL"] = str(args.rate_cache_ttl)
+        os.environ["AGENT_LEAN_MODE"] = "1" if args.agent_mode == "lean" else "0"
+
+        # Import only now so the app reads the mock URLs and cache settings
+        import agent  # noqa: F401  (keeps import time out of the first samples)
+        from cache import rate_cache
+        from crypto_prices import crypto_prices
+
+        print(
+            f"mock upstreams at {upstreams.url}; latency {args.latency_ms:g} ms "
+            f"(openai {args.openai_latency_ms:g} ms), error rate {args.error_rate:g}, "
+            f"concurrency {args.concurrency}"
+        )
+
+        scenarios = {"tools": run_tool, "agent": run_agent}
+        for name in (["tools", "agent"] if args.scenario == "all" else [args.scenario]):
+            upstreams.reset_counts()
+            rate_cache.clear()
+            crypto_prices.clear()
+            token_totals.clear()
+            latencies, errors, wall = drive(scenarios[name], args.requests, args.concurrency, args.seed)
+            extra = {"rate cache": rate_cache.stats(), "crypto cache": crypto_prices.stats()}
+            if name == "agent":
+                extra["llm tokens"] = f"{upstreams.prompt_tokens():,} prompt tokens billed by the mock ({args.agent_mode} mode)"
+                if token_totals:
+                    extra["est. saved"] = (
+                        f"{token_totals['baseline_tokens'] - token_totals['sent_tokens']:,} input tokens, "
+                        f"{token_totals['llm_calls_saved']} LLM calls"
+                    )
+            report(name, latencies, errors, wall, upstreams.counts(), extra)
+
+
+if __name__ == "__main__":
+    main()
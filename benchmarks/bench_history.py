@@ -0,0 +1,76 @@
+"""Historical rate store: incremental fill and bulk date-based conversion.
+
+Fills a temporary store with --days of daily rates from the local mock
+exchangerate-api, then converts --rows random (amount, date, from, to) rows in
+one vectorized pass, and again row by row through rate() for comparison.
+
+    python benchmarks/bench_history.py --days 365 --rows 1000000
+"""
+import argparse
+import datetime
+import os
+import random
+import resource
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from mock_servers import MockUpstreams, USD_RATES
+
+
+def rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--days", type=int, default=365)
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--scalar-rows", type=int, default=20_000, help="rows converted one at a time for comparison")
+    parser.add_argument("--seed", type=int, default=1234)
+    args = parser.parse_args()
+
+    with MockUpstreams() as upstreams, tempfile.TemporaryDirectory() as path:
+        os.environ.update(upstreams.environ())
+        os.environ["RATE_HISTORY_DIR"] = path
+        from main import history_store
+
+        end = datetime.date.today() - datetime.timedelta(days=1)
+        days = [end - datetime.timedelta(days=i) for i in range(args.days)]
+
+        start = time.perf_counter()
+        history_store.ensure(history_store.rows(days))
+        fill = time.perf_counter() - start
+        print(f"fill         {args.days} days in {fill:.2f}s ({upstreams.counts().get('exchangerate', 0)} upstream calls)")
+        print(f"on disk      {os.path.getsize(os.path.join(path, 'rates.f64')) / 1e6:.1f} MB apparent, "
+              f"{os.stat(os.path.join(path, 'rates.f64')).st_blocks * 512 / 1e6:.1f} MB allocated")
+
+        rng = np.random.default_rng(args.seed)
+        codes = np.array(list(USD_RATES))
+        amounts = rng.uniform(1, 10_000, args.rows)
+        dates = np.array(days, dtype="datetime64[D]")[rng.integers(0, len(days), args.rows)]
+        from_codes = codes[rng.integers(0, len(codes), args.rows)]
+        to_codes = codes[rng.integers(0, len(codes), args.rows)]
+
+        upstreams.reset_counts()
+        rss_before = rss_mb()
+        start = time.perf_counter()
+        history_store.convert_many(amounts, dates, from_codes, to_codes)
+        bulk = time.perf_counter() - start
+        print(f"bulk         {args.rows:,} rows in {bulk:.3f}s ({args.rows / bulk:,.0f} rows/s), "
+              f"{upstreams.counts().get('exchangerate', 0)} upstream calls, peak RSS +{rss_mb() - rss_before:.0f} MB")
+
+        sample = random.Random(args.seed).sample(range(args.rows), min(args.scalar_rows, args.rows))
+        start = time.perf_counter()
+        for i in sample:
+            history_store.rate(dates[i].item(), from_codes[i], to_codes[i])
+        scalar = time.perf_counter() - start
+        print(f"scalar       {len(sample):,} lookups in {scalar:.3f}s ({len(sample) / scalar:,.0f} lookups/s)")
+
+
+if __name__ == "__main__":
+    main()
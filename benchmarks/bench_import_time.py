@@ -0,0 +1,93 @@
+"""Cold start and per-rerun cost of the app's modules and Streamlit script.
+
+Every measurement runs in a fresh Python process, so nothing is already in
+sys.modules. Each one is repeated --runs times and the median is reported:
+
+    import main / agent / server   time to import the module, and whether langchain_openai came with it
+    app: first render              first run of app.py for a visitor without keys (what they wait for)
+    app: rerun                     every later widget interaction re-executes the script
+    app: first render with keys    first run once both keys are in the session
+    app: first chat turn           a simple conversion answered by the local fast path
+
+The chat turn runs against the local mock upstreams, so no network or real keys are needed.
+
+    python benchmarks/bench_import_time.py --runs 5
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from mock_servers import MockUpstreams
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+IMPORT_CHILD = """
+import json, sys, time
+sys.path.insert(0, {root!r})
+start = time.perf_counter()
+import {module}
+print(json.dumps({{"seconds": time.perf_counter() - start, "langchain_openai": "langchain_openai" in sys.modules}}))
+"""
+
+APP_CHILD = """
+import json, os, sys, time
+sys.path.insert(0, {root!r})
+os.chdir({root!r})
+from streamlit.testing.v1 import AppTest
+timings = {{}}
+at = AppTest.from_file("app.py", default_timeout=60)
+start = time.perf_counter()
+at.run()
+timings["app: first render"] = time.perf_counter() - start
+start = time.perf_counter()
+at.run()
+timings["app: rerun"] = time.perf_counter() - start
+at.session_state["user_openai_key"] = "sk-bench"
+at.session_state["user_exchange_key"] = "bench"
+start = time.perf_counter()
+at.run()
+timings["app: first render with keys"] = time.perf_counter() - start
+start = time.perf_counter()
+at.chat_input[0].set_value("Convert 100 USD to EUR").run()
+timings["app: first chat turn"] = time.perf_counter() - start
+assert not at.exception, at.exception
+timings["langchain_openai loaded"] = "langchain_openai" in sys.modules
+print(json.dumps(timings))
+"""
+
+
+def run_child(code, env):
+    output = subprocess.run(
+        [sys.executable, "-c", code], env=env, capture_output=True, text=True, check=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    with MockUpstreams() as upstreams:
+        env = dict(os.environ, **upstreams.environ(), PREFETCH_INTERVAL="0")
+        for module in ("main", "agent", "server"):
+            runs = [run_child(IMPORT_CHILD.format(root=ROOT, module=module), env) for _ in range(args.runs)]
+            seconds = statistics.median(run["seconds"] for run in runs)
+            loaded = "yes" if runs[0]["langchain_openai"] else "no"
+            print(f"{'import ' + module:<28} {seconds * 1e3:8.0f} ms   langchain_openai loaded: {loaded}")
+
+        runs = [run_child(APP_CHILD.format(root=ROOT), env) for _ in range(args.runs)]
+        for name in runs[0]:
+            if name == "langchain_openai loaded":
+                continue
+            print(f"{name:<28} {statistics.median(run[name] for run in runs) * 1e3:8.0f} ms")
+        print(f"{'langchain_openai loaded':<28} {'yes' if runs[0]['langchain_openai loaded'] else 'no':>8}   after the chat turn")
+
+
+if __name__ == "__main__":
+    main()
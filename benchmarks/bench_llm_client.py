@@ -0,0 +1,55 @@
+"""Measure the per-invoke overhead of preparing the tool-bound LLM client.
+
+Compares rebuilding ChatOpenAI + bind_tools on every call (the old LazyLLM
+behaviour) against the cached LazyLLM. No request is sent to OpenAI; only
+client construction and tool-schema binding are timed.
+
+    python benchmarks/bench_llm_client.py [iterations]
+"""
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark")
+
+from main import LazyLLM, get_openai_client, tools
+
+
+def rebuild_every_time():
+    return get_openai_client().bind_tools(tools)
+
+
+def timed(fn, iterations):
+    # Warm up imports and lazily-built state before sampling
+    fn()
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def report(label, samples):
+    samples = sorted(samples)
+    p95 = samples[int(len(samples) * 0.95) - 1]
+    print(f"{label:<22} mean {statistics.mean(samples) * 1e6:10.1f} us   p95 {p95 * 1e6:10.1f} us")
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    llm = LazyLLM()
+
+    before = timed(rebuild_every_time, iterations)
+    after = timed(llm._ensure_llm, iterations)
+
+    print(f"LLM client preparation, {iterations} iterations")
+    report("before (rebuild)", before)
+    report("after (cached)", after)
+    print(f"speedup: {statistics.mean(before) / statistics.mean(after):.0f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""A month of traffic against exchangerate-api's free tier, with and without quota pacing.
+
+Simulates, minute by minute in virtual time, one cached rate table
+(RATE_CACHE_TTL / RATE_CACHE_STALE_TTL semantics) that gets --lookups-per-minute
+lookups, plus --misses-per-day uncached requests such as new history days:
+
+    unpaced   every stale lookup triggers a refresh, as without a quota manager
+    paced     stale refreshes go through Quota.take(background=True), misses are essential
+
+Reported: requests spent, the day the quota ran out, lookups that failed for
+lack of data, and how old the rates served were. Weekly lines show what
+quota.stats() reported along the way.
+
+    python benchmarks/bench_quota.py --monthly 1500 --lookups-per-minute 2 --misses-per-day 5
+"""
+import argparse
+import datetime
+import os
+import random
+import statistics
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from quota import Quota, QuotaExceededError
+
+DAY = 86400
+
+
+def simulate(args, paced, report=None):
+    start = datetime.datetime(2026, 11, 1, tzinfo=datetime.timezone.utc).timestamp()
+    quota = Quota(args.monthly, None, args.reserve)
+    rng = random.Random(args.seed)
+    fetched_at = None
+    spent = failed = misses = missed = 0
+    exhausted_on = None
+    ages = []
+    for minute in range(30 * 24 * 60):
+        now = start + minute * 60
+        if report is not None and minute % (7 * 24 * 60) == 0 and minute:
+            report(minute // (24 * 60), quota.stats(now))
+        # Uncached requests: one upstream call each or an error
+        if rng.random() < args.misses_per_day / 1440:
+            misses += 1
+            try:
+                quota.take(now=now)
+                spent += 1
+            except QuotaExceededError:
+                missed += 1
+                exhausted_on = exhausted_on or minute // 1440 + 1
+        for _ in range(args.lookups_per_minute):
+            age = None if fetched_at is None else now - fetched_at
+            if age is None or age >= args.ttl + args.stale_ttl:
+                # Nothing servable: the caller waits on an essential fetch
+                try:
+                    quota.take(now=now)
+                    spent += 1
+                    fetched_at, age = now, 0.0
+                except QuotaExceededError:
+                    failed += 1
+                    exhausted_on = exhausted_on or minute // 1440 + 1
+                    continue
+            elif age >= args.ttl:
+                # Stale: served as is while one refresh runs
+                try:
+                    quota.take(background=paced, now=now)
+                    spent += 1
+                    fetched_at = now
+                except QuotaExceededError as e:
+                    if not str(e).startswith("Refresh deferred"):
+                        exhausted_on = exhausted_on or minute // 1440 + 1
+            ages.append(age)
+    return {
+        'spent': spent,
+        'exhausted_on': exhausted_on,
+        'failed': failed,
+        'misses': misses,
+        'missed': missed,
+        'median_age': statistics.median(ages),
+        'p95_age': sorted(ages)[int(len(ages) * 0.95)],
+        'max_age': max(ages),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--monthly", type=int, default=1500)
+    parser.add_argument("--reserve", type=float, default=0.1)
+    parser.add_argument("--ttl", type=float, default=300)
+    parser.add_argument("--stale-ttl", type=float, default=86400)
+    parser.add_argument("--lookups-per-minute", type=int, default=2)
+    parser.add_argument("--misses-per-day", type=float, default=5)
+    parser.add_argument("--seed", type=int, default=1234)
+    args = parser.parse_args()
+
+    def report(day, stats):
+        print(f"  day {day:2}: {stats['remaining']:5} left, {stats['per_day']:6.1f}/day, "
+              f"runs out {stats['projected_exhaustion'] or 'after reset'}")
+
+    for label, paced in (("unpaced", False), ("paced", True)):
+        print(label)
+        result = simulate(args, paced, report)
+        exhausted = f"day {result['exhausted_on']}" if result['exhausted_on'] else "never"
+        print(f"  spent {result['spent']} of {args.monthly}, quota ran out {exhausted}, "
+              f"{result['failed']:,} failed lookups, {result['missed']} of {result['misses']} misses refused")
+        print(f"  rate age served: median {result['median_age'] / 60:.0f} min, p95 {result['p95_age'] / 60:.0f} min, "
+              f"max {result['max_age'] / 3600:.1f} h")
+
+
+if __name__ == "__main__":
+    main()
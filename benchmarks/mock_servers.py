@@ -0,0 +1,275 @@
+"""Local stand-ins for exchangerate-api, CoinGecko and the OpenAI chat API.
+
+Each upstream replays realistic response bodies with configurable latency and
+error rate, and counts the calls it receives. Point the app at them with
+MockUpstreams.environ():
+
+    with MockUpstreams(latency={"exchangerate": 0.05}) as upstreams:
+        os.environ.update(upstreams.environ())
+        ...
+        print(upstreams.counts())
+"""
+import datetime
+import json
+import math
+import os
+import random
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+# Units of each currency per 1 USD
+USD_RATES = {
+    'USD': 1.0, 'EUR': 0.9213, 'GBP': 0.7894, 'JPY': 149.62, 'INR': 83.21, 'CAD': 1.3572,
+    'AUD': 1.5231, 'CHF': 0.8821, 'CNY': 7.2413, 'HKD': 7.8231, 'NZD': 1.6402, 'SEK': 10.612,
+    'NOK': 10.731, 'DKK': 6.8712, 'SGD': 1.3421, 'MXN': 17.052, 'BRL': 4.9712, 'ZAR': 18.712,
+    'RUB': 91.52, 'TRY': 32.14, 'KRW': 1332.5, 'PLN': 3.9712, 'THB': 35.912, 'MYR': 4.7231,
+    'AED': 3.6725, 'SAR': 3.75, 'ILS': 3.6912, 'NGN': 1512.3, 'HUF': 356.21, 'CZK': 23.312,
+    'PHP': 56.012, 'IDR': 15712.0, 'PKR': 278.51,
+}
+
+# USD price of each CoinGecko coin
+COIN_USD_PRICES = {
+    'bitcoin': 67012.0, 'ethereum': 3512.4, 'litecoin': 84.21, 'bitcoin-cash': 481.2,
+    'cardano': 0.4512, 'polkadot': 7.012, 'chainlink': 14.21, 'ripple': 0.5231,
+    'tether': 1.0002, 'usd-coin': 0.9998, 'binancecoin': 581.2, 'solana': 151.3,
+    'matic-network': 0.7012, 'avalanche-2': 35.12,
+}
+
+_PAIR_RE = re.compile(r"^/v6/[^/]+/pair/([A-Za-z]+)/([A-Za-z]+)$")
+_LATEST_RE = re.compile(r"^/v6/[^/]+/latest/([A-Za-z]+)$")
+_HISTORY_RE = re.compile(r"^/v6/[^/]+/history/([A-Za-z]+)/(\d{4})/(\d{1,2})/(\d{1,2})$")
+
+
+def _rates_against(base):
+    base_rate = USD_RATES[base]
+    return {code: round(rate / base_rate, 6) for code, rate in USD_RATES.items()}
+
+
+def _rates_on(base, day):
+    """Deterministic rates for a past day: today's rates drifted by up to +/-5%"""
+    drift = {code: 1 + 0.05 * math.sin(day.toordinal() / 30 + i) for i, code in enumerate(USD_RATES)}
+    drift['USD'] = 1.0
+    base_rate = USD_RATES[base] * drift[base]
+    return {code: round(rate * drift[code] / base_rate, 6) for code, rate in USD_RATES.items()}
+
+
+def _vs_price(usd_price, vs_currency):
+    if vs_currency.upper() in USD_RATES:
+        return round(usd_price * USD_RATES[vs_currency.upper()], 8)
+    if vs_currency == 'btc':
+        return round(usd_price / COIN_USD_PRICES['bitcoin'], 12)
+    if vs_currency == 'eth':
+        return round(usd_price / COIN_USD_PRICES['ethereum'], 12)
+    return None
+
+
+def _chat_reply(request):
+    """Script a chat completion: one tool call for the prompt, then a final answer"""
+    # Imported here so the app modules read upstream URLs only after environ() is applied
+    from intent import parse_conversion
+
+    messages = request.get("messages", [])
+    tool_outputs = [message.get("content", "") for message in messages if message.get("role") == "tool"]
+    if tool_outputs:
+        message = {"role": "assistant", "content": "Here you go: " + "; ".join(tool_outputs)}
+        finish_reason = "stop"
+    else:
+        prompt = next((m.get("content", "") for m in reversed(messages) if m.get("role") == "user"), "")
+        tool_call = parse_conversion(prompt) or {
+            'name': 'convert', 'args': {'amount': 100.0, 'from_currency': 'USD', 'to_currency': 'EUR'}
+        }
+        message = {
+            "role": "assistant",
+            "content": None,
+            "tool_calls": [{
+                "id": "call_mock_1",
+                "type": "function",
+                "function": {"name": tool_call['name'], "arguments": json.dumps(tool_call['args'])},
+            }],
+        }
+        finish_reason = "tool_calls"
+
+    prompt_tokens = sum(len(str(m.get("content") or "")) for m in messages) // 4 + 150 * len(request.get("tools", []))
+    return {
+        "id": "chatcmpl-mock",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": request.get("model", "gpt-4"),
+        "choices": [{"index": 0, "message": message, "finish_reason": finish_reason}],
+        "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": 20, "total_tokens": prompt_tokens + 20},
+    }
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Headers and body go out in separate writes; without this, delayed ACKs add ~40 ms per keep-alive request
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, body):
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _simulate(self, upstream):
+        """Apply latency and error injection; return True if the request should fail"""
+        upstreams = self.server.upstreams
+        upstreams.record(upstream)
+        delay = upstreams.latency.get(upstream, 0.0)
+        if delay:
+            time.sleep(delay * random.uniform(0.8, 1.2))
+        return random.random() < upstreams.error_rate.get(upstream, 0.0)
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        pair = _PAIR_RE.match(url.path)
+        latest = _LATEST_RE.match(url.path)
+
+        if pair or latest:
+            if self._simulate("exchangerate"):
+                return self._send(500, {"result": "error", "error-type": "mock-upstream-failure"})
+            codes = [code.upper() for code in (pair or latest).groups()]
+            if any(code not in USD_RATES for code in codes):
+                return self._send(404, {"result": "error", "error-type": "unsupported-code"})
+            if pair:
+                return self._send(200, {
+                    "result": "success", "base_code": codes[0], "target_code": codes[1],
+                    "conversion_rate": _rates_against(codes[0])[codes[1]],
+                })
+            return self._send(200, {"result": "success", "base_code": codes[0], "conversion_rates": _rates_against(codes[0])})
+
+        history = _HISTORY_RE.match(url.path)
+        if history:
+            if self._simulate("exchangerate"):
+                return self._send(500, {"result": "error", "error-type": "mock-upstream-failure"})
+            base = history.group(1).upper()
+            try:
+                day = datetime.date(*(int(part) for part in history.groups()[1:]))
+            except ValueError:
+                return self._send(400, {"result": "error", "error-type": "malformed-request"})
+            if base not in USD_RATES:
+                return self._send(404, {"result": "error", "error-type": "unsupported-code"})
+            return self._send(200, {
+                "result": "success", "base_code": base, "year": day.year, "month": day.month, "day": day.day,
+                "conversion_rates": _rates_on(base, day),
+            })
+
+        if url.path == "/api/v3/simple/price":
+            if self._simulate("coingecko"):
+                return self._send(429, {"status": {"error_code": 429, "error_message": "mock rate limit"}})
+            query = parse_qs(url.query)
+            ids = ",".join(query.get("ids", [""])).split(",")
+            vs_currencies = ",".join(query.get("vs_currencies", [""])).lower().split(",")
+            body = {}
+            for coin in ids:
+                if coin in COIN_USD_PRICES:
+                    prices = {vs: _vs_price(COIN_USD_PRICES[coin], vs) for vs in vs_currencies}
+                    body[coin] = {vs: price for vs, price in prices.items() if price is not None}
+            return self._send(200, body)
+
+        self._send(404, {"error": "not found"})
+
+    def do_POST(self):
+        if urlsplit(self.path).path != "/v1/chat/completions":
+            return self._send(404, {"error": "not found"})
+        length = int(self.headers.get("Content-Length", 0))
+        request = json.loads(self.rfile.read(length) or b"{}")
+        if self._simulate("openai"):
+            return self._send(500, {"error": {"message": "mock upstream failure", "type": "server_error"}})
+        reply = _chat_reply(request)
+        self.server.upstreams.record("openai_prompt_tokens", reply["usage"]["prompt_tokens"])
+        self._send(200, reply)
+
+
+class MockUpstreams:
+    """One local HTTP server answering for every mocked upstream.
+
+    latency and error_rate map an upstream name ("exchangerate", "coingecko",
+    "openai") to seconds of added delay and a failure probability.
+    """
+
+    def __init__(self, latency=None, error_rate=None, host="127.0.0.1", port=0):
+        self.latency = dict(latency or {})
+        self.error_rate = dict(error_rate or {})
+        self._counts = Counter()
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), _Handler)
+        self._server.daemon_threads = True
+        self._server.upstreams = self
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def environ(self):
+        """Environment variables that point the app at these mocks"""
+        return {
+            "EXCHANGE_RATE_API_URL": f"{self.url}/v6",
+            "COINGECKO_API_URL": f"{self.url}/api/v3",
+            "OPENAI_BASE_URL": f"{self.url}/v1",
+            "EXCHANGE_RATE_API_KEY": "mock-key",
+            "OPENAI_API_KEY": "sk-mock",
+            # Keep benchmark runs from reading or overwriting the real rate snapshots
+            "RATE_SNAPSHOT_PATH": "",
+            # The mocks have no quotas; benchmarks measure the app, not the free tier's limits
+            "QUOTA_MONTHLY": "",
+            "QUOTA_PER_SECOND": "",
+        }
+
+    def record(self, upstream, amount=1):
+        with self._lock:
+            self._counts[upstream] += amount
+
+    def counts(self):
+        """Calls per upstream, excluding the openai_prompt_tokens tally"""
+        with self._lock:
+            return {name: count for name, count in self._counts.items() if name != "openai_prompt_tokens"}
+
+    def prompt_tokens(self):
+        """Prompt tokens billed across every mocked chat completion"""
+        with self._lock:
+            return self._counts["openai_prompt_tokens"]
+
+    def reset_counts(self):
+        with self._lock:
+            self._counts.clear()
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+if __name__ == "__main__":
+    with MockUpstreams(port=int(sys.argv[1]) if len(sys.argv) > 1 else 8765) as upstreams:
+        print(f"Mock upstreams listening on {upstreams.url}")
+        for name, value in upstreams.environ().items():
+            print(f"export {name}={value}")
+        try:
+            threading.Event().wait()
+        except KeyboardInterrupt:
+            pass
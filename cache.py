@@ -0,0 +1,310 @@
+import asyncio
+import contextvars
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from instrumentation import tracer
+from quota import background
+
+
+class TTLCache:
+    """Thread-safe LRU cache whose entries expire after a fixed TTL.
+
+    Concurrent misses on the same key share a single fetch, so a burst of
+    identical lookups only ever costs one upstream request.
+
+    With stale_ttl set, an entry past its TTL is still served by get_or_fetch
+    for up to stale_ttl more seconds while one background fetch refreshes it,
+    so callers never wait on a slow upstream and keep getting the last good
+    value while it is down.
+    """
+
+    def __init__(self, ttl=300, maxsize=256, name=None, stale_ttl=0):
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        # When set, hits and misses are recorded on the active trace span as cache.<name>
+        self.name = name
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.stale_hits = 0
+        self._data = OrderedDict()
+        self._inflight = {}
+        self._ainflight = {}
+        self._refreshes = set()
+        self._persist = None
+        self._lock = threading.Lock()
+
+    def _lookup(self, key, now):
+        """Return the (value, expires_at) entry if fresh or still servable stale, else None; caller must hold the lock"""
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        if entry[1] + self.stale_ttl <= now:
+            del self._data[key]
+            return None
+        self._data.move_to_end(key)
+        return entry
+
+    def _trace(self, result):
+        if self.name:
+            tracer.annotate(**{f"cache.{self.name}": result})
+
+    def _store(self, key, value, now):
+        """Insert a value and evict the least recently used entries; caller must hold the lock"""
+        self._data[key] = (value, now + self.ttl)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def _remember(self, key, value, inflight):
+        """Store a freshly fetched value, release its in-flight slot and persist it"""
+        with self._lock:
+            self._store(key, value, time.monotonic())
+            if inflight is not None:
+                del inflight[key]
+        if self._persist is not None:
+            self._persist.save(key, value)
+
+    def get(self, key, default=None):
+        """Return the cached value for key, or default if missing or expired"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._lookup(key, now)
+            if entry is None or entry[1] <= now:
+                self.misses += 1
+                return default
+            self.hits += 1
+            return entry[0]
+
+    def set(self, key, value):
+        """Store a value under key"""
+        self._remember(key, value, None)
+
+    def attach(self, persist):
+        """Back the cache with a persistent store.
+
+        Entries saved by earlier processes are loaded now, keeping their
+        original age, and every value stored from here on is saved back.
+        persist provides load() -> iterable of (key, value, saved_at wall time)
+        and save(key, value). Returns the keys that were loaded.
+        """
+        wall_now, now = time.time(), time.monotonic()
+        loaded = []
+        with self._lock:
+            for key, value, saved_at in persist.load():
+                stored_at = now - max(0.0, wall_now - saved_at)
+                if key not in self._data and stored_at + self.ttl + self.stale_ttl > now:
+                    self._store(key, value, stored_at)
+                    loaded.append(key)
+            self._persist = persist
+        return loaded
+
+    def get_or_fetch(self, key, fetch):
+        """Return the cached value for key, calling fetch() once on a miss.
+
+        Exceptions raised by fetch are propagated to every waiting caller and
+        nothing is cached, so errors are never served from the cache.
+        """
+        now = time.monotonic()
+        with self._lock:
+            entry = self._lookup(key, now)
+            if entry is not None and entry[1] > now:
+                self.hits += 1
+                self._trace('hit')
+                return entry[0]
+            waiter = self._inflight.get(key)
+            leader = waiter is None
+            if leader:
+                waiter = self._inflight[key] = _Waiter()
+            if entry is not None:
+                # Stale: answer from the old value; the first caller starts a background refresh
+                self.stale_hits += 1
+                self._trace('stale')
+            else:
+                self.misses += 1
+                self._trace('miss')
+
+        if entry is not None:
+            if leader:
+                context = contextvars.copy_context()
+                threading.Thread(target=context.run, args=(self._refresh, key, fetch, waiter), daemon=True).start()
+            return entry[0]
+
+        if not leader:
+            return waiter.wait()
+        return self._fetch_as_leader(key, fetch, waiter)
+
+    def _fetch_as_leader(self, key, fetch, waiter):
+        try:
+            value = fetch()
+        except BaseException as e:
+            with self._lock:
+                del self._inflight[key]
+            waiter.fail(e)
+            raise
+        self._remember(key, value, self._inflight)
+        waiter.resolve(value)
+        return value
+
+    def _refresh(self, key, fetch, waiter):
+        try:
+            # Callers already have the stale value, so this refresh yields to a tight quota
+            with background():
+                self._fetch_as_leader(key, fetch, waiter)
+        except Exception:
+            # Keep serving the stale value; the next lookup after this one tries again
+            pass
+
+    async def aget_or_fetch(self, key, fetch):
+        """Async variant of get_or_fetch; fetch is a coroutine function.
+
+        Concurrent misses on the same key within one event loop share a single
+        fetch.
+        """
+        loop = asyncio.get_running_loop()
+        now = time.monotonic()
+        with self._lock:
+            entry = self._lookup(key, now)
+            if entry is not None and entry[1] > now:
+                self.hits += 1
+                self._trace('hit')
+                return entry[0]
+            future = self._ainflight.get((loop, key))
+            leader = future is None
+            if leader:
+                future = self._ainflight[(loop, key)] = loop.create_future()
+            if entry is not None:
+                self.stale_hits += 1
+                self._trace('stale')
+            else:
+                self.misses += 1
+                self._trace('miss')
+
+        if entry is not None:
+            if leader:
+                task = loop.create_task(self._arefresh(loop, key, fetch, future))
+                # The loop only holds weak references to tasks
+                self._refreshes.add(task)
+                task.add_done_callback(self._refreshes.discard)
+            return entry[0]
+
+        if not leader:
+            return await asyncio.shield(future)
+        return await self._afetch_as_leader(loop, key, fetch, future)
+
+    async def _afetch_as_leader(self, loop, key, fetch, future):
+        try:
+            value = await fetch()
+        except BaseException as e:
+            with self._lock:
+                del self._ainflight[(loop, key)]
+            if isinstance(e, asyncio.CancelledError):
+                future.cancel()
+            else:
+                future.set_exception(e)
+                # Mark the exception as retrieved in case nobody else was waiting
+                future.exception()
+            raise
+        with self._lock:
+            self._store(key, value, time.monotonic())
+            del self._ainflight[(loop, key)]
+        if self._persist is not None:
+            self._persist.save(key, value)
+        future.set_result(value)
+        return value
+
+    async def _arefresh(self, loop, key, fetch, future):
+        try:
+            with background():
+                await self._afetch_as_leader(loop, key, fetch, future)
+        except Exception:
+            pass
+
+    def remaining(self, key):
+        """Seconds until key's entry expires (negative once stale), or None if it isn't cached"""
+        with self._lock:
+            entry = self._data.get(key)
+            return None if entry is None else entry[1] - time.monotonic()
+
+    def refresh(self, key, fetch):
+        """Fetch key now and store the result, unless a fetch for it is already running.
+
+        Returns True if the value was refreshed. Errors are swallowed, leaving
+        the current entry in place.
+        """
+        with self._lock:
+            if key in self._inflight:
+                return False
+            waiter = self._inflight[key] = _Waiter()
+        try:
+            self._fetch_as_leader(key, fetch, waiter)
+        except Exception:
+            return False
+        return True
+
+    def discard(self, key):
+        """Remove key from the cache if present"""
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        """Drop all cached entries and reset the counters"""
+        with self._lock:
+            self._data.clear()
+            self.hits = 0
+            self.misses = 0
+            self.stale_hits = 0
+
+    def stats(self):
+        """Return hit/miss counters and current size"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'stale_hits': self.stale_hits,
+                'hit_rate': self.hits / total if total else 0.0,
+                'size': len(self._data),
+                'maxsize': self.maxsize,
+                'ttl': self.ttl,
+                'stale_ttl': self.stale_ttl,
+            }
+
+    def __len__(self):
+        with self._lock:
+            return len(self._data)
+
+
+class _Waiter:
+    """Result slot shared by callers waiting on the same in-flight fetch"""
+
+    def __init__(self):
+        self._event = threading.Event()
+        self._value = None
+        self._error = None
+
+    def resolve(self, value):
+        self._value = value
+        self._event.set()
+
+    def fail(self, error):
+        self._error = error
+        self._event.set()
+
+    def wait(self):
+        self._event.wait()
+        if self._error is not None:
+            raise self._error
+        return self._value
+
+
+# Process-wide cache shared by all fiat rate tools
+rate_cache = TTLCache(
+    ttl=float(os.getenv("RATE_CACHE_TTL", "300")),
+    maxsize=int(os.getenv("RATE_CACHE_MAXSIZE", "512")),
+    name="rates",
+    stale_ttl=float(os.getenv("RATE_CACHE_STALE_TTL", "86400")),
+)
@@ -0,0 +1,170 @@
+import threading
+from collections import deque
+
+import numpy as np
+
+from rate_table import UnsupportedCurrencyError
+
+
+class ConversionGraph:
+    """Every known fiat and crypto rate held as edges of one graph, with all-pairs rates precomputed.
+
+    Each source (the fiat rate table, the crypto price matrix, ...) contributes
+    directed edges "1 A = rate B" stamped with the time they were fetched, and
+    every edge is usable in both directions. A breadth-first search from the
+    hub currency picks, for every node, the path with the fewest hops, taking
+    the one whose oldest edge is freshest on ties. Pairs joined by a direct
+    edge use it; every other pair goes A -> hub -> B along those paths. The
+    resulting n x n rate matrix is rebuilt with two vectorized operations
+    whenever a source's rates change. The search itself only reruns when the
+    set of edges changes.
+    """
+
+    def __init__(self, hub="USD"):
+        self.hub = hub.upper()
+        self.rebuilds = 0
+        self.searches = 0
+        self._sources = {}
+        self._lock = threading.Lock()
+        self._tree = None
+        self._pairs = None
+
+    def update(self, source, edges, fetched_at):
+        """Replace the edges contributed by source with {(from, to): rate}; returns True if anything changed"""
+        edges = {(a.upper(), b.upper()): float(rate) for (a, b), rate in edges.items() if rate and a.upper() != b.upper()}
+        with self._lock:
+            previous = self._sources.get(source)
+            if previous is not None and previous[1] == fetched_at and previous[0].keys() == edges.keys():
+                return False
+            self._sources[source] = (edges, fetched_at)
+            if previous is None or previous[0].keys() != edges.keys():
+                self._tree = None
+            self._pairs = None
+            return True
+
+    def fetched_at(self, source):
+        """When source's current edges were fetched, or None if it hasn't contributed any"""
+        with self._lock:
+            entry = self._sources.get(source)
+            return None if entry is None else entry[1]
+
+    def _edges(self):
+        """Every edge in both directions as {(a, b): (rate, fetched_at)}; caller holds the lock"""
+        combined = {}
+        for edges, fetched_at in self._sources.values():
+            for (a, b), rate in edges.items():
+                for key, value in (((a, b), rate), ((b, a), 1.0 / rate)):
+                    # Where two sources quote the same pair, keep the fresher quote
+                    if key not in combined or combined[key][1] < fetched_at:
+                        combined[key] = (value, fetched_at)
+        return combined
+
+    def _search(self, edges):
+        """Breadth-first tree from the hub: (codes in visit order, parent of each code)"""
+        self.searches += 1
+        neighbours = {}
+        for a, b in edges:
+            neighbours.setdefault(a, []).append(b)
+        parent = {self.hub: None}
+        freshness = {self.hub: float("inf")}
+        order = [self.hub]
+        frontier = deque([self.hub])
+        while frontier:
+            layer = {}
+            for _ in range(len(frontier)):
+                node = frontier.popleft()
+                for neighbour in neighbours.get(node, ()):
+                    if neighbour in parent:
+                        continue
+                    fresh = min(freshness[node], edges[(node, neighbour)][1])
+                    if neighbour not in layer or fresh > layer[neighbour][1]:
+                        layer[neighbour] = (node, fresh)
+            for node, (via, fresh) in layer.items():
+                parent[node] = via
+                freshness[node] = fresh
+                order.append(node)
+                frontier.append(node)
+        return order, parent
+
+    def _rebuild(self):
+        """Recompute the all-pairs rates and freshness matrices; caller holds the lock"""
+        self.rebuilds += 1
+        edges = self._edges()
+        if self._tree is None:
+            self._tree = self._search(edges)
+        order, parent = self._tree
+        index = {code: i for i, code in enumerate(order)}
+        # units[i]: units of order[i] per one hub unit; fresh[i]: oldest edge on its path
+        units = np.ones(len(order))
+        fresh = np.full(len(order), np.inf)
+        for i, code in enumerate(order[1:], 1):
+            rate, fetched_at = edges[(parent[code], code)]
+            j = index[parent[code]]
+            units[i] = units[j] * rate
+            fresh[i] = min(fresh[j], fetched_at)
+        rates = units[np.newaxis, :] / units[:, np.newaxis]
+        freshness = np.minimum(fresh[:, np.newaxis], fresh[np.newaxis, :])
+        # A direct quote is one hop and beats any triangulated path
+        for (a, b), (rate, fetched_at) in edges.items():
+            if a in index and b in index:
+                rates[index[a], index[b]] = rate
+                freshness[index[a], index[b]] = fetched_at
+        self._pairs = (index, rates, freshness)
+        return self._pairs
+
+    def _snapshot(self):
+        with self._lock:
+            return self._pairs or self._rebuild()
+
+    def rate(self, from_currency, to_currency):
+        """(units of to_currency per one from_currency, fetch time of the oldest rate used)"""
+        index, rates, freshness = self._snapshot()
+        i, j = self._position(index, from_currency), self._position(index, to_currency)
+        return float(rates[i, j]), float(freshness[i, j])
+
+    def path(self, from_currency, to_currency):
+        """The currencies a conversion passes through, endpoints included"""
+        from_currency, to_currency = from_currency.upper(), to_currency.upper()
+        with self._lock:
+            pairs = self._pairs or self._rebuild()
+            order, parent = self._tree
+            direct = any((from_currency, to_currency) in edges or (to_currency, from_currency) in edges
+                         for edges, _ in self._sources.values())
+        self._position(pairs[0], from_currency)
+        self._position(pairs[0], to_currency)
+        if from_currency == to_currency:
+            return (from_currency,)
+        if direct:
+            return (from_currency, to_currency)
+        up, down = [from_currency], [to_currency]
+        while parent[up[-1]] is not None:
+            up.append(parent[up[-1]])
+        while parent[down[-1]] is not None:
+            down.append(parent[down[-1]])
+        # Drop the shared stretch towards the hub, keeping the node where the two paths meet
+        while len(up) > 1 and len(down) > 1 and up[-2] == down[-2]:
+            up.pop()
+            down.pop()
+        return tuple(up + down[-2::-1])
+
+    @staticmethod
+    def _position(index, code):
+        try:
+            return index[code.upper()]
+        except KeyError:
+            raise UnsupportedCurrencyError(code.upper()) from None
+
+    def __contains__(self, code):
+        return code.upper() in self._snapshot()[0]
+
+    def __len__(self):
+        return len(self._snapshot()[0])
+
+    def stats(self):
+        with self._lock:
+            return {
+                'sources': {source: len(edges) for source, (edges, _) in self._sources.items()},
+                'nodes': len(self._tree[0]) if self._tree else None,
+                'rebuilds': self.rebuilds,
+                'searches': self.searches,
+            }
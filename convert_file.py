@@ -0,0 +1,220 @@
+"""Convert every amount in a CSV or Parquet ledger without the LLM.
+
+Streams the input in chunks and converts each chunk's amount and currency
+columns in one vectorized pass. All rows use the same rate snapshot, or the
+historical rates of each row's date. Output chunks are written as they are
+produced, so memory use doesn't grow with the file. The output is the input
+plus a converted-amount column. Rows with an unknown currency, a currency
+not quoted on the row's date, or a blank amount get an empty result.
+
+    python convert_file.py ledger.csv ledger_eur.parquet --amount amount --from-column currency --to EUR
+    python convert_file.py trades.parquet out.csv --amount qty --from USD --to-column ccy --date-column booked_on
+
+Formats are chosen by file extension: .parquet, anything else is CSV.
+"""
+import argparse
+import datetime
+import sys
+import time
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pa_csv
+import pyarrow.parquet as pq
+
+from history import InvalidDateError
+from main import ExchangeRateError, get_rate_table, history_store
+from upstream import UpstreamError
+from rate_table import UnsupportedCurrencyError
+
+# Bytes of CSV parsed per chunk
+CSV_BLOCK_SIZE = 4 << 20
+# Rows per chunk when reading Parquet
+PARQUET_BATCH_ROWS = 131072
+
+
+def _csv_batches(path, column_types):
+    """Parse a CSV file one line-aligned block at a time.
+
+    Arrow's streaming CSV reader reads ahead of its consumer without bound,
+    so on a fast disk it ends up holding the whole file. Here only the block
+    being parsed is in memory. `column_types` pins the columns the conversion
+    reads; every other column is passed through as text, so no later block
+    can disagree with a type guessed from an earlier one (a column blank so
+    far, an int column that turns float). Like Arrow's default, quoted
+    values are assumed not to contain newlines.
+    """
+    with open(path, "rb") as file:
+        header = file.readline()
+        names = pa_csv.read_csv(pa.py_buffer(header)).column_names
+        column_types = {name: column_types.get(name, pa.string()) for name in names}
+        rest = b""
+        while True:
+            block = file.read(CSV_BLOCK_SIZE)
+            data = rest + block
+            cut = data.rfind(b"\n") + 1 if block else len(data)
+            data, rest = data[:cut], data[cut:]
+            if data.strip():
+                options = pa_csv.ConvertOptions(column_types=column_types)
+                yield from pa_csv.read_csv(pa.py_buffer(header + data), convert_options=options).to_batches()
+            if not block:
+                return
+
+
+def read_batches(path, column_types=None):
+    """Yield the file's record batches one chunk at a time; `column_types` applies to CSV input"""
+    if path.endswith(".parquet"):
+        yield from pq.ParquetFile(path).iter_batches(batch_size=PARQUET_BATCH_ROWS)
+    else:
+        yield from _csv_batches(path, column_types or {})
+
+
+class BatchWriter:
+    """Appends record batches to a CSV or Parquet file, opened on the first batch once the schema is known"""
+
+    def __init__(self, path):
+        self.path = path
+        self._writer = None
+
+    def write(self, batch):
+        if self._writer is None:
+            if self.path.endswith(".parquet"):
+                self._writer = pq.ParquetWriter(self.path, batch.schema)
+            else:
+                self._writer = pa_csv.CSVWriter(self.path, batch.schema)
+        self._writer.write_batch(batch)
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def _per_code(batch, column, fixed, resolve, blank):
+    """Resolve each distinct currency code in a chunk once and spread the results over its rows.
+
+    Codes are upper-cased and trimmed, and blank cells get `blank`. With a
+    fixed code instead of a column, a length-one array is returned that
+    broadcasts against the chunk.
+    """
+    if column is None:
+        return np.array([resolve(fixed.strip().upper())])
+    values = batch.column(column)
+    if pa.types.is_dictionary(values.type):
+        values = values.cast(pa.string())
+    encoded = pc.dictionary_encode(pc.utf8_upper(pc.utf8_trim_whitespace(values)))
+    resolved = [resolve(code) for code in encoded.dictionary.to_pylist()] + [blank]
+    # Blank cells point one past the dictionary, at the blank value
+    indices = pc.fill_null(encoded.indices, len(resolved) - 1).to_numpy(zero_copy_only=False)
+    return np.array(resolved)[indices]
+
+
+def _days(batch, column):
+    """A chunk's date column as datetime64[D], NaT where blank"""
+    days = batch.column(column)
+    if pa.types.is_string(days.type):
+        days = pc.utf8_trim_whitespace(days)
+        days = pc.if_else(pc.equal(days, ""), pa.scalar(None, pa.string()), days)
+    try:
+        days = pc.cast(days, pa.date32())
+    except pa.ArrowInvalid:
+        raise InvalidDateError(f"Invalid date in column {column}, expected YYYY-MM-DD") from None
+    return days.to_numpy(zero_copy_only=False)
+
+
+def convert_batch(batch, args, table):
+    """Return the chunk with the converted-amount column appended, and how many of its rows converted"""
+    amounts = pc.cast(batch.column(args.amount), pa.float64()).to_numpy(zero_copy_only=False)
+    valid = ~np.isnan(amounts)
+    if args.date_column:
+        days = _days(batch, args.date_column)
+        valid &= ~np.isnat(days)
+        # Fetching the chunk's days first also loads the store's currency list
+        history_store.ensure(history_store.rows(days[valid]))
+        known = lambda code: code if code in history_store.index else ""
+        from_codes = _per_code(batch, args.from_column, args.from_currency, known, "")
+        to_codes = _per_code(batch, args.to_column, args.to_currency, known, "")
+        valid &= (from_codes != "") & (to_codes != "")
+        results = np.full(len(amounts), np.nan)
+        if valid.any():
+            pick = lambda codes: codes if len(codes) == 1 else codes[valid]
+            results[valid] = history_store.convert_many(
+                amounts[valid], days[valid], pick(from_codes), pick(to_codes), strict=False
+            )
+        # A known code may still be missing from some day's quotes
+        valid &= ~np.isnan(results)
+    else:
+        rate = lambda code: table.rates[table.index[code]] if code in table.index else np.nan
+        from_rates = _per_code(batch, args.from_column, args.from_currency, rate, np.nan)
+        to_rates = _per_code(batch, args.to_column, args.to_currency, rate, np.nan)
+        results = amounts * (to_rates / from_rates)
+        valid &= ~np.isnan(results)
+
+    column = pa.array(results, mask=~valid)
+    return batch.append_column(args.output_column, column), int(valid.sum())
+
+
+def convert_file(args):
+    """Stream args.input into args.output; return (rows, converted rows, the rate table used or None)"""
+    # One snapshot for the whole file keeps every row on the same rates
+    table = None if args.date_column else get_rate_table()
+    # Columns the conversion reads; codes and dates stay strings so a blank or odd cell can't retype them
+    column_types = {args.amount: pa.float64()}
+    for column in (args.from_column, args.to_column, args.date_column):
+        if column:
+            column_types[column] = pa.string()
+    rows = converted = 0
+    with BatchWriter(args.output) as writer:
+        for batch in read_batches(args.input, column_types):
+            batch, ok = convert_batch(batch, args, table)
+            writer.write(batch)
+            rows += batch.num_rows
+            converted += ok
+    return rows, converted, table
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("input")
+    parser.add_argument("output")
+    parser.add_argument("--amount", required=True, help="column holding the amounts")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--from", dest="from_currency", help="currency of every amount")
+    source.add_argument("--from-column", help="column holding each amount's currency")
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument("--to", dest="to_currency", help="currency to convert every amount to")
+    target.add_argument("--to-column", help="column holding each row's target currency")
+    parser.add_argument("--date-column", help="convert at each row's historical rate (YYYY-MM-DD) instead of today's")
+    parser.add_argument("--output-column", help="name of the added column (default converted_<TO> or converted_amount)")
+    args = parser.parse_args(argv)
+    if args.output_column is None:
+        args.output_column = f"converted_{args.to_currency.upper()}" if args.to_currency else "converted_amount"
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    start = time.perf_counter()
+    try:
+        rows, converted, table = convert_file(args)
+    except (ExchangeRateError, UpstreamError, InvalidDateError, UnsupportedCurrencyError, pa.ArrowInvalid, KeyError) as e:
+        sys.exit(f"Error: {e}")
+    elapsed = time.perf_counter() - start
+    rates = "historical rates" if table is None else (
+        f"rates fetched {datetime.datetime.fromtimestamp(table.fetched_at, datetime.timezone.utc):%Y-%m-%d %H:%M:%S} UTC"
+    )
+    print(
+        f"{rows:,} rows in {elapsed:.2f}s ({rows / max(elapsed, 1e-9):,.0f} rows/s), "
+        f"{rows - converted:,} left blank; {rates}",
+        file=sys.stderr,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+import contextvars
+import os
+from contextlib import contextmanager
+
+
+class Credentials:
+    """API keys belonging to one user session"""
+
+    __slots__ = ('openai_api_key', 'exchange_rate_api_key')
+
+    def __init__(self, openai_api_key=None, exchange_rate_api_key=None):
+        self.openai_api_key = openai_api_key
+        self.exchange_rate_api_key = exchange_rate_api_key
+
+    def __repr__(self):
+        # Never print the keys themselves
+        return f"Credentials(openai={bool(self.openai_api_key)}, exchange_rate={bool(self.exchange_rate_api_key)})"
+
+
+# Credentials of the session the current thread or task is serving. Worker
+# threads started through contextvars.copy_context() inherit them.
+_current = contextvars.ContextVar("credentials", default=None)
+
+
+@contextmanager
+def use_credentials(credentials):
+    """Make a session's Credentials the ones every LLM and tool call inside the block uses.
+
+    None means no session: keys then come from the process environment.
+    """
+    token = _current.set(credentials)
+    try:
+        yield credentials
+    finally:
+        _current.reset(token)
+
+
+def current_credentials():
+    """The active session's Credentials, or None outside any session"""
+    return _current.get()
+
+
+def resolve(name, env_var):
+    """Look up one key: the active session's value, else the process environment.
+
+    A session that doesn't have the key never falls back to the environment.
+    Otherwise one user could end up spending a key configured for the
+    deployment or for somebody else.
+    """
+    credentials = _current.get()
+    if credentials is not None:
+        return getattr(credentials, name)
+    return os.getenv(env_var)
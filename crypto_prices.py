@@ -0,0 +1,189 @@
+import functools
+import os
+import threading
+import time
+
+from cache import TTLCache
+from prefetch import prefetcher
+from quota import quotas
+from snapshots import snapshots
+from upstream import MicroBatcher, aget_json, get_json
+
+# Map common crypto symbols to CoinGecko IDs
+CRYPTO_IDS = {
+    'BTC': 'bitcoin',
+    'ETH': 'ethereum',
+    'LTC': 'litecoin',
+    'BCH': 'bitcoin-cash',
+    'ADA': 'cardano',
+    'DOT': 'polkadot',
+    'LINK': 'chainlink',
+    'XRP': 'ripple',
+    'USDT': 'tether',
+    'USDC': 'usd-coin',
+    'BNB': 'binancecoin',
+    'SOL': 'solana',
+    'MATIC': 'matic-network',
+    'AVAX': 'avalanche-2'
+}
+
+# Quote currencies fetched with every batch; others are added once CoinGecko has priced them
+DEFAULT_VS_CURRENCIES = ('usd', 'eur', 'gbp', 'inr', 'jpy', 'btc')
+
+# Upper bound on quote currencies fetched per batch, so odd requests can't grow the URL forever
+MAX_VS_CURRENCIES = 32
+
+COINGECKO_API_URL = os.getenv("COINGECKO_API_URL", "https://api.coingecko.com/api/v3").rstrip("/")
+SIMPLE_PRICE_URL = f"{COINGECKO_API_URL}/simple/price"
+
+# Milliseconds a price fetch waits for concurrent fetches of other quote currencies to join it
+CRYPTO_BATCH_WINDOW_MS = float(os.getenv("CRYPTO_BATCH_WINDOW_MS", "5"))
+
+
+class CryptoPriceService:
+    """Prices for every known coin against a set of quote currencies.
+
+    One /simple/price call fetches the whole coins x quote-currencies matrix,
+    which is cached for a short TTL and serves every lookup until it expires.
+    Fetches for different quote-currency sets that start within batch_window
+    seconds of each other are merged into a single call, and each gets its
+    slice of the result.
+    """
+
+    def __init__(self, ttl=60, vs_currencies=DEFAULT_VS_CURRENCIES, stale_ttl=0, batch_window=0.005):
+        self._cache = TTLCache(ttl=ttl, maxsize=4, name="crypto", stale_ttl=stale_ttl)
+        # Lone fetches of quote currencies CoinGecko didn't price, so asking again doesn't go upstream
+        self._unpriced = TTLCache(ttl=ttl, maxsize=64, name="crypto_unpriced")
+        self._vs_currencies = set(vs_currencies)
+        self._batcher = MicroBatcher(self._fetch_many, batch_window)
+        self._lock = threading.Lock()
+
+    def attach(self, persist):
+        """Back the price matrix with a persistent store, see TTLCache.attach"""
+        loaded = self._cache.attach(persist)
+        # Fetch the same batch as before the restart so the saved matrix keeps matching
+        with self._lock:
+            for key in loaded:
+                for vs_currency in key:
+                    if len(self._vs_currencies) < MAX_VS_CURRENCIES:
+                        self._vs_currencies.add(vs_currency)
+
+    def _batch_for(self, vs_currency):
+        """Return the quote currencies of the cached batch if it covers vs_currency, else None"""
+        with self._lock:
+            if vs_currency not in self._vs_currencies:
+                return None
+            return tuple(sorted(self._vs_currencies))
+
+    def _learn(self, vs_currency, matrix):
+        """Add vs_currency to every later batch if a lone fetch of it came back with prices.
+
+        Anything else, such as 'dollar', stays out: the batch is the cache key,
+        so a currency CoinGecko doesn't price would only force a miss. Its
+        empty result is cached on its own for the TTL instead.
+        """
+        if vs_currency.isalpha() and any(vs_currency in quotes for quotes in matrix[0].values()):
+            with self._lock:
+                if len(self._vs_currencies) < MAX_VS_CURRENCIES:
+                    self._vs_currencies.add(vs_currency)
+                    return
+        self._unpriced.set(vs_currency, matrix)
+
+    @staticmethod
+    def _url(crypto_ids, vs_currencies):
+        return f"{SIMPLE_PRICE_URL}?ids={','.join(crypto_ids)}&vs_currencies={','.join(vs_currencies)}"
+
+    def _fetch_many(self, vs_currencies):
+        # The public API has no key; every caller shares one quota
+        charge = functools.partial(quotas.acquire, "coingecko")
+        return get_json(self._url(CRYPTO_IDS.values(), sorted(vs_currencies)), charge=charge), time.time()
+
+    async def _afetch_many(self, vs_currencies):
+        charge = functools.partial(quotas.aacquire, "coingecko")
+        return await aget_json(self._url(CRYPTO_IDS.values(), sorted(vs_currencies)), charge=charge), time.time()
+
+    @staticmethod
+    def _slice(matrix, vs_currencies):
+        """Keep only the vs_currencies columns of a (prices, fetched_at) matrix"""
+        prices, fetched_at = matrix
+        wanted = set(vs_currencies)
+        return {
+            coin: {vs_currency: price for vs_currency, price in quotes.items() if vs_currency in wanted}
+            for coin, quotes in prices.items() if isinstance(quotes, dict)
+        }, fetched_at
+
+    def _fetch(self, vs_currencies):
+        return self._slice(self._batcher.submit(vs_currencies), vs_currencies)
+
+    async def _afetch(self, vs_currencies):
+        return self._slice(await self._batcher.asubmit(vs_currencies, self._afetch_many), vs_currencies)
+
+    def matrix(self, vs_currency):
+        """Get the cached (prices, fetched_at) matrix, fetching it in one batched call if needed"""
+        vs_currency = vs_currency.lower()
+        batch = self._batch_for(vs_currency)
+        if batch is None:
+            matrix = self._unpriced.get(vs_currency)
+            if matrix is None:
+                matrix = self._fetch([vs_currency])
+                self._learn(vs_currency, matrix)
+            return matrix
+        fetch = lambda: self._fetch(batch)
+        prefetcher.track("coingecko", self._cache, batch, fetch)
+        return self._cache.get_or_fetch(batch, fetch)
+
+    async def amatrix(self, vs_currency):
+        """Async variant of matrix"""
+        vs_currency = vs_currency.lower()
+        batch = self._batch_for(vs_currency)
+        if batch is None:
+            matrix = self._unpriced.get(vs_currency)
+            if matrix is None:
+                matrix = await self._afetch([vs_currency])
+                self._learn(vs_currency, matrix)
+            return matrix
+        prefetcher.track("coingecko", self._cache, batch, lambda: self._fetch(batch))
+        return await self._cache.aget_or_fetch(batch, lambda: self._afetch(batch))
+
+    def prices(self, vs_currency):
+        """Get the cached price matrix for a vs-currency"""
+        return self.matrix(vs_currency)[0]
+
+    async def aprices(self, vs_currency):
+        """Async variant of prices"""
+        return (await self.amatrix(vs_currency))[0]
+
+    def get_quote(self, crypto_id, vs_currency):
+        """Get (price, fetched_at) for a CoinGecko coin in a vs-currency; price is None if unavailable"""
+        prices, fetched_at = self.matrix(vs_currency)
+        return prices.get(crypto_id, {}).get(vs_currency.lower()), fetched_at
+
+    async def aget_quote(self, crypto_id, vs_currency):
+        """Async variant of get_quote"""
+        prices, fetched_at = await self.amatrix(vs_currency)
+        return prices.get(crypto_id, {}).get(vs_currency.lower()), fetched_at
+
+    def get_price(self, crypto_id, vs_currency):
+        """Get the price of a CoinGecko coin in a vs-currency, or None if unavailable"""
+        return self.get_quote(crypto_id, vs_currency)[0]
+
+    async def aget_price(self, crypto_id, vs_currency):
+        """Async variant of get_price"""
+        return (await self.aget_quote(crypto_id, vs_currency))[0]
+
+    def clear(self):
+        self._cache.clear()
+        self._unpriced.clear()
+
+    def stats(self):
+        return dict(self._cache.stats(), batching=self._batcher.stats(), unpriced=len(self._unpriced))
+
+
+# Process-wide price service shared by all crypto tools
+crypto_prices = CryptoPriceService(
+    ttl=float(os.getenv("CRYPTO_CACHE_TTL", "60")),
+    stale_ttl=float(os.getenv("CRYPTO_CACHE_STALE_TTL", "3600")),
+    batch_window=CRYPTO_BATCH_WINDOW_MS / 1000,
+)
+if snapshots is not None:
+    crypto_prices.attach(snapshots.namespace("crypto", encode=list, decode=tuple))
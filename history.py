@@ -0,0 +1,224 @@
+import datetime
+import json
+import os
+import threading
+
+import numpy as np
+
+from rate_table import UnsupportedCurrencyError
+
+# Row i of the store holds the rates of EPOCH + i days
+EPOCH = datetime.date(1990, 1, 1)
+
+# Column capacity of each row; a currency takes the next free column the first time it's seen
+MAX_CURRENCIES = 256
+
+# Rows added past today whenever the file has to grow
+GROWTH_DAYS = 366
+
+RATE_HISTORY_DIR = os.getenv(
+    "RATE_HISTORY_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "history")
+)
+
+
+class InvalidDateError(ValueError):
+    """Raised for malformed dates or dates outside the store's range"""
+
+
+def _today():
+    return datetime.datetime.now(datetime.timezone.utc).date()
+
+
+def parse_date(value):
+    """Parse an ISO date (YYYY-MM-DD) into a date, rejecting days the store can't hold.
+
+    Only closed days are accepted: today's rates (UTC) still move, and a stored
+    row is never fetched again.
+    """
+    if isinstance(value, datetime.datetime):
+        value = value.date()
+    if not isinstance(value, datetime.date):
+        try:
+            value = datetime.date.fromisoformat(str(value).strip())
+        except ValueError:
+            raise InvalidDateError(f"Invalid date {value!r}, expected YYYY-MM-DD") from None
+    if value < EPOCH or value >= _today():
+        raise InvalidDateError(
+            f"No rates for {value.isoformat()}: dates must be between {EPOCH.isoformat()} and yesterday (UTC); "
+            "use the latest rates for today"
+        )
+    return value
+
+
+class HistoricalRateStore:
+    """Daily rate tables persisted in a memory-mapped dates x currencies array.
+
+    rates.f64 is a flat file of float64 rows, one per day since EPOCH, each
+    holding MAX_CURRENCIES rates quoted against the base currency. Column 0 is
+    the base itself, so a non-zero value there marks a day as fetched; 0.0
+    anywhere else means the currency wasn't quoted that day. The file is grown
+    sparse and read through a memory map, so only the pages a lookup touches are
+    ever resident. meta.json records the base and the column of each code.
+
+    Missing days are fetched once through `fetch(day) -> {code: rate}` and
+    written back, so the store fills in incrementally as it's used.
+    """
+
+    def __init__(self, fetch, path=RATE_HISTORY_DIR, base="USD"):
+        self.path = path
+        self.base = base.upper()
+        self._fetch = fetch
+        self._lock = threading.Lock()
+        self._rates = None
+        self.codes = []
+        self.index = {}
+
+    @property
+    def _meta_path(self):
+        return os.path.join(self.path, "meta.json")
+
+    @property
+    def _data_path(self):
+        return os.path.join(self.path, "rates.f64")
+
+    def _open(self):
+        """Load the column index and map the rate file, creating both on first use"""
+        if self._rates is not None:
+            return self._rates
+        with self._lock:
+            if self._rates is None:
+                os.makedirs(self.path, exist_ok=True)
+                if os.path.exists(self._meta_path):
+                    with open(self._meta_path, encoding="utf-8") as f:
+                        meta = json.load(f)
+                    if meta["base"] != self.base:
+                        raise ValueError(f"History in {self.path} is quoted in {meta['base']}, not {self.base}")
+                    self.codes = meta["codes"]
+                else:
+                    self.codes = [self.base]
+                    self._write_meta()
+                self.index = {code: i for i, code in enumerate(self.codes)}
+                self._map(self._row(datetime.date.today()) + GROWTH_DAYS)
+        return self._rates
+
+    def _map(self, rows):
+        """(Re)map the rate file, growing it to at least `rows` rows; caller holds the lock"""
+        row_bytes = MAX_CURRENCIES * 8
+        size = os.path.getsize(self._data_path) if os.path.exists(self._data_path) else 0
+        if size < rows * row_bytes:
+            # Truncating upward leaves a sparse, zero-filled tail: unfetched days cost no disk
+            with open(self._data_path, "ab") as f:
+                f.truncate(rows * row_bytes)
+            size = rows * row_bytes
+        self._rates = np.memmap(self._data_path, dtype=np.float64, mode="r+", shape=(size // row_bytes, MAX_CURRENCIES))
+
+    def _write_meta(self):
+        tmp_path = self._meta_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"base": self.base, "epoch": EPOCH.isoformat(), "codes": self.codes}, f)
+        os.replace(tmp_path, self._meta_path)
+
+    @staticmethod
+    def _row(day):
+        return (day - EPOCH).days
+
+    def store_day(self, day, conversion_rates):
+        """Write one day's rates, quoted against the base currency, into the store"""
+        self._open()
+        row = self._row(day)
+        with self._lock:
+            new_codes = [code.upper() for code in conversion_rates if code.upper() not in self.index]
+            for code in new_codes:
+                if len(self.codes) >= MAX_CURRENCIES:
+                    break
+                self.index[code] = len(self.codes)
+                self.codes.append(code)
+            if new_codes:
+                # Record new columns before any row refers to them
+                self._write_meta()
+            if row >= len(self._rates):
+                self._map(row + GROWTH_DAYS)
+            values = np.zeros(MAX_CURRENCIES)
+            for code, rate in conversion_rates.items():
+                column = self.index.get(code.upper())
+                if column is not None:
+                    values[column] = float(rate)
+            values[0] = 1.0
+            self._rates[row] = values
+            self._rates.flush()
+
+    def rows(self, days):
+        """Turn an array of ISO date strings, dates or datetime64 values into row numbers, vectorized"""
+        try:
+            days = np.asarray(days, dtype="datetime64[D]")
+        except ValueError:
+            raise InvalidDateError("Invalid date in batch, expected YYYY-MM-DD") from None
+        rows = (days - np.datetime64(EPOCH, "D")).astype(np.intp).reshape(-1)
+        outside = (rows < 0) | (rows >= self._row(_today()))
+        if outside.any():
+            parse_date(days.reshape(-1)[int(np.argmax(outside))].item())
+        return rows
+
+    def ensure(self, rows):
+        """Fetch every day among `rows` that isn't in the store yet; return how many were fetched"""
+        rates = self._open()
+        rows = np.unique(np.asarray(rows, dtype=np.intp))
+        held = rows[rows < len(rates)]
+        missing = np.concatenate([held[rates[held, 0] == 0], rows[rows >= len(rates)]])
+        for row in missing:
+            day = EPOCH + datetime.timedelta(days=int(row))
+            self.store_day(day, self._fetch(day))
+        return len(missing)
+
+    def position(self, code):
+        """Return the column for a currency code"""
+        try:
+            return self.index[code.upper()]
+        except KeyError:
+            raise UnsupportedCurrencyError(code.upper()) from None
+
+    def positions(self, codes):
+        """Return columns for a sequence of currency codes"""
+        unique, inverse = np.unique(np.asarray(codes, dtype=str), return_inverse=True)
+        lookup = np.fromiter((self.position(code) for code in unique), dtype=np.intp, count=len(unique))
+        return lookup[inverse.reshape(-1)]
+
+    def rate(self, day, from_currency, to_currency):
+        """Return how many units of to_currency one unit of from_currency bought on `day`"""
+        day = parse_date(day)
+        self.ensure([self._row(day)])
+        row = self._rates[self._row(day)]
+        from_rate, to_rate = row[self.position(from_currency)], row[self.position(to_currency)]
+        if from_rate == 0 or to_rate == 0:
+            missing = from_currency if from_rate == 0 else to_currency
+            raise UnsupportedCurrencyError(f"{missing.upper()} on {day.isoformat()}")
+        return float(to_rate / from_rate)
+
+    def convert_many(self, amounts, days, from_currencies, to_currencies, strict=True):
+        """Convert arrays of amounts on arrays of dates in one vectorized pass.
+
+        Date and code arrays of length one are broadcast against the amounts.
+        A currency that wasn't quoted on a row's day raises
+        UnsupportedCurrencyError, or with strict=False gives NaN for that row.
+        """
+        rows = self.rows(days)
+        self.ensure(rows)
+        from_columns, to_columns = self.positions(from_currencies), self.positions(to_currencies)
+        from_rates, to_rates = np.broadcast_arrays(self._rates[rows, from_columns], self._rates[rows, to_columns])
+        unquoted = (from_rates == 0) | (to_rates == 0)
+        if not strict:
+            with np.errstate(divide="ignore", invalid="ignore"):
+                results = np.asarray(amounts, dtype=np.float64) * (to_rates / from_rates)
+            return np.where(unquoted, np.nan, results)
+        if unquoted.any():
+            # Inputs are either length one or full length, so i % len picks the matching entry
+            i = int(np.argmax(unquoted))
+            codes = from_currencies if from_rates[i] == 0 else to_currencies
+            day = EPOCH + datetime.timedelta(days=int(rows[i % len(rows)]))
+            raise UnsupportedCurrencyError(f"{codes[i % len(codes)].upper()} on {day.isoformat()}")
+        return np.asarray(amounts, dtype=np.float64) * (to_rates / from_rates)
+
+    def __len__(self):
+        """Number of days held in the store"""
+        rates = self._open()
+        return int(np.count_nonzero(rates[:, 0]))
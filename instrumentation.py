@@ -0,0 +1,248 @@
+import contextvars
+import itertools
+import json
+import os
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+_current_span = contextvars.ContextVar("current_span", default=None)
+_ids = itertools.count(1)
+
+# Callables returning [(metric, type, labels, value)] samples rendered on every Prometheus scrape
+_collectors = []
+
+
+def register_collector(collect):
+    """Add a source of point-in-time metrics, such as gauges, to the Prometheus exporter"""
+    _collectors.append(collect)
+
+
+class Span:
+    """One timed operation within a chat turn"""
+
+    __slots__ = ('name', 'kind', 'trace_id', 'span_id', 'parent_id', 'start', 'duration', 'attributes', '_t0')
+
+    def __init__(self, name, kind, parent, attributes):
+        self.name = name
+        self.kind = kind
+        self.span_id = next(_ids)
+        self.parent_id = parent.span_id if parent else None
+        self.trace_id = parent.trace_id if parent else self.span_id
+        self.start = time.time()
+        self.duration = None
+        self.attributes = dict(attributes)
+        self._t0 = time.perf_counter()
+
+    def to_dict(self):
+        return {
+            'name': self.name,
+            'kind': self.kind,
+            'trace_id': self.trace_id,
+            'span_id': self.span_id,
+            'parent_id': self.parent_id,
+            'start': self.start,
+            'duration': self.duration,
+            'attributes': self.attributes,
+        }
+
+
+class InMemoryExporter:
+    """Keeps the spans of the most recent traces for inspection"""
+
+    def __init__(self, max_traces=50):
+        self.max_traces = max_traces
+        self._traces = OrderedDict()
+        # Most recent finished trace per root span kind, so background work can't hide the last turn
+        self._last_roots = {}
+        self._lock = threading.Lock()
+
+    def export(self, span):
+        with self._lock:
+            self._traces.setdefault(span.trace_id, []).append(span)
+            self._traces.move_to_end(span.trace_id)
+            while len(self._traces) > self.max_traces:
+                self._traces.popitem(last=False)
+            if span.parent_id is None:
+                self._last_roots[span.kind] = self._last_roots[None] = span.trace_id
+
+    def trace(self, trace_id):
+        """Return the spans of one trace in start order, or [] once it has been evicted"""
+        with self._lock:
+            spans = list(self._traces.get(trace_id, []))
+        return sorted(spans, key=lambda span: span.start)
+
+    def last_trace(self, kind=None):
+        """Return the spans of the most recently finished trace, optionally only one rooted at a span of kind"""
+        with self._lock:
+            spans = list(self._traces.get(self._last_roots.get(kind), []))
+        return sorted(spans, key=lambda span: span.start)
+
+
+class JsonLinesExporter:
+    """Appends every finished span to a JSON lines file"""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def export(self, span):
+        line = json.dumps(span.to_dict(), default=str)
+        with self._lock, open(self.path, "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+
+
+class PrometheusExporter:
+    """Aggregates spans into Prometheus metrics served as text from /metrics"""
+
+    BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms = defaultdict(lambda: [0] * (len(self.BUCKETS) + 1) + [0.0])
+        self._counters = defaultdict(float)
+
+    def export(self, span):
+        with self._lock:
+            histogram = self._histograms[(span.kind, span.name)]
+            for i, bound in enumerate(self.BUCKETS):
+                if span.duration <= bound:
+                    histogram[i] += 1
+            histogram[len(self.BUCKETS)] += 1
+            histogram[-1] += span.duration
+            for key, value in span.attributes.items():
+                if key.startswith('cache.'):
+                    self._counters[('converter_cache_lookups_total', (('cache', key[6:]), ('result', value)))] += 1
+                elif key in ('input_tokens', 'output_tokens'):
+                    self._counters[('converter_llm_tokens_total', (('type', key[:-7]),))] += value
+            if span.kind == 'upstream':
+                labels = (('host', span.attributes.get('host', '')), ('status', str(span.attributes.get('status', 'error'))))
+                self._counters[('converter_upstream_requests_total', labels)] += 1
+
+    @staticmethod
+    def _labels(pairs):
+        return ",".join(f'{name}="{value}"' for name, value in pairs)
+
+    def render(self):
+        """Render all metrics in the Prometheus text exposition format"""
+        lines = [
+            "# HELP converter_span_duration_seconds Duration of instrumented operations",
+            "# TYPE converter_span_duration_seconds histogram",
+        ]
+        with self._lock:
+            for (kind, name), histogram in sorted(self._histograms.items()):
+                labels = self._labels((('kind', kind), ('name', name)))
+                for bound, count in zip(self.BUCKETS, histogram):
+                    lines.append(f'converter_span_duration_seconds_bucket{{{labels},le="{bound}"}} {count}')
+                count = histogram[len(self.BUCKETS)]
+                lines.append(f'converter_span_duration_seconds_bucket{{{labels},le="+Inf"}} {count}')
+                lines.append(f'converter_span_duration_seconds_count{{{labels}}} {count}')
+                lines.append(f'converter_span_duration_seconds_sum{{{labels}}} {histogram[-1]}')
+            seen = set()
+            for (metric, labels), value in sorted(self._counters.items()):
+                if metric not in seen:
+                    seen.add(metric)
+                    lines.append(f"# TYPE {metric} counter")
+                lines.append(f"{metric}{{{self._labels(labels)}}} {value:g}")
+        for collect in _collectors:
+            for metric, kind, labels, value in collect():
+                if metric not in seen:
+                    seen.add(metric)
+                    lines.append(f"# TYPE {metric} {kind}")
+                lines.append(f"{metric}{{{self._labels(labels)}}} {value:g}")
+        return "\n".join(lines) + "\n"
+
+    def serve(self, port, host="0.0.0.0"):
+        """Serve /metrics from a background thread and return the server"""
+        exporter = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                body = exporter.render().encode()
+                self.send_response(200 if self.path.startswith("/metrics") else 404)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        server = ThreadingHTTPServer((host, port), Handler)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server
+
+
+class Tracer:
+    """Records nested spans and hands each finished span to every exporter"""
+
+    def __init__(self, exporters=()):
+        self.exporters = list(exporters)
+
+    @contextmanager
+    def span(self, name, kind="internal", **attributes):
+        span = Span(name, kind, _current_span.get(), attributes)
+        token = _current_span.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            # Only the type: messages can embed URLs, and exchangerate-api URLs carry the API key
+            span.attributes['error'] = type(e).__name__
+            raise
+        finally:
+            span.duration = time.perf_counter() - span._t0
+            _current_span.reset(token)
+            for exporter in self.exporters:
+                exporter.export(span)
+
+    def annotate(self, **attributes):
+        """Add attributes to the innermost active span, if any"""
+        span = _current_span.get()
+        if span is not None:
+            span.attributes.update(attributes)
+
+
+def format_waterfall(spans, width=40):
+    """Render a trace as an indented text waterfall, one span per line"""
+    if not spans:
+        return ""
+    origin = min(span.start for span in spans)
+    total = max(span.start + span.duration - origin for span in spans) or 1e-9
+    depth = {}
+    lines = []
+    for span in spans:
+        depth[span.span_id] = depth.get(span.parent_id, -1) + 1
+        offset = int(width * (span.start - origin) / total)
+        length = max(1, int(width * span.duration / total))
+        bar = " " * offset + "█" * min(length, width - offset)
+        label = "  " * depth[span.span_id] + span.name
+        details = " ".join(
+            f"{key}={value}" for key, value in span.attributes.items() if key not in ('prompt',)
+        )
+        lines.append(f"{label:<32.32} {bar:<{width}} {span.duration * 1e3:8.1f} ms  {details}".rstrip())
+    return "\n".join(lines)
+
+
+def _exporters_from_env():
+    """Build exporters from TRACE_EXPORTERS, e.g. "jsonl:/tmp/spans.jsonl,prometheus:9464" """
+    exporters = []
+    for entry in filter(None, (item.strip() for item in os.getenv("TRACE_EXPORTERS", "").split(","))):
+        kind, _, option = entry.partition(":")
+        if kind == "jsonl":
+            exporters.append(JsonLinesExporter(option or "spans.jsonl"))
+        elif kind == "prometheus":
+            exporter = PrometheusExporter()
+            if option:
+                exporter.serve(int(option))
+            exporters.append(exporter)
+        elif kind != "memory":
+            raise ValueError(f"Unknown trace exporter: {kind}")
+    return exporters
+
+
+# The in-memory exporter is always on so the debug panel can show the last turn
+memory_exporter = InMemoryExporter()
+tracer = Tracer([memory_exporter, *_exporters_from_env()])
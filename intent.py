@@ -0,0 +1,221 @@
+import re
+
+from crypto_prices import CRYPTO_IDS
+
+# ISO 4217 codes quoted by exchangerate-api
+FIAT_CODES = frozenset("""
+AED AFN ALL AMD ANG AOA ARS AUD AWG AZN BAM BBD BDT BGN BHD BIF BMD BND BOB BRL
+BSD BTN BWP BYN BZD CAD CDF CHF CLP CNY COP CRC CUP CVE CZK DJF DKK DOP DZD EGP
+ERN ETB EUR FJD FKP FOK GBP GEL GGP GHS GIP GMD GNF GTQ GYD HKD HNL HRK HTG HUF
+IDR ILS IMP INR IQD IRR ISK JEP JMD JOD JPY KES KGS KHR KID KMF KRW KWD KYD KZT
+LAK LBP LKR LRD LSL LYD MAD MDL MGA MKD MMK MNT MOP MRU MUR MVR MWK MXN MYR MZN
+NAD NGN NIO NOK NPR NZD OMR PAB PEN PGK PHP PKR PLN PYG QAR RON RSD RUB RWF SAR
+SBD SCR SDG SEK SGD SHP SLE SLL SOS SRD SSP STN SYP SZL THB TJS TMT TND TOP TRY
+TTD TVD TWD TZS UAH UGX USD UYU UZS VES VND VUV WST XAF XCD XDR XOF XPF YER ZAR
+ZMW ZWL
+""".split())
+
+# Codes that are also everyday English words only count when written in upper case
+AMBIGUOUS_CODES = frozenset({
+    'ALL', 'BAM', 'BOB', 'CUP', 'DOT', 'ERN', 'GEL', 'KID', 'LINK', 'MAD', 'MOP', 'PEN', 'SOL', 'SOS', 'TOP', 'TRY',
+})
+
+CURRENCY_NAMES = {
+    'us dollar': 'USD', 'us dollars': 'USD', 'dollar': 'USD', 'dollars': 'USD', 'bucks': 'USD',
+    'euro': 'EUR', 'euros': 'EUR',
+    'british pound': 'GBP', 'british pounds': 'GBP', 'pound': 'GBP', 'pounds': 'GBP', 'sterling': 'GBP',
+    'japanese yen': 'JPY', 'yen': 'JPY',
+    'indian rupee': 'INR', 'indian rupees': 'INR', 'rupee': 'INR', 'rupees': 'INR',
+    'canadian dollar': 'CAD', 'canadian dollars': 'CAD',
+    'australian dollar': 'AUD', 'australian dollars': 'AUD',
+    'new zealand dollar': 'NZD', 'new zealand dollars': 'NZD',
+    'singapore dollar': 'SGD', 'singapore dollars': 'SGD',
+    'hong kong dollar': 'HKD', 'hong kong dollars': 'HKD',
+    'swiss franc': 'CHF', 'swiss francs': 'CHF',
+    'chinese yuan': 'CNY', 'yuan': 'CNY', 'renminbi': 'CNY',
+    'mexican peso': 'MXN', 'mexican pesos': 'MXN',
+    'brazilian real': 'BRL', 'brazilian reais': 'BRL',
+    'south african rand': 'ZAR', 'rand': 'ZAR',
+    'russian ruble': 'RUB', 'russian rubles': 'RUB', 'ruble': 'RUB', 'rubles': 'RUB', 'rouble': 'RUB', 'roubles': 'RUB',
+    'turkish lira': 'TRY', 'lira': 'TRY',
+    'korean won': 'KRW', 'south korean won': 'KRW',
+    'swedish krona': 'SEK', 'swedish kronor': 'SEK',
+    'norwegian krone': 'NOK', 'norwegian kroner': 'NOK',
+    'danish krone': 'DKK', 'danish kroner': 'DKK',
+    'polish zloty': 'PLN', 'zloty': 'PLN',
+    'thai baht': 'THB', 'baht': 'THB',
+    'malaysian ringgit': 'MYR', 'ringgit': 'MYR',
+    'uae dirham': 'AED', 'dirham': 'AED', 'dirhams': 'AED',
+    'saudi riyal': 'SAR', 'riyal': 'SAR',
+    'israeli shekel': 'ILS', 'shekel': 'ILS', 'shekels': 'ILS',
+    'nigerian naira': 'NGN', 'naira': 'NGN',
+    'hungarian forint': 'HUF', 'forint': 'HUF',
+    'czech koruna': 'CZK',
+    'philippine peso': 'PHP', 'philippine pesos': 'PHP',
+    'indonesian rupiah': 'IDR', 'rupiah': 'IDR',
+    'pakistani rupee': 'PKR', 'pakistani rupees': 'PKR',
+    'bitcoin': 'BTC', 'bitcoins': 'BTC',
+    'ethereum': 'ETH', 'ether': 'ETH',
+    'litecoin': 'LTC',
+    'bitcoin cash': 'BCH',
+    'cardano': 'ADA',
+    'polkadot': 'DOT',
+    'chainlink': 'LINK',
+    'ripple': 'XRP',
+    'tether': 'USDT',
+    'usd coin': 'USDC',
+    'binance coin': 'BNB',
+    'solana': 'SOL',
+    'polygon': 'MATIC',
+    'avalanche': 'AVAX',
+}
+
+CURRENCY_SYMBOLS = {'$': 'USD', '€': 'EUR', '£': 'GBP', '¥': 'JPY', '₹': 'INR'}
+
+_names = '|'.join(re.escape(name) for name in sorted(CURRENCY_NAMES, key=len, reverse=True))
+_symbols = ''.join(re.escape(symbol) for symbol in CURRENCY_SYMBOLS)
+_TOKEN_RE = re.compile(
+    rf"(?P<name>\b(?:{_names})\b)"
+    rf"|(?P<symbol>[{_symbols}])"
+    r"|(?P<amount>(?<![\w.])(?:\d{1,3}(?:,\d{3})+|\d+)(?:\.\d+)?(?![\w.]))"
+    r"|(?P<number>\d+)"
+    r"|(?P<connector>->|→|/|\b(?:to|in|into|vs|per)\b)"
+    r"|(?P<word>\b[A-Za-z]{3,5}\b)",
+    re.IGNORECASE,
+)
+
+
+def _currency_code(word):
+    """Return the currency code a bare word refers to, or None"""
+    code = word.upper()
+    if code in AMBIGUOUS_CODES and word != code:
+        return None
+    if code in FIAT_CODES or code in CRYPTO_IDS:
+        return code
+    return None
+
+
+def _scan(prompt):
+    """Split a prompt into amounts, currency codes and connectors, in order"""
+    tokens = []
+    for match in _TOKEN_RE.finditer(prompt):
+        kind = match.lastgroup
+        text = match.group()
+        if kind == 'name':
+            tokens.append(('currency', CURRENCY_NAMES[text.lower()]))
+        elif kind == 'symbol':
+            tokens.append(('currency', CURRENCY_SYMBOLS[text]))
+        elif kind == 'amount':
+            tokens.append(('amount', float(text.replace(',', ''))))
+        elif kind == 'number':
+            # Digits glued to other characters (dates, ids, ...) make the prompt ambiguous
+            tokens.append(('number', text))
+        elif kind == 'connector':
+            tokens.append(('connector', text.lower()))
+        else:
+            code = _currency_code(text)
+            if code:
+                tokens.append(('currency', code))
+    return tokens
+
+
+_MONTHS = (
+    r"(?:jan(?:uary)?|feb(?:ruary)?|mar(?:ch)?|apr(?:il)?|may|june?|july?|aug(?:ust)?"
+    r"|sep(?:t(?:ember)?)?|oct(?:ober)?|nov(?:ember)?|dec(?:ember)?)\.?"
+)
+
+# Explicit dates or wording that points at a past rate
+_HISTORY_RE = re.compile(
+    r"\b\d{4}-\d{1,2}-\d{1,2}\b"
+    r"|\b\d{1,4}/\d{1,2}/\d{1,4}\b"
+    rf"|\b{_MONTHS}\s+\d{{1,2}}(?:st|nd|rd|th)?\b"
+    rf"|\b\d{{1,2}}(?:st|nd|rd|th)?\s+(?:of\s+)?{_MONTHS}(?!\w)"
+    rf"|\b{_MONTHS},?\s+(?:19|20)\d{{2}}\b"
+    r"|\b(?:was|were|yesterday|ago|last (?:week|month|year)|historical|back in|as of)\b",
+    re.IGNORECASE,
+)
+
+# A year on its own ("in 2019"); told apart from an amount by what follows it
+_YEAR_RE = re.compile(r"\b(?:in|during|since|of|year)\s+(?:19|20)\d{2}\b", re.IGNORECASE)
+
+
+def _is_historical(prompt):
+    """Whether a prompt asks about a past date rather than today's rate"""
+    if _HISTORY_RE.search(prompt):
+        return True
+    for match in _YEAR_RE.finditer(prompt):
+        # "in 2000 yen" is an amount, "in 2019" or "in 2019?" a year
+        following = _scan(prompt[match.end():match.end() + 24])
+        if not following or following[0][0] != 'currency':
+            return True
+    return False
+
+
+# "How many yen per dollar?" names the target first
+_HOW_MANY_RE = re.compile(r"\bhow\s+(?:many|much)\b", re.IGNORECASE)
+
+
+def parse_conversion(prompt):
+    """Parse a simple conversion or rate query into a tool call.
+
+    Returns a dict with the tool name and args, or None when the prompt is not
+    a single unambiguous "X to Y" / "X in Y" request and should go to the LLM.
+    """
+    # Past-date questions need convert_on_date, not today's rate
+    if _is_historical(prompt):
+        return None
+    tokens = _scan(prompt)
+    if any(kind == 'number' for kind, _ in tokens):
+        return None
+
+    currencies = [(i, value) for i, (kind, value) in enumerate(tokens) if kind == 'currency']
+    amounts = [(i, value) for i, (kind, value) in enumerate(tokens) if kind == 'amount']
+    if len(currencies) != 2 or len(amounts) > 1:
+        return None
+
+    (source_pos, source), (target_pos, target) = currencies
+    if source == target:
+        return None
+    if not any(tokens[i][0] == 'connector' for i in range(source_pos + 1, target_pos)):
+        return None
+    if amounts and amounts[0][0] > target_pos:
+        return None
+    asked = _HOW_MANY_RE.search(prompt)
+    if asked and not _scan(prompt[:asked.start()]) and (not amounts or amounts[0][0] > source_pos):
+        # "How many dollars in a pound" / "how many yen in 100 dollars": the second currency is the source
+        source, target = target, source
+
+    amount = amounts[0][1] if amounts else None
+    source_is_crypto = source in CRYPTO_IDS
+    target_is_crypto = target in CRYPTO_IDS
+
+    if not source_is_crypto and not target_is_crypto:
+        if amount is None:
+            return {'name': 'get_conversion_factor', 'args': {'from_currency': source, 'to_currency': target}}
+        return {'name': 'convert', 'args': {'amount': amount, 'from_currency': source, 'to_currency': target}}
+    if source_is_crypto and not target_is_crypto and amount is None:
+        return {'name': 'get_crypto_rate', 'args': {'base_currency': source, 'target_currency': target}}
+    if target == 'BTC' and not source_is_crypto and amount is not None:
+        return {'name': 'convert_fiat_to_btc', 'args': {'amount': amount, 'fiat_currency': source, 'base_currency': 'BTC'}}
+    # Any other pair involving a coin (INR -> ETH, SOL -> ADA) is one call on the conversion graph
+    return {'name': 'convert_any', 'args': {'amount': 1.0 if amount is None else amount, 'from_currency': source, 'to_currency': target}}
+
+
+_CRYPTO_WORD_RE = re.compile(r"\b(?:crypto\w*|coins?|tokens?)\b", re.IGNORECASE)
+
+
+def tool_families(prompt):
+    """Classify which tool families a prompt needs, as a subset of {'fiat', 'crypto', 'history'}.
+
+    Returns None when no currency can be recognized, so the caller keeps every
+    tool rather than guess.
+    """
+    codes = {value for kind, value in _scan(prompt) if kind == 'currency'}
+    families = set()
+    if any(code in CRYPTO_IDS for code in codes) or _CRYPTO_WORD_RE.search(prompt):
+        families.add('crypto')
+    if any(code not in CRYPTO_IDS for code in codes):
+        families.add('fiat')
+    if _is_historical(prompt):
+        families.update(('history', 'fiat'))
+    return families or None
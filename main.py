@@ -1,155 +1,440 @@
+import asyncio
+import functools
 import os
-from langchain_openai import ChatOpenAI
 from langchain_core.messages import HumanMessage, ToolMessage
 from langchain_core.tools import tool
-import requests
 import json
+from cache import TTLCache, rate_cache
+from credentials import resolve
+from upstream import get_json, aget_json
+from rate_table import RateTable, UnsupportedCurrencyError
+from crypto_prices import CRYPTO_IDS, crypto_prices
+from prefetch import prefetcher
+from snapshots import snapshots
+from tool_results import RateQuote, CryptoQuote, Conversion, BtcConversion, HistoricalConversion, BatchConversion, PathConversion
+from history import HistoricalRateStore, parse_date
+from conversion_graph import ConversionGraph
+from quota import quotas
 
-def get_openai_client():
-    """Get OpenAI client using user-provided API key from environment"""
-    api_key = os.getenv("OPENAI_API_KEY")
+OPENAI_MODEL = os.getenv("OPENAI_MODEL", "gpt-4")
+
+# Maximum number of tool-bound LLM clients kept alive, one per distinct API key
+LLM_CLIENT_CACHE_SIZE = int(os.getenv("LLM_CLIENT_CACHE_SIZE", "32"))
+
+def get_openai_api_key():
+    """Get the OpenAI API key of the current session, or OPENAI_API_KEY outside one"""
+    api_key = resolve("openai_api_key", "OPENAI_API_KEY")
     if not api_key:
         raise ValueError("OpenAI API key not provided by user")
-    return ChatOpenAI(api_key=api_key, model="gpt-4")
+    return api_key
+
+def get_openai_client():
+    """Get OpenAI client using the current session's API key"""
+    # langchain_openai takes over a second to import, so it's only loaded once a client is first needed
+    from langchain_openai import ChatOpenAI
+    # stream_usage reports token counts on streamed responses too
+    return ChatOpenAI(api_key=get_openai_api_key(), model=OPENAI_MODEL, stream_usage=True)
 
 def get_exchange_api_key():
-    """Get Exchange Rate API key provided by user"""
-    api_key = os.getenv("EXCHANGE_RATE_API_KEY")
+    """Get the Exchange Rate API key of the current session, or EXCHANGE_RATE_API_KEY outside one"""
+    api_key = resolve("exchange_rate_api_key", "EXCHANGE_RATE_API_KEY")
     if not api_key:
         raise ValueError("Exchange Rate API key not provided by user")
     return api_key
 
+class ExchangeRateError(Exception):
+    """Raised when exchangerate-api returns a non-success result"""
+
+EXCHANGE_RATE_API_URL = os.getenv("EXCHANGE_RATE_API_URL", "https://v6.exchangerate-api.com/v6").rstrip("/")
+
+# Base currency of the shared rate snapshot; every cross rate is triangulated through it
+RATE_TABLE_BASE = os.getenv("RATE_TABLE_BASE", "USD").upper()
+
+def _exchange_json(path):
+    """GET an exchangerate-api endpoint with the current session's key, counting every request sent against that key's quota"""
+    api_key = get_exchange_api_key()
+    charge = functools.partial(quotas.acquire, "exchangerate", api_key)
+    return _checked(get_json(f"{EXCHANGE_RATE_API_URL}/{api_key}/{path}", charge=charge), api_key)
+
+async def _aexchange_json(path):
+    """Async variant of _exchange_json"""
+    api_key = get_exchange_api_key()
+    charge = functools.partial(quotas.aacquire, "exchangerate", api_key)
+    return _checked(await aget_json(f"{EXCHANGE_RATE_API_URL}/{api_key}/{path}", charge=charge), api_key)
+
+def _checked(data, api_key):
+    if data.get("result") != "success":
+        if data.get("error-type") == "quota-reached":
+            # The provider's count is the one that matters; stop asking until the month turns
+            quotas.exhaust("exchangerate", api_key)
+        raise ExchangeRateError(data.get('error-type', 'Unknown error'))
+    return data
+
+def _fetch_rate_table(base):
+    return RateTable.from_latest(_exchange_json(f"latest/{base}"))
+
+def get_rate_table(base=None):
+    """Get the full rate table for a base currency, served from the shared rate cache"""
+    base = (base or RATE_TABLE_BASE).upper()
+    fetch = lambda: _fetch_rate_table(base)
+    # Let the prefetcher refresh this table before it expires if it stays in demand
+    prefetcher.track("exchangerate", rate_cache, ("latest", base), fetch)
+    return rate_cache.get_or_fetch(("latest", base), fetch)
+
+async def aget_rate_table(base=None):
+    """Async variant of get_rate_table"""
+    base = (base or RATE_TABLE_BASE).upper()
+
+    async def fetch():
+        return RateTable.from_latest(await _aexchange_json(f"latest/{base}"))
+
+    prefetcher.track("exchangerate", rate_cache, ("latest", base), lambda: _fetch_rate_table(base))
+    return await rate_cache.aget_or_fetch(("latest", base), fetch)
+
+# Reload the last good rate tables so a restarted worker can answer before its first fetch
+if snapshots is not None:
+    rate_cache.attach(snapshots.namespace("rates", encode=RateTable.to_dict, decode=RateTable.from_dict))
+
+def _cross_rate(table, from_currency, to_currency):
+    try:
+        return table.cross_rate(from_currency, to_currency)
+    except UnsupportedCurrencyError:
+        raise ExchangeRateError("unsupported-code") from None
+
+def fetch_pair_rate(from_currency, to_currency):
+    """Get the conversion rate for a currency pair from the shared rate snapshot"""
+    return _cross_rate(get_rate_table(), from_currency, to_currency)
+
+async def afetch_pair_rate(from_currency, to_currency):
+    """Async variant of fetch_pair_rate"""
+    return _cross_rate(await aget_rate_table(), from_currency, to_currency)
+
+def _pair_quote(table, from_currency, to_currency):
+    return RateQuote(from_currency, to_currency, _cross_rate(table, from_currency, to_currency), table.fetched_at)
+
+def fetch_pair_quote(from_currency, to_currency):
+    """Get a RateQuote for a currency pair, stamped with the snapshot's fetch time"""
+    return _pair_quote(get_rate_table(), from_currency, to_currency)
+
+async def afetch_pair_quote(from_currency, to_currency):
+    """Async variant of fetch_pair_quote"""
+    return _pair_quote(await aget_rate_table(), from_currency, to_currency)
+
+def fetch_crypto_price(crypto_id, vs_currency):
+    """Get the price of a CoinGecko coin in a vs-currency, or None if unavailable"""
+    return crypto_prices.get_price(crypto_id, vs_currency)
+
+async def afetch_crypto_price(crypto_id, vs_currency):
+    """Async variant of fetch_crypto_price"""
+    return await crypto_prices.aget_price(crypto_id, vs_currency)
+
 @tool
-def get_conversion_factor(from_currency: str, to_currency: str) -> str:
+def get_conversion_factor(from_currency: str, to_currency: str) -> RateQuote | str:
     """Get the conversion factor between two currencies."""
     try:
-        api_key = get_exchange_api_key()
-        url = f"https://v6.exchangerate-api.com/v6/{api_key}/pair/{from_currency.upper()}/{to_currency.upper()}"
-        response = requests.get(url, timeout=10)
-        data = response.json()
-        
-        if data.get("result") == "success":
-            rate = data.get("conversion_rate")
-            return f"1 {from_currency.upper()} = {rate} {to_currency.upper()}"
-        else:
-            return f"Error: {data.get('error-type', 'Unknown error')}"
+        return fetch_pair_quote(from_currency, to_currency)
+    except ExchangeRateError as e:
+        return f"Error: {e}"
     except Exception as e:
         return f"Error fetching conversion rate: {str(e)}"
 
+async def aget_conversion_factor(from_currency: str, to_currency: str) -> RateQuote | str:
+    try:
+        return await afetch_pair_quote(from_currency, to_currency)
+    except ExchangeRateError as e:
+        return f"Error: {e}"
+    except Exception as e:
+        return f"Error fetching conversion rate: {str(e)}"
+
+def _conversion(amount, quote):
+    return Conversion(amount, quote.from_currency, quote.to_currency, quote.rate, quote.timestamp)
+
 @tool
-def convert(amount: float, from_currency: str, to_currency: str) -> str:
+def convert(amount: float, from_currency: str, to_currency: str) -> Conversion | str:
     """Convert an amount from one currency to another."""
     try:
-        api_key = get_exchange_api_key()
-        url = f"https://v6.exchangerate-api.com/v6/{api_key}/pair/{from_currency.upper()}/{to_currency.upper()}"
-        response = requests.get(url, timeout=10)
-        data = response.json()
-        
-        if data.get("result") == "success":
-            rate = data.get("conversion_rate")
-            converted_amount = amount * rate
-            return f"{amount} {from_currency.upper()} = {converted_amount:.2f} {to_currency.upper()}"
-        else:
-            return f"Error: {data.get('error-type', 'Unknown error')}"
+        return _conversion(amount, fetch_pair_quote(from_currency, to_currency))
+    except ExchangeRateError as e:
+        return f"Error: {e}"
+    except Exception as e:
+        return f"Error converting currency: {str(e)}"
+
+async def aconvert(amount: float, from_currency: str, to_currency: str) -> Conversion | str:
+    try:
+        return _conversion(amount, await afetch_pair_quote(from_currency, to_currency))
+    except ExchangeRateError as e:
+        return f"Error: {e}"
     except Exception as e:
         return f"Error converting currency: {str(e)}"
 
+def _crypto_quote(base_currency, target_currency, quote):
+    rate, fetched_at = quote
+    if rate is None:
+        return f"Error: Could not fetch rate for {base_currency} to {target_currency}"
+    return CryptoQuote(base_currency, target_currency, rate, fetched_at)
+
+def _unsupported_crypto(base_currency):
+    return f"Error: Cryptocurrency {base_currency} not supported. Supported: {', '.join(CRYPTO_IDS.keys())}"
+
 @tool
-def get_crypto_rate(base_currency: str, target_currency: str) -> str:
+def get_crypto_rate(base_currency: str, target_currency: str) -> CryptoQuote | str:
     """Get cryptocurrency exchange rate using CoinGecko API (free, no key required)."""
     try:
-        # Map common crypto symbols to CoinGecko IDs
-        crypto_map = {
-            'BTC': 'bitcoin',
-            'ETH': 'ethereum',
-            'LTC': 'litecoin',
-            'BCH': 'bitcoin-cash',
-            'ADA': 'cardano',
-            'DOT': 'polkadot',
-            'LINK': 'chainlink',
-            'XRP': 'ripple',
-            'USDT': 'tether',
-            'USDC': 'usd-coin',
-            'BNB': 'binancecoin',
-            'SOL': 'solana',
-            'MATIC': 'matic-network',
-            'AVAX': 'avalanche-2'
-        }
-        
-        crypto_id = crypto_map.get(base_currency.upper())
+        crypto_id = CRYPTO_IDS.get(base_currency.upper())
         if not crypto_id:
-            return f"Error: Cryptocurrency {base_currency} not supported. Supported: {', '.join(crypto_map.keys())}"
-        
-        url = f"https://api.coingecko.com/api/v3/simple/price?ids={crypto_id}&vs_currencies={target_currency.lower()}"
-        response = requests.get(url, timeout=10)
-        data = response.json()
-        
-        if crypto_id in data and target_currency.lower() in data[crypto_id]:
-            rate = data[crypto_id][target_currency.lower()]
-            return f"1 {base_currency.upper()} = {rate:,.2f} {target_currency.upper()}"
-        else:
-            return f"Error: Could not fetch rate for {base_currency} to {target_currency}"
+            return _unsupported_crypto(base_currency)
+        return _crypto_quote(base_currency, target_currency, crypto_prices.get_quote(crypto_id, target_currency))
     except Exception as e:
         return f"Error fetching crypto rate: {str(e)}"
 
+async def aget_crypto_rate(base_currency: str, target_currency: str) -> CryptoQuote | str:
+    try:
+        crypto_id = CRYPTO_IDS.get(base_currency.upper())
+        if not crypto_id:
+            return _unsupported_crypto(base_currency)
+        return _crypto_quote(base_currency, target_currency, await crypto_prices.aget_quote(crypto_id, target_currency))
+    except Exception as e:
+        return f"Error fetching crypto rate: {str(e)}"
+
+def _btc_conversion(amount, fiat_currency, usd_quote, btc_quote):
+    btc_price, btc_fetched_at = btc_quote
+    if btc_price is None:
+        return "Error: Could not fetch Bitcoin price"
+    # A USD amount needs no fiat leg; otherwise the result is only as fresh as the older leg
+    if usd_quote is None:
+        return BtcConversion(amount, fiat_currency, "BTC", 1.0 / btc_price, btc_fetched_at)
+    return BtcConversion(amount, fiat_currency, "BTC", usd_quote.rate / btc_price, min(usd_quote.timestamp, btc_fetched_at))
+
 @tool
-def convert_fiat_to_btc(amount: float, fiat_currency: str, base_currency: str = "BTC") -> str:
+def convert_fiat_to_btc(amount: float, fiat_currency: str, base_currency: str = "BTC") -> BtcConversion | str:
     """Convert fiat currency to Bitcoin."""
     try:
         # First get fiat to USD rate if not USD
         if fiat_currency.upper() != "USD":
-            api_key = get_exchange_api_key()
-            url = f"https://v6.exchangerate-api.com/v6/{api_key}/pair/{fiat_currency.upper()}/USD"
-            response = requests.get(url, timeout=10)
-            data = response.json()
-            
-            if data.get("result") == "success":
-                usd_amount = amount * data.get("conversion_rate")
-            else:
-                return f"Error: {data.get('error-type', 'Unknown error')}"
+            try:
+                usd_quote = fetch_pair_quote(fiat_currency, "USD")
+            except ExchangeRateError as e:
+                return f"Error: {e}"
         else:
-            usd_amount = amount
+            usd_quote = None
         
         # Get BTC price in USD using CoinGecko (free API)
-        url = "https://api.coingecko.com/api/v3/simple/price?ids=bitcoin&vs_currencies=usd"
-        response = requests.get(url, timeout=10)
-        data = response.json()
-        
-        if 'bitcoin' in data and 'usd' in data['bitcoin']:
-            btc_price = data['bitcoin']['usd']
-            btc_amount = usd_amount / btc_price
-            return f"{amount} {fiat_currency.upper()} = {btc_amount:.8f} BTC"
-        else:
-            return "Error: Could not fetch Bitcoin price"
+        btc_quote = crypto_prices.get_quote('bitcoin', 'usd')
+        return _btc_conversion(amount, fiat_currency, usd_quote, btc_quote)
+    except Exception as e:
+        return f"Error converting to Bitcoin: {str(e)}"
+
+async def aconvert_fiat_to_btc(amount: float, fiat_currency: str, base_currency: str = "BTC") -> BtcConversion | str:
+    async def usd_quote():
+        if fiat_currency.upper() == "USD":
+            return None
+        return await afetch_pair_quote(fiat_currency, "USD")
+
+    try:
+        # The fiat->USD and BTC->USD legs are independent, so fetch them concurrently
+        usd_leg, btc_leg = await asyncio.gather(
+            usd_quote(), crypto_prices.aget_quote('bitcoin', 'usd'), return_exceptions=True
+        )
+        if isinstance(usd_leg, ExchangeRateError):
+            return f"Error: {usd_leg}"
+        for leg in (usd_leg, btc_leg):
+            if isinstance(leg, BaseException):
+                raise leg
+        return _btc_conversion(amount, fiat_currency, usd_leg, btc_leg)
     except Exception as e:
         return f"Error converting to Bitcoin: {str(e)}"
 
+def _check_batch_lengths(amounts, from_currencies, to_currencies):
+    if len(amounts) == 0:
+        return "Error: No amounts provided"
+    for codes in (from_currencies, to_currencies):
+        if len(codes) not in (1, len(amounts)):
+            return "Error: Currency lists must have one entry or one per amount"
+    return None
+
+def _convert_table_many(table, amounts, from_currencies, to_currencies):
+    try:
+        return table.convert_many(amounts, from_currencies, to_currencies)
+    except UnsupportedCurrencyError as e:
+        raise ExchangeRateError(f"unsupported-code: {e}") from None
+
+def _batch_conversion(table, amounts, from_currencies, to_currencies):
+    converted = _convert_table_many(table, amounts, from_currencies, to_currencies)
+    return BatchConversion(amounts, from_currencies, to_currencies, converted, table.fetched_at)
+
+def convert_many(amounts, from_currencies, to_currencies):
+    """Convert arrays of amounts in one vectorized pass against the shared rate snapshot"""
+    return _convert_table_many(get_rate_table(), amounts, from_currencies, to_currencies)
+
+async def aconvert_many(amounts, from_currencies, to_currencies):
+    """Async variant of convert_many"""
+    return _convert_table_many(await aget_rate_table(), amounts, from_currencies, to_currencies)
+
+@tool
+def convert_batch(amounts: list[float], from_currencies: list[str], to_currencies: list[str]) -> BatchConversion | str:
+    """Convert many amounts at once. Pass one currency code per amount, or a single code to apply it to every amount."""
+    try:
+        error = _check_batch_lengths(amounts, from_currencies, to_currencies)
+        if error:
+            return error
+        return _batch_conversion(get_rate_table(), amounts, from_currencies, to_currencies)
+    except ExchangeRateError as e:
+        return f"Error: {e}"
+    except Exception as e:
+        return f"Error converting currencies: {str(e)}"
+
+async def aconvert_batch(amounts: list[float], from_currencies: list[str], to_currencies: list[str]) -> BatchConversion | str:
+    try:
+        error = _check_batch_lengths(amounts, from_currencies, to_currencies)
+        if error:
+            return error
+        return _batch_conversion(await aget_rate_table(), amounts, from_currencies, to_currencies)
+    except ExchangeRateError as e:
+        return f"Error: {e}"
+    except Exception as e:
+        return f"Error converting currencies: {str(e)}"
+
+def _fetch_history_day(day):
+    return _exchange_json(f"history/{RATE_TABLE_BASE}/{day.year}/{day.month}/{day.day}")["conversion_rates"]
+
+# Daily rate history on disk, filled in from exchangerate-api as dates are requested
+history_store = HistoricalRateStore(_fetch_history_day, base=RATE_TABLE_BASE)
+
+def fetch_rate_on_date(date, from_currency, to_currency):
+    """Get the conversion rate for a currency pair on a past date from the historical store"""
+    try:
+        return history_store.rate(parse_date(date), from_currency, to_currency)
+    except UnsupportedCurrencyError as e:
+        raise ExchangeRateError(f"unsupported-code: {e}") from None
+
+def convert_many_on_dates(amounts, dates, from_currencies, to_currencies):
+    """Convert arrays of amounts at the rates of arrays of dates in one vectorized pass"""
+    try:
+        return history_store.convert_many(amounts, dates, from_currencies, to_currencies)
+    except UnsupportedCurrencyError as e:
+        raise ExchangeRateError(f"unsupported-code: {e}") from None
+
+def _convert_on_date(amount, from_currency, to_currency, date):
+    try:
+        day = parse_date(date)
+        rate = fetch_rate_on_date(day, from_currency, to_currency)
+        return HistoricalConversion(amount, from_currency, to_currency, rate, day)
+    except (ExchangeRateError, ValueError) as e:
+        return f"Error: {e}"
+    except Exception as e:
+        return f"Error converting currency: {str(e)}"
+
+@tool
+def convert_on_date(amount: float, from_currency: str, to_currency: str, date: str) -> HistoricalConversion | str:
+    """Convert an amount from one currency to another at the exchange rate of a past date (YYYY-MM-DD)."""
+    return _convert_on_date(amount, from_currency, to_currency, date)
+
+async def aconvert_on_date(amount: float, from_currency: str, to_currency: str, date: str) -> HistoricalConversion | str:
+    # Stored days are a memory-mapped read, but a missing day is fetched and written, so keep it off the loop
+    return await asyncio.to_thread(_convert_on_date, amount, from_currency, to_currency, date)
+
+# Every fiat and crypto rate as one graph, fed from the shared rate and price caches
+conversion_graph = ConversionGraph(hub=RATE_TABLE_BASE)
+
+_CRYPTO_SYMBOLS = {crypto_id: symbol for symbol, crypto_id in CRYPTO_IDS.items()}
+
+def _update_graph(table, matrix):
+    """Feed the latest rate table and, if given, crypto price matrix into the graph; unchanged sources cost nothing"""
+    if conversion_graph.fetched_at("fiat") != table.fetched_at:
+        conversion_graph.update("fiat", {(table.base, code): rate for code, rate in zip(table.codes, table.rates)}, table.fetched_at)
+    if matrix is not None and conversion_graph.fetched_at("crypto") != matrix[1]:
+        prices, fetched_at = matrix
+        edges = {
+            (_CRYPTO_SYMBOLS[coin], vs_currency): price
+            for coin, quotes in prices.items() if coin in _CRYPTO_SYMBOLS
+            for vs_currency, price in quotes.items() if price
+        }
+        conversion_graph.update("crypto", edges, fetched_at)
+
+def _path_conversion(amount, from_currency, to_currency):
+    try:
+        rate, fetched_at = conversion_graph.rate(from_currency, to_currency)
+    except UnsupportedCurrencyError as e:
+        return f"Error: Unsupported currency {e}"
+    path = conversion_graph.path(from_currency, to_currency)
+    decimals = 8 if to_currency.upper() in CRYPTO_IDS else 2
+    return PathConversion(amount, from_currency, to_currency, rate, fetched_at, path, decimals)
+
+def _needs_crypto(from_currency, to_currency):
+    return from_currency.upper() in CRYPTO_IDS or to_currency.upper() in CRYPTO_IDS
+
+@tool
+def convert_any(amount: float, from_currency: str, to_currency: str) -> PathConversion | str:
+    """Convert an amount between any two supported currencies, fiat or crypto, in one call (e.g. INR to ETH, SOL to ADA)."""
+    try:
+        matrix = crypto_prices.matrix(RATE_TABLE_BASE) if _needs_crypto(from_currency, to_currency) else None
+        _update_graph(get_rate_table(), matrix)
+        return _path_conversion(amount, from_currency, to_currency)
+    except Exception as e:
+        return f"Error converting currency: {str(e)}"
+
+async def aconvert_any(amount: float, from_currency: str, to_currency: str) -> PathConversion | str:
+    async def matrix():
+        if _needs_crypto(from_currency, to_currency):
+            return await crypto_prices.amatrix(RATE_TABLE_BASE)
+        return None
+
+    try:
+        # The fiat table and crypto matrix come from different upstreams, so fetch them concurrently
+        table, prices = await asyncio.gather(aget_rate_table(), matrix())
+        _update_graph(table, prices)
+        return _path_conversion(amount, from_currency, to_currency)
+    except Exception as e:
+        return f"Error converting currency: {str(e)}"
+
+# Give every tool a native coroutine so ainvoke never blocks the event loop
+get_conversion_factor.coroutine = aget_conversion_factor
+convert.coroutine = aconvert
+get_crypto_rate.coroutine = aget_crypto_rate
+convert_fiat_to_btc.coroutine = aconvert_fiat_to_btc
+convert_batch.coroutine = aconvert_batch
+convert_on_date.coroutine = aconvert_on_date
+convert_any.coroutine = aconvert_any
+
 # Initialize tools list
-tools = [get_conversion_factor, convert, get_crypto_rate, convert_fiat_to_btc]
+tools = [get_conversion_factor, convert, get_crypto_rate, convert_fiat_to_btc, convert_batch, convert_on_date, convert_any]
 
 # Lazy-loaded LLM class that only initializes when API keys are available
 class LazyLLM:
-    def __init__(self):
-        self._llm = None
+    def __init__(self, maxsize=LLM_CLIENT_CACHE_SIZE):
+        # Per (api_key, model): the client plus one tool-bound variant per tool subset; never expire, only get evicted
+        self._clients = TTLCache(ttl=float("inf"), maxsize=maxsize)
     
-    def _ensure_llm(self):
-        """Ensure LLM is initialized with current API keys"""
+    def _ensure_llm(self, tool_names=None):
+        """Get the LLM bound to all tools, or only to tool_names, building it only on first use"""
         try:
-            # Always create fresh instance to use current environment variables
-            llm = get_openai_client()
-            self._llm = llm.bind_tools(tools)
+            api_key = get_openai_api_key()
         except ValueError as e:
             raise ValueError(f"Please provide valid API keys: {str(e)}")
+        variants = self._clients.get_or_fetch((api_key, OPENAI_MODEL), dict)
+        selected = tuple(tool for tool in tools if tool_names is None or tool.name in tool_names)
+        names = tuple(tool.name for tool in selected)
+        bound = variants.get(names)
+        if bound is None:
+            client = variants.get(None) or variants.setdefault(None, get_openai_client())
+            bound = variants.setdefault(names, client.bind_tools(list(selected)))
+        return bound
+    
+    def with_tools(self, tool_names):
+        """Get the LLM bound to just the named tools, so unrelated schemas aren't sent"""
+        return self._ensure_llm(tool_names)
+    
+    def forget(self, api_key):
+        """Drop the cached clients for an API key, e.g. when the user clears their keys"""
+        self._clients.discard((api_key, OPENAI_MODEL))
     
     def invoke(self, *args, **kwargs):
         """Invoke the LLM, ensuring it's initialized first"""
-        self._ensure_llm()
-        return self._llm.invoke(*args, **kwargs)
+        return self._ensure_llm().invoke(*args, **kwargs)
     
     def __getattr__(self, name):
         """Delegate all other attributes to the LLM instance"""
-        self._ensure_llm()
-        return getattr(self._llm, name)
+        return getattr(self._ensure_llm(), name)
 
 # Create the lazy LLM instance
 llm_with_tools = LazyLLM()
@@ -162,5 +447,10 @@ __all__ = [
     'get_conversion_factor',
     'convert',
     'get_crypto_rate',
-    'convert_fiat_to_btc'
+    'convert_fiat_to_btc',
+    'convert_batch',
+    'convert_on_date',
+    'convert_any',
+    'convert_many',
+    'convert_many_on_dates'
 ]
\ No newline at end of file
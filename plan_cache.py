@@ -0,0 +1,114 @@
+import os
+import re
+
+from cache import TTLCache, rate_cache
+
+_NUMBER_RE = re.compile(r"\d+(?:,\d{3})*(?:\.\d+)?")
+_SPACE_RE = re.compile(r"\s+")
+
+
+class _Amount:
+    """Placeholder for the n-th number in a prompt"""
+
+    __slots__ = ('index',)
+
+    def __init__(self, index):
+        self.index = index
+
+
+def normalize_prompt(prompt):
+    """Reduce a prompt to a cache key and the amounts that were stripped from it.
+
+    Case, surrounding punctuation and runs of whitespace are ignored, and every
+    number is replaced by a placeholder so "convert 100 usd to eur" and
+    "Convert 250 USD to EUR?" share a key.
+    """
+    amounts = [float(match.replace(',', '')) for match in _NUMBER_RE.findall(prompt)]
+    key = _NUMBER_RE.sub('<num>', prompt.lower())
+    key = _SPACE_RE.sub(' ', key).strip(' ?!.')
+    return key, amounts
+
+
+def _abstract(value, amounts, used):
+    """Replace numbers taken from the prompt with placeholders, appending each one's position to used.
+
+    Raises ValueError for a number that isn't in the prompt exactly once,
+    since a placeholder could then be bound to the wrong amount on replay.
+    """
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, (int, float)):
+        matches = amounts.count(float(value))
+        if matches != 1:
+            raise ValueError(f"{value} appears {matches} times in the prompt")
+        used.append(amounts.index(float(value)))
+        return _Amount(used[-1])
+    if isinstance(value, str) and any(char.isdigit() for char in value):
+        # Numbers inside strings (e.g. dates) are abstracted in the key but can't be rebound here
+        raise ValueError(f"{value!r} embeds numbers from the prompt")
+    if isinstance(value, list):
+        return [_abstract(item, amounts, used) for item in value]
+    if isinstance(value, dict):
+        return {name: _abstract(item, amounts, used) for name, item in value.items()}
+    return value
+
+
+def _bind(value, amounts):
+    """Fill placeholders with the amounts from a new prompt"""
+    if isinstance(value, _Amount):
+        return amounts[value.index]
+    if isinstance(value, list):
+        return [_bind(item, amounts) for item in value]
+    if isinstance(value, dict):
+        return {name: _bind(item, amounts) for name, item in value.items()}
+    return value
+
+
+class PlanCache:
+    """Cache of the tool calls the LLM chose for a normalized prompt.
+
+    Only the plan is stored, never the numbers it produced, so a cached plan is
+    replayed against current rates. Entries expire with the rate cache TTL.
+    """
+
+    def __init__(self, ttl=None, maxsize=256):
+        self._plans = TTLCache(ttl=rate_cache.ttl if ttl is None else ttl, maxsize=maxsize, name="plans")
+
+    def store(self, prompt, tool_calls):
+        """Remember the tool calls used to answer a prompt.
+
+        Returns False when the plan can't be reused: every number in the prompt
+        must be used by exactly one argument and every numeric argument must
+        come from exactly one number in the prompt. Otherwise an argument was
+        derived by the model, or a replay would drop or misplace an amount.
+        """
+        key, amounts = normalize_prompt(prompt)
+        if not tool_calls:
+            return False
+        used = []
+        try:
+            plan = [(tool_call['name'], _abstract(tool_call['args'], amounts, used)) for tool_call in tool_calls]
+        except ValueError:
+            return False
+        if sorted(used) != list(range(len(amounts))):
+            return False
+        self._plans.set(key, plan)
+        return True
+
+    def lookup(self, prompt):
+        """Return concrete tool calls for a prompt, or None on a miss"""
+        key, amounts = normalize_prompt(prompt)
+        plan = self._plans.get(key)
+        if plan is None:
+            return None
+        return [
+            {'name': name, 'args': _bind(args, amounts), 'id': f'plan-cache-{i}'}
+            for i, (name, args) in enumerate(plan)
+        ]
+
+    def stats(self):
+        return self._plans.stats()
+
+
+# Process-wide plan cache shared by every chat session
+plan_cache = PlanCache(maxsize=int(os.getenv("PLAN_CACHE_MAXSIZE", "256")))
@@ -0,0 +1,176 @@
+import math
+import os
+import threading
+import time
+
+from credentials import Credentials, current_credentials, use_credentials
+from instrumentation import tracer
+from quota import QUOTA_MONTHLY, QUOTA_RESERVE, background, parse_limits
+
+
+def _default_budgets():
+    """Fixed hourly budgets, except that an upstream with a monthly quota gets its unreserved share spread over a 31-day month"""
+    budgets = {'exchangerate': 12.0, 'coingecko': 60.0}
+    for upstream, monthly in QUOTA_MONTHLY.items():
+        budgets[upstream] = monthly * (1 - QUOTA_RESERVE) / (31 * 24)
+    return budgets
+
+
+# Background refreshes allowed per upstream per hour; by default exchangerate-api's 1,500 a month
+# less the reserve works out to about 1.8 an hour, so prefetching alone can't spend the quota
+PREFETCH_BUDGETS = parse_limits(os.environ["PREFETCH_BUDGETS"]) if os.getenv("PREFETCH_BUDGETS") else _default_budgets()
+# Seconds between scheduler passes
+PREFETCH_INTERVAL = float(os.getenv("PREFETCH_INTERVAL", "5"))
+# Number of most requested entries kept warm
+PREFETCH_TOP_N = int(os.getenv("PREFETCH_TOP_N", "8"))
+
+
+class RefreshBudget:
+    """Token bucket allowing a number of refreshes per hour, with up to ten minutes' worth saved up"""
+
+    def __init__(self, per_hour):
+        self.rate = per_hour / 3600.0
+        self.capacity = max(1.0, per_hour / 6)
+        self.tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def take(self):
+        """Spend one refresh if the budget allows it"""
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            if self.tokens < 1.0:
+                return False
+            self.tokens -= 1.0
+            return True
+
+
+class _Tracked:
+    """Request count and refresh recipe for one cache entry"""
+
+    __slots__ = ('upstream', 'cache', 'key', 'fetch', 'credentials', 'score')
+
+    def __init__(self, upstream, cache, key, fetch):
+        self.upstream = upstream
+        self.cache = cache
+        self.key = key
+        self.fetch = fetch
+        self.credentials = None
+        self.score = 0.0
+
+
+class Prefetcher:
+    """Keeps the most requested cache entries warm by refreshing them shortly before they expire.
+
+    Tools report every lookup with track(); a daemon thread periodically
+    refreshes the top entries whose TTL is about to run out, spending at most
+    each upstream's hourly budget. Request counts decay with a ten-minute
+    half-life, so the hot set follows current traffic.
+    """
+
+    HALF_LIFE = 600.0
+    # Decayed request count an entry needs to be kept warm; one stray request doesn't qualify
+    MIN_SCORE = 1.5
+
+    def __init__(self, budgets=PREFETCH_BUDGETS, interval=PREFETCH_INTERVAL, top_n=PREFETCH_TOP_N):
+        self.budgets = {upstream: RefreshBudget(per_hour) for upstream, per_hour in budgets.items()}
+        self.interval = interval
+        self.top_n = top_n
+        self.refreshes = 0
+        self.skipped = 0
+        self._tracked = {}
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stopped = threading.Event()
+
+    def track(self, upstream, cache, key, fetch):
+        """Record a lookup of key in cache; fetch() is what a refresh calls to reload it.
+
+        Refreshes run with the Exchange Rate API key of the session that last
+        asked for the entry, or the environment's outside a session. No other
+        key is kept.
+        """
+        if upstream not in self.budgets:
+            return
+        with self._lock:
+            tracked = self._tracked.get((id(cache), key))
+            if tracked is None:
+                tracked = self._tracked[(id(cache), key)] = _Tracked(upstream, cache, key, fetch)
+            tracked.score += 1.0
+            credentials = current_credentials()
+            tracked.credentials = credentials and Credentials(exchange_rate_api_key=credentials.exchange_rate_api_key)
+            if self._thread is None and self.interval > 0:
+                self._thread = threading.Thread(target=self._run, name="prefetcher", daemon=True)
+                self._thread.start()
+
+    def forget(self, exchange_rate_api_key):
+        """Stop refreshing with a key, e.g. once its user has cleared it; its entries are dropped until asked for again"""
+        if not exchange_rate_api_key:
+            return
+        with self._lock:
+            for ident, tracked in list(self._tracked.items()):
+                if tracked.credentials is not None and tracked.credentials.exchange_rate_api_key == exchange_rate_api_key:
+                    del self._tracked[ident]
+
+    def _decay(self, elapsed):
+        """Age every score and forget entries nobody has asked for in a long while; caller holds the lock"""
+        factor = math.pow(0.5, elapsed / self.HALF_LIFE)
+        for ident, tracked in list(self._tracked.items()):
+            tracked.score *= factor
+            if tracked.score < 0.01:
+                del self._tracked[ident]
+
+    def _hot(self):
+        """The top entries by decayed request count; caller holds the lock"""
+        candidates = [tracked for tracked in self._tracked.values() if tracked.score >= self.MIN_SCORE]
+        return sorted(candidates, key=lambda tracked: tracked.score, reverse=True)[:self.top_n]
+
+    def run_once(self, elapsed=0.0):
+        """Refresh the hot entries that expire within the next two passes; return how many were refreshed"""
+        with self._lock:
+            self._decay(elapsed)
+            hot = self._hot()
+        refreshed = 0
+        for tracked in hot:
+            remaining = tracked.cache.remaining(tracked.key)
+            if remaining is not None and remaining > 2 * self.interval:
+                continue
+            if not self.budgets[tracked.upstream].take():
+                self.skipped += 1
+                continue
+            # Refreshes count against the key's quota like any request, but give way when it runs low
+            with use_credentials(tracked.credentials), background(), tracer.span(f"prefetch {tracked.upstream}", kind="prefetch"):
+                if tracked.cache.refresh(tracked.key, tracked.fetch):
+                    refreshed += 1
+        self.refreshes += refreshed
+        return refreshed
+
+    def _run(self):
+        last = time.monotonic()
+        while not self._stopped.wait(self.interval):
+            now = time.monotonic()
+            try:
+                self.run_once(now - last)
+            except Exception:
+                # Prefetching is best effort; a bad pass must not kill the thread
+                pass
+            last = now
+
+    def stop(self):
+        self._stopped.set()
+
+    def stats(self):
+        with self._lock:
+            hot = self._hot()
+            return {
+                'tracked': len(self._tracked),
+                'hot': [(tracked.upstream, tracked.key, round(tracked.score, 2)) for tracked in hot],
+                'refreshes': self.refreshes,
+                'skipped_over_budget': self.skipped,
+            }
+
+
+# Process-wide prefetcher fed by the rate and crypto lookups
+prefetcher = Prefetcher()
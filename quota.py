@@ -0,0 +1,308 @@
+import asyncio
+import contextvars
+import datetime
+import hashlib
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from instrumentation import register_collector
+from snapshots import snapshots
+
+
+def parse_limits(spec):
+    """Parse "exchangerate=12,coingecko=60" into {upstream: number}"""
+    limits = {}
+    for entry in filter(None, (item.strip() for item in spec.split(","))):
+        upstream, _, value = entry.partition("=")
+        limits[upstream.strip()] = float(value)
+    return limits
+
+
+# Requests each API key may make per calendar month (UTC); exchangerate-api's free tier is 1,500
+QUOTA_MONTHLY = parse_limits(os.getenv("QUOTA_MONTHLY", "exchangerate=1500"))
+# Sustained requests per second per upstream and key; a burst of up to five seconds' worth goes through at once
+QUOTA_PER_SECOND = parse_limits(os.getenv("QUOTA_PER_SECOND", "exchangerate=2,coingecko=0.5"))
+# Share of the monthly quota kept for requests no cached value can answer; background refreshes never use it
+QUOTA_RESERVE = float(os.getenv("QUOTA_RESERVE", "0.1"))
+# Seconds a request waits for the per-second limit before failing
+QUOTA_MAX_WAIT = float(os.getenv("QUOTA_MAX_WAIT", "2"))
+
+
+class QuotaExceededError(Exception):
+    """Raised instead of sending a request that would break an API key's quota"""
+
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        # Seconds until the request would be allowed
+        self.retry_after = retry_after
+
+
+# True while refreshing data that is still being served from the cache
+_background = contextvars.ContextVar("quota_background", default=False)
+
+
+@contextmanager
+def background():
+    """Mark requests made inside the block as refreshes nobody is waiting on.
+
+    They go out only while the key's monthly quota is on pace and never wait
+    for the per-second limit, so a key running low keeps serving cached rates
+    for longer rather than running dry.
+    """
+    token = _background.set(True)
+    try:
+        yield
+    finally:
+        _background.reset(token)
+
+
+def _month(now):
+    """(label, start, end) of the UTC calendar month containing wall time now"""
+    day = datetime.datetime.fromtimestamp(now, datetime.timezone.utc)
+    start = day.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    end = (start + datetime.timedelta(days=32)).replace(day=1)
+    return f"{start:%Y-%m}", start.timestamp(), end.timestamp()
+
+
+def _iso(timestamp):
+    return datetime.datetime.fromtimestamp(timestamp, datetime.timezone.utc).isoformat(timespec="seconds")
+
+
+class Quota:
+    """Request budget of one API key on one upstream.
+
+    Three limits apply, each optional:
+
+    * monthly: hard cap per calendar month; nothing is sent once it's spent.
+    * pace: background refreshes draw from a token bucket refilled at the rate
+      that spreads the rest of the month's quota, minus the reserve, evenly
+      over the time left, holding up to an hour's worth. Every request spends
+      from it, so a key burning through its quota early gets its cached rates
+      refreshed less often instead of running out mid-month.
+    * per second: every request draws from a bucket refilled at per_second,
+      which smooths bursts.
+
+    Times are wall-clock seconds, since the month boundary is a calendar date.
+    """
+
+    def __init__(self, monthly=None, per_second=None, reserve=QUOTA_RESERVE):
+        self.monthly = monthly
+        self.per_second = per_second
+        self.reserve = reserve
+        self.used = 0
+        self.paced = 0
+        self.deferred = 0
+        self.rejected = 0
+        self.month = None
+        self._start = self._end = 0.0
+        self._pace = 0.0
+        self._tokens = self._burst()
+        self._updated = time.time()
+        self._lock = threading.Lock()
+
+    def _burst(self):
+        return max(1.0, 5 * self.per_second) if self.per_second else 0.0
+
+    def _pace_rate(self, now):
+        """Requests per second that would spend the unreserved rest of the month's quota evenly"""
+        spendable = self.monthly * (1 - self.reserve) - self.used
+        return max(0.0, spendable) / max(self._end - now, 1.0)
+
+    def _advance(self, now):
+        """Start a new month if one began, and refill both buckets; caller holds the lock"""
+        label, start, end = _month(now)
+        if label != self.month:
+            self.month, self._start, self._end = label, start, end
+            self.used = 0
+            self._pace = float("inf")
+        elapsed = max(0.0, now - self._updated)
+        self._updated = now
+        if self.monthly is not None:
+            rate = self._pace_rate(now)
+            self._pace = min(max(1.0, rate * 3600), self._pace + elapsed * rate)
+        if self.per_second:
+            self._tokens = min(self._burst(), self._tokens + elapsed * self.per_second)
+
+    def restore(self, month, used):
+        """Carry over the count a previous process saved, if it is for the current month"""
+        with self._lock:
+            self._advance(time.time())
+            if month == self.month:
+                self.used = max(self.used, int(used))
+
+    def exhaust(self):
+        """Treat the month's quota as spent, e.g. because the provider said so"""
+        with self._lock:
+            self._advance(time.time())
+            if self.monthly is not None:
+                self.used = max(self.used, int(self.monthly))
+
+    def take(self, background=False, now=None):
+        """Spend one request if the limits allow it.
+
+        Returns 0.0 once it's spent, or the seconds to wait for the per-second
+        limit. Raises QuotaExceededError when the month's quota is used up, or
+        for a background request that the pace or per-second limit can't fit in now.
+        """
+        now = time.time() if now is None else now
+        with self._lock:
+            self._advance(now)
+            if self.monthly is not None:
+                if self.used >= self.monthly:
+                    self.rejected += 1
+                    raise QuotaExceededError(
+                        f"Monthly quota of {self.monthly:g} requests used up until {_iso(self._end)}", self._end - now
+                    )
+                if background and self._pace < 1.0:
+                    self.deferred += 1
+                    rate = self._pace_rate(now)
+                    wait = (1.0 - self._pace) / rate if rate else self._end - now
+                    raise QuotaExceededError("Refresh deferred to stay within the monthly quota", wait)
+            if self.per_second and self._tokens < 1.0:
+                wait = (1.0 - self._tokens) / self.per_second
+                if background:
+                    self.deferred += 1
+                    raise QuotaExceededError("Refresh deferred by the per-second limit", wait)
+                self.paced += 1
+                return wait
+            if self.per_second:
+                self._tokens -= 1.0
+            self._pace -= 1.0
+            self.used += 1
+            return 0.0
+
+    def stats(self, now=None):
+        """Usage this month, what's left and, at the month-to-date rate, when it runs out"""
+        now = time.time() if now is None else now
+        with self._lock:
+            self._advance(now)
+            # Under an hour into the month, the rate says more about one burst than about the month
+            burn = self.used / max(now - self._start, 3600.0)
+            remaining = None if self.monthly is None else max(0, int(self.monthly) - self.used)
+            exhaustion = None
+            if remaining is not None and burn > 0 and now + remaining / burn < self._end:
+                exhaustion = _iso(now + remaining / burn)
+            return {
+                'month': self.month,
+                'monthly': self.monthly,
+                'used': self.used,
+                'remaining': remaining,
+                'resets_at': _iso(self._end),
+                'per_day': round(burn * 86400, 1),
+                'projected_exhaustion': exhaustion,
+                'low': remaining is not None and (remaining <= self.monthly * self.reserve or exhaustion is not None),
+                'paced': self.paced,
+                'deferred': self.deferred,
+                'rejected': self.rejected,
+            }
+
+
+def fingerprint(api_key):
+    """Short stable label for an API key, safe to log and persist"""
+    return hashlib.sha256(api_key.encode()).hexdigest()[:12] if api_key else "default"
+
+
+class QuotaManager:
+    """Quotas for every (upstream, API key) pair, created on first use.
+
+    Upstreams without a monthly or per-second limit configured aren't
+    tracked. Monthly counts are saved to the snapshot store after every
+    request, so a restart doesn't hand a key a fresh month.
+    """
+
+    def __init__(self, monthly=QUOTA_MONTHLY, per_second=QUOTA_PER_SECOND, reserve=QUOTA_RESERVE, max_wait=QUOTA_MAX_WAIT):
+        self.monthly = monthly
+        self.per_second = per_second
+        self.reserve = reserve
+        self.max_wait = max_wait
+        self._quotas = {}
+        self._saved = {}
+        self._persist = None
+        self._lock = threading.Lock()
+
+    def attach(self, persist):
+        """Load saved monthly counts and save them back from now on; see TTLCache.attach for persist"""
+        with self._lock:
+            for key, value, _ in persist.load():
+                self._saved[key] = value
+            self._persist = persist
+
+    def quota(self, upstream, api_key=None):
+        """The Quota for an API key on upstream, or None if upstream has no limits"""
+        if upstream not in self.monthly and upstream not in self.per_second:
+            return None
+        key = (upstream, fingerprint(api_key))
+        with self._lock:
+            quota = self._quotas.get(key)
+            if quota is None:
+                quota = self._quotas[key] = Quota(self.monthly.get(upstream), self.per_second.get(upstream), self.reserve)
+                saved = self._saved.pop(key, None)
+                if saved is not None:
+                    quota.restore(saved['month'], saved['used'])
+            return quota
+
+    def _save(self, upstream, api_key, quota):
+        if self._persist is not None and quota.monthly is not None:
+            self._persist.save((upstream, fingerprint(api_key)), {'month': quota.month, 'used': quota.used})
+
+    def _take(self, upstream, quota, deadline):
+        """One attempt at spending a request: 0.0 once spent, else the seconds to wait before retrying"""
+        wait = quota.take(_background.get())
+        if wait and time.monotonic() + wait > deadline:
+            raise QuotaExceededError(f"{upstream} allows {quota.per_second:g} requests per second", wait)
+        return wait
+
+    def acquire(self, upstream, api_key=None):
+        """Count one request to upstream against api_key's quota, waiting up to max_wait for the per-second limit"""
+        quota = self.quota(upstream, api_key)
+        if quota is None:
+            return
+        deadline = time.monotonic() + self.max_wait
+        while wait := self._take(upstream, quota, deadline):
+            time.sleep(wait)
+        self._save(upstream, api_key, quota)
+
+    async def aacquire(self, upstream, api_key=None):
+        """Async variant of acquire"""
+        quota = self.quota(upstream, api_key)
+        if quota is None:
+            return
+        deadline = time.monotonic() + self.max_wait
+        while wait := self._take(upstream, quota, deadline):
+            await asyncio.sleep(wait)
+        self._save(upstream, api_key, quota)
+
+    def exhaust(self, upstream, api_key=None):
+        """Mark api_key's monthly quota on upstream as spent, e.g. when the provider reports it is"""
+        quota = self.quota(upstream, api_key)
+        if quota is not None:
+            quota.exhaust()
+            self._save(upstream, api_key, quota)
+
+    def stats(self):
+        with self._lock:
+            quotas = list(self._quotas.items())
+        return {f"{upstream}:{key}": quota.stats() for (upstream, key), quota in quotas}
+
+
+def _collect():
+    samples = []
+    for name, stats in quotas.stats().items():
+        upstream, _, key = name.partition(":")
+        labels = (('upstream', upstream), ('key', key))
+        if stats['remaining'] is not None:
+            samples.append(('converter_quota_remaining', 'gauge', labels, stats['remaining']))
+        samples.append(('converter_quota_used', 'gauge', labels, stats['used']))
+        for counter in ('paced', 'deferred', 'rejected'):
+            samples.append((f'converter_quota_{counter}_total', 'counter', labels, stats[counter]))
+    return samples
+
+
+# Process-wide quotas consulted before every exchangerate-api and CoinGecko request
+quotas = QuotaManager()
+if snapshots is not None:
+    quotas.attach(snapshots.namespace("quota", encode=dict, decode=dict))
+
+register_collector(_collect)
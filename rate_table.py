@@ -0,0 +1,72 @@
+import time
+from array import array
+
+import numpy as np
+
+
+class UnsupportedCurrencyError(ValueError):
+    """Raised when a currency code is not present in a rate table"""
+
+
+class RateTable:
+    """Snapshot of every rate quoted against a single base currency.
+
+    Rates are held in a flat array of doubles indexed by currency code, so
+    any cross rate can be derived locally by triangulating through the base
+    without another upstream request.
+    """
+
+    __slots__ = ('base', 'codes', 'index', 'rates', 'fetched_at')
+
+    def __init__(self, base, conversion_rates, fetched_at=None):
+        self.base = base.upper()
+        self.codes = tuple(code.upper() for code in conversion_rates)
+        self.index = {code: i for i, code in enumerate(self.codes)}
+        self.rates = array('d', (float(rate) for rate in conversion_rates.values()))
+        self.fetched_at = time.time() if fetched_at is None else fetched_at
+
+    @classmethod
+    def from_latest(cls, data):
+        """Build a table from an exchangerate-api /latest response body"""
+        return cls(data["base_code"], data["conversion_rates"])
+
+    def to_dict(self):
+        """JSON-serializable form, including when the rates were fetched"""
+        return {"base": self.base, "conversion_rates": dict(zip(self.codes, self.rates)), "fetched_at": self.fetched_at}
+
+    @classmethod
+    def from_dict(cls, data):
+        """Rebuild a table saved with to_dict"""
+        return cls(data["base"], data["conversion_rates"], data["fetched_at"])
+
+    def position(self, code):
+        """Return the array index for a currency code"""
+        try:
+            return self.index[code.upper()]
+        except KeyError:
+            raise UnsupportedCurrencyError(code.upper()) from None
+
+    def cross_rate(self, from_currency, to_currency):
+        """Return how many units of to_currency one unit of from_currency buys"""
+        return self.rates[self.position(to_currency)] / self.rates[self.position(from_currency)]
+
+    def positions(self, codes):
+        """Return array indices for a sequence of currency codes"""
+        unique, inverse = np.unique(np.asarray(codes, dtype=str), return_inverse=True)
+        lookup = np.fromiter((self.position(code) for code in unique), dtype=np.intp, count=len(unique))
+        return lookup[inverse.reshape(-1)]
+
+    def convert_many(self, amounts, from_currencies, to_currencies):
+        """Convert arrays of amounts between arrays of currency codes in one vectorized pass.
+
+        Code arrays of length one are broadcast against the amounts.
+        """
+        rates = np.frombuffer(self.rates, dtype=np.float64)
+        amounts = np.asarray(amounts, dtype=np.float64)
+        return amounts * (rates[self.positions(to_currencies)] / rates[self.positions(from_currencies)])
+
+    def __contains__(self, code):
+        return code.upper() in self.index
+
+    def __len__(self):
+        return len(self.codes)
@@ -0,0 +1,230 @@
+"""Headless HTTP API for the converter.
+
+An ASGI app serving the tools in main.py and the agent loop to programmatic
+clients. Every request shares the process-wide rate caches and pooled upstream
+connections, so run it as one process per host and let the event loop carry the
+concurrency:
+
+    uvicorn server:app --host 0.0.0.0 --port 8000
+
+Endpoints:
+    GET  /rate?from=USD&to=EUR               conversion factor, no LLM
+    GET  /convert?amount=100&from=USD&to=EUR converted amount, no LLM; add &date=YYYY-MM-DD for a past rate
+    POST /convert                            same, with a JSON body
+    POST /batch                              {"amounts": [...], "from": [...] | "USD", "to": [...] | "EUR"},
+                                             optionally "dates": [...] | "YYYY-MM-DD" for past rates
+    POST /chat                               {"message": "Convert 100 USD to EUR"}
+    GET  /health                             liveness, cache statistics, upstream breaker states and quotas
+
+Callers may send their own API keys in the X-OpenAI-Key and X-Exchange-Rate-Key
+headers; they apply to that request only. Requests without them use the keys
+in the server's environment.
+"""
+import json
+import math
+import os
+from contextlib import asynccontextmanager
+
+from starlette.applications import Starlette
+from starlette.concurrency import run_in_threadpool
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+
+from cache import rate_cache
+from credentials import Credentials, use_credentials
+from crypto_prices import CRYPTO_IDS, crypto_prices
+from history import InvalidDateError
+from instrumentation import tracer
+from prefetch import prefetcher
+from quota import QuotaExceededError, quotas
+from main import (
+    ExchangeRateError, afetch_crypto_price, afetch_pair_rate, aconvert_many, convert_many_on_dates, fetch_rate_on_date,
+)
+from upstream import CircuitOpenError, aclose_clients, metrics as upstream_metrics
+
+# Largest number of amounts accepted by one /batch request
+MAX_BATCH_SIZE = int(os.getenv("MAX_BATCH_SIZE", "10000"))
+
+
+class BadRequest(Exception):
+    """Raised for malformed client input; rendered as a 400 response"""
+
+
+def _error(status, message):
+    return JSONResponse({"error": message}, status_code=status)
+
+
+async def _params(request):
+    """Merge query parameters with a JSON object body, if one was sent"""
+    params = dict(request.query_params)
+    if request.method == "POST":
+        try:
+            body = json.loads(await request.body() or b"{}")
+        except ValueError:
+            raise BadRequest("Body must be valid JSON") from None
+        if not isinstance(body, dict):
+            raise BadRequest("Body must be a JSON object")
+        params.update(body)
+    return params
+
+
+def _currency(params, name):
+    value = params.get(name)
+    if not isinstance(value, str) or not value.strip().isalpha():
+        raise BadRequest(f"'{name}' must be a currency code")
+    return value.strip().upper()
+
+
+def _amount(value, name="amount"):
+    try:
+        amount = float(value)
+    except (TypeError, ValueError):
+        raise BadRequest(f"'{name}' must be a number") from None
+    if not math.isfinite(amount):
+        raise BadRequest(f"'{name}' must be finite")
+    return amount
+
+
+async def _rate(from_currency, to_currency):
+    """Conversion factor for a fiat pair, or for a crypto symbol against any quote currency"""
+    crypto_id = CRYPTO_IDS.get(from_currency)
+    if crypto_id is not None:
+        rate = await afetch_crypto_price(crypto_id, to_currency)
+        if rate is None:
+            raise ExchangeRateError("unsupported-code")
+        return rate
+    return await afetch_pair_rate(from_currency, to_currency)
+
+
+def _credentials(request):
+    """Per-request API keys from the headers, or None to use the server's own"""
+    openai_api_key = request.headers.get("x-openai-key")
+    exchange_rate_api_key = request.headers.get("x-exchange-rate-key")
+    if openai_api_key is None and exchange_rate_api_key is None:
+        return None
+    return Credentials(openai_api_key, exchange_rate_api_key)
+
+
+def endpoint(handler):
+    """Wrap a handler with tracing, per-request credentials and the service's error-to-status mapping"""
+    async def wrapped(request):
+        with use_credentials(_credentials(request)), tracer.span(f"{request.method} {request.url.path}", kind="request") as span:
+            try:
+                response = await handler(request)
+            except (BadRequest, InvalidDateError) as e:
+                response = _error(400, str(e))
+            except QuotaExceededError as e:
+                response = _error(429, str(e))
+                response.headers['Retry-After'] = str(math.ceil(e.retry_after))
+            except CircuitOpenError as e:
+                # Fail fast while the provider recovers instead of piling on
+                response = _error(503, str(e))
+            except ExchangeRateError as e:
+                status = 422 if str(e).startswith("unsupported-code") else 502
+                response = _error(status, str(e))
+            except ValueError as e:
+                # Missing API keys surface as ValueError from main.py
+                response = _error(503, str(e))
+            except Exception as e:
+                response = _error(502, f"Upstream failure: {type(e).__name__}")
+            span.attributes['status'] = response.status_code
+            return response
+
+    return wrapped
+
+
+@endpoint
+async def rate(request):
+    params = await _params(request)
+    from_currency, to_currency = _currency(params, "from"), _currency(params, "to")
+    return JSONResponse({"from": from_currency, "to": to_currency, "rate": await _rate(from_currency, to_currency)})
+
+
+@endpoint
+async def convert(request):
+    params = await _params(request)
+    amount = _amount(params.get("amount"))
+    from_currency, to_currency = _currency(params, "from"), _currency(params, "to")
+    date = params.get("date")
+    if date:
+        # Past dates come from the on-disk history; an unseen day is fetched once, so use a thread
+        rate = await run_in_threadpool(fetch_rate_on_date, date, from_currency, to_currency)
+    else:
+        rate = await _rate(from_currency, to_currency)
+    body = {"amount": amount, "from": from_currency, "to": to_currency, "rate": rate, "result": amount * rate}
+    if date:
+        body["date"] = date
+    return JSONResponse(body)
+
+
+def _codes(params, name, count):
+    value = params.get(name)
+    codes = [value] if isinstance(value, str) else value
+    if not isinstance(codes, list) or len(codes) not in (1, count):
+        raise BadRequest(f"'{name}' must be a currency code or a list with one code per amount")
+    return [_currency({name: code}, name) for code in codes]
+
+
+@endpoint
+async def batch(request):
+    params = await _params(request)
+    amounts = params.get("amounts")
+    if not isinstance(amounts, list) or not amounts:
+        raise BadRequest("'amounts' must be a non-empty list")
+    if len(amounts) > MAX_BATCH_SIZE:
+        raise BadRequest(f"At most {MAX_BATCH_SIZE} amounts per request")
+    amounts = [_amount(value, "amounts") for value in amounts]
+    from_codes, to_codes = _codes(params, "from", len(amounts)), _codes(params, "to", len(amounts))
+    dates = params.get("dates")
+    if dates is None:
+        converted = await aconvert_many(amounts, from_codes, to_codes)
+    else:
+        dates = [dates] if isinstance(dates, str) else dates
+        if not isinstance(dates, list) or len(dates) not in (1, len(amounts)):
+            raise BadRequest("'dates' must be a date or a list with one date per amount")
+        converted = await run_in_threadpool(convert_many_on_dates, amounts, dates, from_codes, to_codes)
+    return JSONResponse({"results": converted.tolist()})
+
+
+@endpoint
+async def chat(request):
+    from agent import answer
+
+    params = await _params(request)
+    message = params.get("message")
+    if not isinstance(message, str) or not message.strip():
+        raise BadRequest("'message' must be a non-empty string")
+    # The agent loop is blocking (tool pool, LLM client), so keep it off the event loop
+    with tracer.span("turn", kind="turn") as turn:
+        reply, path = await run_in_threadpool(answer, message)
+        turn.attributes['path'] = path
+    return JSONResponse({"reply": reply, "path": path})
+
+
+async def health(request):
+    return JSONResponse({
+        "status": "ok",
+        "rate_cache": rate_cache.stats(),
+        "crypto_cache": crypto_prices.stats(),
+        "prefetch": prefetcher.stats(),
+        "upstreams": upstream_metrics(),
+        "quotas": quotas.stats(),
+    })
+
+
+@asynccontextmanager
+async def lifespan(app):
+    yield
+    await aclose_clients()
+
+
+app = Starlette(
+    routes=[
+        Route("/rate", rate, methods=["GET", "POST"]),
+        Route("/convert", convert, methods=["GET", "POST"]),
+        Route("/batch", batch, methods=["POST"]),
+        Route("/chat", chat, methods=["POST"]),
+        Route("/health", health, methods=["GET"]),
+    ],
+    lifespan=lifespan,
+)
@@ -0,0 +1,118 @@
+import atexit
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+
+RATE_SNAPSHOT_PATH = os.getenv(
+    "RATE_SNAPSHOT_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "snapshots.sqlite3")
+)
+
+
+class SnapshotStore:
+    """Last good upstream responses kept in SQLite, shared by every process on the host.
+
+    Each row holds one cache entry as JSON together with the wall-clock time it
+    was saved, so a restarted process can reload its caches with their real
+    age. Writes go through a queue to a single background thread and never
+    block the caller.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._queue = queue.Queue()
+        self._writer = None
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        connection = sqlite3.connect(self.path, timeout=5)
+        # WAL lets readers in other workers load snapshots while one of them writes
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS snapshots ("
+            " namespace TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL, saved_at REAL NOT NULL,"
+            " PRIMARY KEY (namespace, key))"
+        )
+        return connection
+
+    def load(self, namespace):
+        """Return (key, value, saved_at) rows for a namespace, still JSON encoded"""
+        connection = self._connect()
+        try:
+            return connection.execute(
+                "SELECT key, value, saved_at FROM snapshots WHERE namespace = ?", (namespace,)
+            ).fetchall()
+        finally:
+            connection.close()
+
+    def save(self, namespace, key, value, saved_at):
+        """Queue a JSON-encoded entry to be written in the background"""
+        if self._writer is None:
+            with self._lock:
+                if self._writer is None:
+                    self._writer = threading.Thread(target=self._write_loop, name="snapshot-writer", daemon=True)
+                    self._writer.start()
+                    atexit.register(self.flush)
+        self._queue.put((namespace, key, value, saved_at))
+
+    def _write_loop(self):
+        connection = None
+        while True:
+            batch = [self._queue.get()]
+            # Write everything queued so far in one transaction
+            while True:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                if connection is None:
+                    connection = self._connect()
+                with connection:
+                    connection.executemany("INSERT OR REPLACE INTO snapshots VALUES (?, ?, ?, ?)", batch)
+            except sqlite3.Error:
+                # A snapshot is only an optimization; drop it rather than disturb the caller
+                connection = None
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    def flush(self):
+        """Block until every queued write has been committed"""
+        self._queue.join()
+
+    def namespace(self, name, encode, decode):
+        """A persist backend for TTLCache.attach that stores one cache's entries under name"""
+        return _Namespace(self, name, encode, decode)
+
+
+class _Namespace:
+    """One cache's view of a SnapshotStore, converting tuple keys and values to and from JSON"""
+
+    def __init__(self, store, name, encode, decode):
+        self.store = store
+        self.name = name
+        self._encode = encode
+        self._decode = decode
+
+    def load(self):
+        try:
+            rows = self.store.load(self.name)
+        except sqlite3.Error:
+            return
+        for key, value, saved_at in rows:
+            try:
+                yield tuple(json.loads(key)), self._decode(json.loads(value)), saved_at
+            except (ValueError, KeyError, TypeError):
+                # Written by an incompatible version; the entry will simply be refetched
+                continue
+
+    def save(self, key, value):
+        self.store.save(self.name, json.dumps(list(key)), json.dumps(self._encode(value)), time.time())
+
+
+# Process-wide snapshot store; set RATE_SNAPSHOT_PATH to an empty string to disable it
+snapshots = SnapshotStore(RATE_SNAPSHOT_PATH) if RATE_SNAPSHOT_PATH else None
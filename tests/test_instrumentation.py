@@ -0,0 +1,34 @@
+"""Looking traces up in the in-memory exporter.
+
+    python -m pytest tests
+"""
+import os
+import sys
+import threading
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from instrumentation import memory_exporter, tracer
+
+
+def test_trace_by_id_ignores_turns_finishing_later():
+    mine_started, theirs_done = threading.Event(), threading.Event()
+
+    def other_session():
+        mine_started.wait()
+        with tracer.span("turn", kind="turn"):
+            with tracer.span("tool theirs"):
+                pass
+        theirs_done.set()
+
+    thread = threading.Thread(target=other_session)
+    thread.start()
+    with tracer.span("turn", kind="turn") as turn:
+        trace_id = turn.trace_id
+        with tracer.span("tool mine"):
+            mine_started.set()
+            theirs_done.wait()
+    thread.join()
+
+    assert [span.name for span in memory_exporter.trace(trace_id)] == ["turn", "tool mine"]
+    assert memory_exporter.trace("no-such-trace") == []
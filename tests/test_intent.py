@@ -0,0 +1,47 @@
+"""Local prompt parsing: which prompts take the fast path and which tool families they need.
+
+    python -m pytest tests
+"""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from intent import parse_conversion, tool_families
+
+
+@pytest.mark.parametrize("prompt", [
+    "What was 1000 EUR in USD on March 1, 2024?",
+    "What is 1000 EUR in USD on 1 March 2024",
+    "EUR to USD on 03/01/2024",
+    "EUR to USD on 2024-03-01",
+    "How much were 50 GBP worth in 2019?",
+    "Convert 1,000 USD to EUR in December 2023",
+    "Convert 100 USD to EUR yesterday",
+])
+def test_past_dates_offer_history_and_skip_the_fast_path(prompt):
+    assert 'history' in tool_families(prompt)
+    assert parse_conversion(prompt) is None
+
+
+@pytest.mark.parametrize("prompt", [
+    "Convert 2000 USD to EUR",
+    "Convert 100 USD to EUR",
+    "May I convert 100 USD to EUR?",
+])
+def test_amounts_are_not_mistaken_for_dates(prompt):
+    assert tool_families(prompt) == {'fiat'}
+    assert parse_conversion(prompt)['name'] == 'convert'
+
+
+@pytest.mark.parametrize("prompt, source, target", [
+    ("How many dollars in a pound?", 'GBP', 'USD'),
+    ("How many yen per dollar?", 'USD', 'JPY'),
+    ("How many yen in 100 dollars?", 'USD', 'JPY'),
+    ("How much is 100 USD in EUR?", 'USD', 'EUR'),
+])
+def test_how_many_names_the_target_first(prompt, source, target):
+    args = parse_conversion(prompt)['args']
+    assert (args['from_currency'], args['to_currency']) == (source, target)
@@ -0,0 +1,48 @@
+"""Which tool plans PlanCache stores and how amounts are rebound on replay.
+
+    python -m pytest tests
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from plan_cache import PlanCache
+
+
+def _call(name, **args):
+    return {'name': name, 'args': args, 'id': 'call'}
+
+
+def _convert(amount, from_currency, to_currency):
+    return _call('convert', amount=amount, from_currency=from_currency, to_currency=to_currency)
+
+
+def test_amounts_are_rebound_by_position():
+    plans = PlanCache(ttl=60)
+    assert plans.store("Convert 100 USD to EUR and 200 GBP to JPY", [_convert(100, "USD", "EUR"), _convert(200, "GBP", "JPY")])
+    replay = plans.lookup("Convert 100 USD to EUR and 250 GBP to JPY")
+    assert [call['args']['amount'] for call in replay] == [100.0, 250.0]
+
+
+def test_repeated_prompt_number_is_refused():
+    plans = PlanCache(ttl=60)
+    calls = [_convert(100, "USD", "EUR"), _convert(100, "GBP", "JPY")]
+    assert not plans.store("Convert 100 USD to EUR and 100 GBP to JPY", calls)
+    assert plans.lookup("Convert 100 USD to EUR and 250 GBP to JPY") is None
+
+
+def test_plan_ignoring_a_prompt_number_is_refused():
+    plans = PlanCache(ttl=60)
+    assert not plans.store("What is 1 BTC in USD", [_call('get_crypto_rate', crypto='BTC', vs_currency='USD')])
+    assert plans.lookup("What is 5 BTC in USD") is None
+
+
+def test_number_used_by_two_arguments_is_refused():
+    plans = PlanCache(ttl=60)
+    assert not plans.store("Convert 100 USD to EUR", [_convert(100, "USD", "EUR"), _convert(100, "USD", "GBP")])
+
+
+def test_model_derived_number_is_refused():
+    plans = PlanCache(ttl=60)
+    assert not plans.store("Convert 100 USD to EUR, then that to BTC", [_convert(100, "USD", "EUR"), _convert(92.13, "EUR", "BTC")])
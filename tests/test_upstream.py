@@ -0,0 +1,108 @@
+"""Circuit breaker behaviour of upstream.get_json against a local HTTP server.
+
+    python -m pytest tests
+"""
+import json
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import upstream
+from quota import QuotaExceededError
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        status = self.server.status
+        payload = json.dumps({"ok": status == 200}).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+
+@pytest.fixture
+def server(monkeypatch):
+    monkeypatch.setattr(upstream, "BREAKER_COOLDOWN", 0.05)
+    monkeypatch.setattr(upstream, "RETRIES", 0)
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+    httpd.status = 200
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+    upstream._hosts.pop(f"127.0.0.1:{httpd.server_port}", None)
+
+
+def _url(server, path="rates"):
+    return f"http://127.0.0.1:{server.server_port}/{path}"
+
+
+def _state(server):
+    return upstream.metrics()[f"127.0.0.1:{server.server_port}"]['state']
+
+
+def _open_breaker(server):
+    server.status = 500
+    for i in range(upstream.BREAKER_FAILURES):
+        with pytest.raises(upstream.UpstreamStatusError):
+            upstream.get_json(_url(server, f"fail{i}"))
+    assert _state(server) == "open"
+    time.sleep(0.06)
+
+
+def test_refused_charge_does_not_strand_half_open_breaker(server):
+    _open_breaker(server)
+
+    def refuse():
+        raise QuotaExceededError("Refresh deferred to stay within the monthly quota", 60)
+
+    with pytest.raises(QuotaExceededError):
+        upstream.get_json(_url(server), charge=refuse)
+    assert _state(server) == "open"
+
+    # The probe slot went back, so the next request still gets through and closes the breaker
+    server.status = 200
+    assert upstream.get_json(_url(server)) == {"ok": True}
+    assert _state(server) == "closed"
+
+
+def test_refused_charge_async(server):
+    import asyncio
+
+    _open_breaker(server)
+
+    async def refuse():
+        raise QuotaExceededError("Refresh deferred by the per-second limit", 1)
+
+    async def run():
+        with pytest.raises(QuotaExceededError):
+            await upstream.aget_json(_url(server), charge=refuse)
+        assert _state(server) == "open"
+        server.status = 200
+        assert await upstream.aget_json(_url(server, "again")) == {"ok": True}
+        await upstream.aclose_clients()
+
+    asyncio.run(run())
+    assert _state(server) == "closed"
+
+
+def test_rate_limit_is_not_retried_or_counted(server, monkeypatch):
+    monkeypatch.setattr(upstream, "RETRIES", 2)
+    server.status = 429
+    for i in range(upstream.BREAKER_FAILURES + 1):
+        with pytest.raises(upstream.UpstreamRateLimitError):
+            upstream.get_json(_url(server, f"limited{i}"))
+    stats = upstream.metrics()[f"127.0.0.1:{server.server_port}"]
+    assert stats['state'] == "closed"
+    assert stats['retries'] == 0 and stats['failures'] == 0
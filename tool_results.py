@@ -0,0 +1,148 @@
+import datetime
+import os
+import time
+
+# Seconds a fetched rate counts as current: the caches' TTLs, past which they serve it stale while
+# refreshing. Older results say how old they are. Never under a minute, so RATE_CACHE_TTL=0 stays quiet
+RATE_FRESH_FOR = max(60.0, float(os.getenv("RATE_CACHE_TTL", "300")))
+CRYPTO_FRESH_FOR = max(60.0, float(os.getenv("CRYPTO_CACHE_TTL", "60")))
+
+
+def age_note(timestamp, fresh_for, now=None):
+    """Suffix giving the age of a result fetched more than fresh_for seconds ago, e.g. " (rate from 3 h ago)", else ''"""
+    age = (time.time() if now is None else now) - timestamp
+    if fresh_for is None or age <= fresh_for:
+        return ""
+    if age < 3600:
+        return f" (rate from {age // 60:.0f} min ago)"
+    return f" (rate from {age / 3600:.0f} h ago)"
+
+
+class RateQuote:
+    """Conversion factor between two currencies at the time the rate was fetched"""
+
+    __slots__ = ('from_currency', 'to_currency', 'rate', 'timestamp')
+
+    fresh_for = RATE_FRESH_FOR
+
+    def __init__(self, from_currency, to_currency, rate, timestamp=None):
+        self.from_currency = from_currency.upper()
+        self.to_currency = to_currency.upper()
+        self.rate = rate
+        self.timestamp = time.time() if timestamp is None else timestamp
+
+    def age_note(self):
+        return age_note(self.timestamp, self.fresh_for)
+
+    def __str__(self):
+        return f"1 {self.from_currency} = {self.rate:.6g} {self.to_currency}{self.age_note()}"
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self.from_currency!r}, {self.to_currency!r}, {self.rate!r})"
+
+
+class CryptoQuote(RateQuote):
+    """Price of one coin in a quote currency"""
+
+    __slots__ = ()
+    fresh_for = CRYPTO_FRESH_FOR
+
+    def __str__(self):
+        return f"1 {self.from_currency} = {self.rate:,.2f} {self.to_currency}{self.age_note()}"
+
+
+class Conversion:
+    """An amount converted at a given rate"""
+
+    __slots__ = ('amount', 'from_currency', 'to_currency', 'rate', 'result', 'timestamp')
+
+    # Decimal places shown when the conversion is rendered for the model
+    decimals = 2
+    fresh_for = RATE_FRESH_FOR
+
+    def __init__(self, amount, from_currency, to_currency, rate, timestamp=None):
+        self.amount = amount
+        self.from_currency = from_currency.upper()
+        self.to_currency = to_currency.upper()
+        self.rate = rate
+        self.result = amount * rate
+        self.timestamp = time.time() if timestamp is None else timestamp
+
+    def age_note(self):
+        return age_note(self.timestamp, self.fresh_for)
+
+    def _text(self):
+        return f"{self.amount} {self.from_currency} = {self.result:.{self.decimals}f} {self.to_currency}"
+
+    def __str__(self):
+        return f"{self._text()}{self.age_note()}"
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self.amount!r}, {self.from_currency!r}, {self.to_currency!r}, {self.rate!r})"
+
+
+class BtcConversion(Conversion):
+    """A fiat amount converted to Bitcoin"""
+
+    __slots__ = ()
+    decimals = 8
+    fresh_for = CRYPTO_FRESH_FOR
+
+
+class PathConversion(Conversion):
+    """An amount converted along a chain of rates, e.g. INR -> USD -> ETH"""
+
+    __slots__ = ('path', 'decimals')
+
+    def __init__(self, amount, from_currency, to_currency, rate, timestamp, path, decimals=2):
+        super().__init__(amount, from_currency, to_currency, rate, timestamp)
+        self.path = tuple(path)
+        self.decimals = decimals
+
+    def _text(self):
+        if len(self.path) <= 2:
+            return super()._text()
+        return f"{super()._text()} (via {' -> '.join(self.path[1:-1])})"
+
+
+class HistoricalConversion(Conversion):
+    """An amount converted at the rate of a past date"""
+
+    __slots__ = ('date',)
+    # A past day's rate is as current as it gets
+    fresh_for = None
+
+    def __init__(self, amount, from_currency, to_currency, rate, date):
+        # Stamped with the start of the day (UTC) the rate applies to
+        midnight = datetime.datetime.combine(date, datetime.time(), datetime.timezone.utc)
+        super().__init__(amount, from_currency, to_currency, rate, midnight.timestamp())
+        self.date = date
+
+    def __str__(self):
+        return f"On {self.date.isoformat()}, {super().__str__()}"
+
+
+class BatchConversion:
+    """Many amounts converted in one pass; currency lists are expanded to one code per amount"""
+
+    __slots__ = ('amounts', 'from_currencies', 'to_currencies', 'results', 'timestamp')
+
+    def __init__(self, amounts, from_currencies, to_currencies, results, timestamp=None):
+        count = len(amounts)
+        self.amounts = list(amounts)
+        self.from_currencies = [code.upper() for code in (from_currencies * count if len(from_currencies) == 1 else from_currencies)]
+        self.to_currencies = [code.upper() for code in (to_currencies * count if len(to_currencies) == 1 else to_currencies)]
+        self.results = [float(value) for value in results]
+        self.timestamp = time.time() if timestamp is None else timestamp
+
+    def __len__(self):
+        return len(self.amounts)
+
+    def __str__(self):
+        return "\n".join(
+            f"{amount} {from_code} = {value:.2f} {to_code}"
+            for amount, from_code, to_code, value in zip(self.amounts, self.from_currencies, self.to_currencies, self.results)
+        )
+
+    def __repr__(self):
+        return f"{type(self).__name__}({len(self)} conversions)"
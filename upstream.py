@@ -0,0 +1,513 @@
+import asyncio
+import contextvars
+import os
+import random
+import threading
+import time
+import weakref
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, TimeoutError as FutureTimeoutError, wait
+from urllib.parse import urlsplit
+
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+
+from instrumentation import register_collector, tracer
+
+# Maximum keep-alive connections held open per upstream host
+POOL_SIZE = int(os.getenv("UPSTREAM_POOL_SIZE", "20"))
+# Consecutive failed attempts that open a host's circuit breaker
+BREAKER_FAILURES = int(os.getenv("UPSTREAM_BREAKER_FAILURES", "5"))
+# Seconds an open breaker fails requests fast before letting one probe through
+BREAKER_COOLDOWN = float(os.getenv("UPSTREAM_BREAKER_COOLDOWN", "30"))
+# Extra attempts after a connection error, timeout or 5xx; a 429 is never retried
+RETRIES = int(os.getenv("UPSTREAM_RETRIES", "2"))
+# Backoff before retry n is uniform in [0, base * 2**n] ("full jitter")
+RETRY_BASE_DELAY = float(os.getenv("UPSTREAM_RETRY_BASE_MS", "100")) / 1000
+# Hosts ("host" or "host:port") that get a second request when the first is still pending after
+# their p95 latency; off by default, since a hedge can cost a second unit of a metered API's quota
+HEDGE_HOSTS = frozenset(filter(None, (host.strip() for host in os.getenv("UPSTREAM_HEDGE_HOSTS", "").split(","))))
+# Successful requests a host needs before its p95 is trusted for hedging
+HEDGE_MIN_SAMPLES = 20
+
+
+class UpstreamError(Exception):
+    """Raised when an upstream host can't produce a usable response"""
+
+
+class UpstreamStatusError(UpstreamError):
+    """Raised for a 429 or 5xx answer; the message names the host, never the URL, which may carry an API key"""
+
+    def __init__(self, host, status):
+        super().__init__(f"{host} returned HTTP {status}")
+        self.host = host
+        self.status = status
+
+
+class UpstreamRateLimitError(UpstreamStatusError):
+    """Raised for a 429: the host is up but refusing us, so it isn't retried or counted against its breaker"""
+
+
+class CircuitOpenError(UpstreamError):
+    """Raised without contacting a host whose circuit breaker is open"""
+
+
+class _NotSent(Exception):
+    """Wraps the exception a charge hook raised, so the breaker doesn't count an attempt that was never sent"""
+
+    def __init__(self, error):
+        super().__init__(str(error))
+        self.error = error
+
+
+class _Host:
+    """Circuit breaker, latency samples and counters for one upstream host.
+
+    The breaker opens after BREAKER_FAILURES consecutive failed attempts and
+    fails every request fast for BREAKER_COOLDOWN seconds. Then one probe is
+    let through (half-open): success closes it, failure opens it again.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self.latencies = deque(maxlen=256)
+        self.hedge = name in HEDGE_HOSTS or name.rpartition(":")[0] in HEDGE_HOSTS
+        self.counters = dict.fromkeys(('requests', 'failures', 'retries', 'hedges', 'hedge_wins', 'rejected'), 0)
+        self._lock = threading.Lock()
+
+    def count(self, name):
+        with self._lock:
+            self.counters[name] += 1
+
+    def admit(self):
+        """Raise CircuitOpenError unless the breaker lets a request through"""
+        with self._lock:
+            if self.state == "open" and time.monotonic() - self.opened_at >= BREAKER_COOLDOWN:
+                self.state = "half_open"
+                return
+            if self.state != "closed":
+                self.counters['rejected'] += 1
+                raise CircuitOpenError(f"{self.name} circuit open after repeated failures")
+
+    def abandon(self):
+        """Undo admit() for an attempt that was never sent, handing a half-open probe back to the next request"""
+        with self._lock:
+            if self.state == "half_open":
+                # opened_at is kept, so the cooldown has already passed for whoever comes next
+                self.state = "open"
+
+    def record(self, ok):
+        with self._lock:
+            if ok:
+                self.state = "closed"
+                self.failures = 0
+                return
+            self.counters['failures'] += 1
+            self.failures += 1
+            if self.state == "half_open" or self.failures >= BREAKER_FAILURES:
+                self.state = "open"
+                self.opened_at = time.monotonic()
+
+    def observe(self, seconds):
+        with self._lock:
+            self.latencies.append(seconds)
+
+    def hedge_delay(self):
+        """Seconds to wait before hedging: the p95 of recent successful requests, or None if unknown or not hedged"""
+        if not self.hedge:
+            return None
+        with self._lock:
+            if len(self.latencies) < HEDGE_MIN_SAMPLES:
+                return None
+            ordered = sorted(self.latencies)
+        return ordered[int(0.95 * (len(ordered) - 1))]
+
+    def stats(self):
+        with self._lock:
+            return dict(self.counters, state=self.state)
+
+
+_hosts = {}
+_hosts_lock = threading.Lock()
+
+# Runs first attempts and their hedges side by side; hedging only applies once a host's p95 is known
+_hedge_pool = ThreadPoolExecutor(max_workers=2 * POOL_SIZE, thread_name_prefix="upstream-hedge")
+
+# Retryable failures; other exceptions, 429s included, mean the host answered and are passed straight to the caller
+_TRANSIENT = (requests.ConnectionError, requests.Timeout, httpx.TransportError, UpstreamStatusError)
+
+
+def _host(name):
+    host = _hosts.get(name)
+    if host is None:
+        with _hosts_lock:
+            host = _hosts.setdefault(name, _Host(name))
+    return host
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+# Async clients are bound to the event loop that created them, so keep one set per loop
+_async_clients = weakref.WeakKeyDictionary()
+
+# In-flight GETs by URL, so identical concurrent requests share one response
+_inflight = {}
+_inflight_lock = threading.Lock()
+_ainflight = weakref.WeakKeyDictionary()
+
+
+def get_session(host):
+    """Get the pooled keep-alive requests session for an upstream host"""
+    session = _sessions.get(host)
+    if session is None:
+        with _sessions_lock:
+            session = _sessions.get(host)
+            if session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=POOL_SIZE)
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                _sessions[host] = session
+    return session
+
+
+def get_async_client(host):
+    """Get the pooled keep-alive async client for an upstream host on the running event loop"""
+    loop = asyncio.get_running_loop()
+    clients = _async_clients.get(loop)
+    if clients is None:
+        clients = _async_clients[loop] = {}
+    client = clients.get(host)
+    if client is None:
+        limits = httpx.Limits(max_connections=POOL_SIZE, max_keepalive_connections=POOL_SIZE)
+        client = clients[host] = httpx.AsyncClient(limits=limits)
+    return client
+
+
+def get_json(url, timeout=10, charge=None):
+    """GET a URL through the host's pooled session and decode the JSON body.
+
+    Concurrent calls for the same URL are coalesced into one request, and
+    every caller receives the same decoded object, so callers must not
+    mutate it. `charge()` is called before every request actually sent,
+    retries and hedges included, and may raise to stop that request;
+    callers joining an in-flight request aren't charged.
+    """
+    with _inflight_lock:
+        future = _inflight.get(url)
+        leader = future is None
+        if leader:
+            future = _inflight[url] = Future()
+    if not leader:
+        tracer.annotate(coalesced=True)
+        return future.result()
+    try:
+        body = _get_json(url, timeout, charge)
+    except BaseException as e:
+        future.set_exception(e)
+        raise
+    else:
+        future.set_result(body)
+        return body
+    finally:
+        with _inflight_lock:
+            del _inflight[url]
+
+
+async def aget_json(url, timeout=10, charge=None):
+    """Async variant of get_json; requests are coalesced per event loop, and charge is a coroutine function"""
+    loop = asyncio.get_running_loop()
+    inflight = _ainflight.get(loop)
+    if inflight is None:
+        inflight = _ainflight[loop] = {}
+    task = inflight.get(url)
+    if task is None:
+        task = inflight[url] = loop.create_task(_aget_json(url, timeout, charge))
+        task.add_done_callback(lambda _: inflight.pop(url, None))
+    else:
+        tracer.annotate(coalesced=True)
+    # A caller giving up must not cancel the request for everybody else
+    return await asyncio.shield(task)
+
+
+def _backoff(attempt, deadline):
+    """Jittered delay before retry attempt+1, or None if retries are exhausted or it would pass the deadline"""
+    delay = random.uniform(0, RETRY_BASE_DELAY * 2 ** attempt)
+    if attempt >= RETRIES or time.monotonic() + delay >= deadline:
+        return None
+    return delay
+
+
+def _get_json(url, timeout, charge):
+    """GET with the host's breaker, bounded jittered retries and hedging, all within timeout seconds"""
+    host = _host(urlsplit(url).netloc)
+    host.count('requests')
+    deadline = time.monotonic() + timeout
+    attempt = 0
+    while True:
+        host.admit()
+        try:
+            body = _hedged_get(host, url, max(0.001, deadline - time.monotonic()), charge)
+        except _NotSent as e:
+            host.abandon()
+            raise e.error from None
+        except UpstreamRateLimitError:
+            host.record(True)
+            raise
+        except _TRANSIENT:
+            host.record(False)
+            delay = _backoff(attempt, deadline)
+            if delay is None:
+                raise
+        except Exception:
+            host.record(True)
+            raise
+        else:
+            host.record(True)
+            return body
+        host.count('retries')
+        attempt += 1
+        time.sleep(delay)
+
+
+def _hedged_get(host, url, timeout, charge):
+    """One attempt; if it's slower than the host's p95, race a second request and keep whichever answers first"""
+    deadline = time.monotonic() + timeout
+    delay = host.hedge_delay()
+    if delay is None or delay >= timeout:
+        return _send(host, url, timeout, charge)
+    first = _hedge_pool.submit(contextvars.copy_context().run, _send, host, url, timeout, charge)
+    try:
+        return first.result(timeout=delay)
+    except FutureTimeoutError:
+        pass
+    host.count('hedges')
+    second = _hedge_pool.submit(contextvars.copy_context().run, _send, host, url, timeout - delay, charge, True)
+    pending = {first, second}
+    while True:
+        done, pending = wait(pending, timeout=max(0.0, deadline - time.monotonic()), return_when=FIRST_COMPLETED)
+        if not done:
+            # The session's timeout bounds each read, not the whole request; the losers finish in the background
+            raise requests.Timeout(f"{host.name} didn't answer within {timeout:.1f}s")
+        for future in done:
+            if future.exception() is None:
+                if future is second:
+                    host.count('hedge_wins')
+                return future.result()
+        if not pending:
+            raise done.pop().exception()
+
+
+def _send(host, url, timeout, charge, hedge=False):
+    if charge is not None:
+        try:
+            charge()
+        except Exception as e:
+            raise _NotSent(e) from e
+    with tracer.span(f"GET {host.name}", kind="upstream", host=host.name) as span:
+        if hedge:
+            span.attributes['hedge'] = True
+        start = time.perf_counter()
+        response = get_session(host.name).get(url, timeout=timeout)
+        span.attributes['status'] = response.status_code
+        if response.status_code == 429:
+            raise UpstreamRateLimitError(host.name, response.status_code)
+        if response.status_code >= 500:
+            raise UpstreamStatusError(host.name, response.status_code)
+        host.observe(time.perf_counter() - start)
+        return response.json()
+
+
+async def _aget_json(url, timeout, charge):
+    """Async variant of _get_json"""
+    host = _host(urlsplit(url).netloc)
+    host.count('requests')
+    deadline = time.monotonic() + timeout
+    attempt = 0
+    while True:
+        host.admit()
+        try:
+            body = await _ahedged_get(host, url, max(0.001, deadline - time.monotonic()), charge)
+        except _NotSent as e:
+            host.abandon()
+            raise e.error from None
+        except UpstreamRateLimitError:
+            host.record(True)
+            raise
+        except _TRANSIENT:
+            host.record(False)
+            delay = _backoff(attempt, deadline)
+            if delay is None:
+                raise
+        except Exception:
+            host.record(True)
+            raise
+        else:
+            host.record(True)
+            return body
+        host.count('retries')
+        attempt += 1
+        await asyncio.sleep(delay)
+
+
+async def _ahedged_get(host, url, timeout, charge):
+    deadline = time.monotonic() + timeout
+    delay = host.hedge_delay()
+    if delay is None or delay >= timeout:
+        return await _asend(host, url, timeout, charge)
+    first = asyncio.ensure_future(_asend(host, url, timeout, charge))
+    done, _ = await asyncio.wait({first}, timeout=delay)
+    if done:
+        return first.result()
+    host.count('hedges')
+    second = asyncio.ensure_future(_asend(host, url, timeout - delay, charge, True))
+    pending = {first, second}
+    try:
+        while True:
+            done, pending = await asyncio.wait(
+                pending, timeout=max(0.0, deadline - time.monotonic()), return_when=asyncio.FIRST_COMPLETED
+            )
+            if not done:
+                raise httpx.TimeoutException(f"{host.name} didn't answer within {timeout:.1f}s")
+            for task in done:
+                if task.exception() is None:
+                    if task is second:
+                        host.count('hedge_wins')
+                    return task.result()
+            if not pending:
+                raise done.pop().exception()
+    finally:
+        # The loser is no longer needed; unlike a thread, a task can be cancelled
+        for task in pending:
+            task.cancel()
+
+
+async def _asend(host, url, timeout, charge, hedge=False):
+    if charge is not None:
+        try:
+            await charge()
+        except Exception as e:
+            raise _NotSent(e) from e
+    with tracer.span(f"GET {host.name}", kind="upstream", host=host.name) as span:
+        if hedge:
+            span.attributes['hedge'] = True
+        start = time.perf_counter()
+        response = await get_async_client(host.name).get(url, timeout=timeout)
+        span.attributes['status'] = response.status_code
+        if response.status_code == 429:
+            raise UpstreamRateLimitError(host.name, response.status_code)
+        if response.status_code >= 500:
+            raise UpstreamStatusError(host.name, response.status_code)
+        host.observe(time.perf_counter() - start)
+        return response.json()
+
+
+def metrics():
+    """Breaker state and request, failure, retry and hedge counts per upstream host"""
+    with _hosts_lock:
+        hosts = list(_hosts.values())
+    return {host.name: host.stats() for host in hosts}
+
+
+_STATE_VALUES = {"closed": 0, "half_open": 1, "open": 2}
+
+
+def _collect():
+    samples = []
+    for name, stats in metrics().items():
+        labels = (('host', name),)
+        samples.append(('converter_upstream_circuit_state', 'gauge', labels, _STATE_VALUES[stats['state']]))
+        for counter in ('requests', 'failures', 'retries', 'hedges', 'hedge_wins', 'rejected'):
+            samples.append((f'converter_upstream_{counter}_total', 'counter', labels, stats[counter]))
+    return samples
+
+
+register_collector(_collect)
+
+
+async def aclose_clients():
+    """Close the async clients owned by the running event loop"""
+    clients = _async_clients.pop(asyncio.get_running_loop(), {})
+    for client in clients.values():
+        await client.aclose()
+
+
+class MicroBatcher:
+    """Merges requests arriving within a short window into one upstream call.
+
+    Each caller submits the set of items it needs; the first one waits window
+    seconds for others to join, then calls fetch_many once with the union of
+    every submitted set and hands the same result to all of them. Callers
+    joining while that call is running start the next batch.
+    """
+
+    def __init__(self, fetch_many, window):
+        self.fetch_many = fetch_many
+        self.window = window
+        self.calls = 0
+        self.requests = 0
+        self._pending = None
+        self._apending = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+
+    def submit(self, items):
+        """Return fetch_many(union of the items submitted in this window)"""
+        with self._lock:
+            self.requests += 1
+            batch = self._pending
+            leader = batch is None
+            if leader:
+                batch = self._pending = (set(), Future())
+            batch[0].update(items)
+        items, future = batch
+        if not leader:
+            return future.result()
+        time.sleep(self.window)
+        with self._lock:
+            self._pending = None
+            self.calls += 1
+        try:
+            result = self.fetch_many(frozenset(items))
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        future.set_result(result)
+        return result
+
+    async def asubmit(self, items, afetch_many):
+        """Async variant of submit; afetch_many is a coroutine function, and batches are per event loop"""
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            self.requests += 1
+            batch = self._apending.get(loop)
+            leader = batch is None
+            if leader:
+                batch = self._apending[loop] = (set(), loop.create_future())
+            batch[0].update(items)
+        items, future = batch
+        if not leader:
+            return await asyncio.shield(future)
+        await asyncio.sleep(self.window)
+        with self._lock:
+            del self._apending[loop]
+            self.calls += 1
+        try:
+            result = await afetch_many(frozenset(items))
+        except BaseException as e:
+            if isinstance(e, asyncio.CancelledError):
+                future.cancel()
+            else:
+                future.set_exception(e)
+                # Mark the exception as retrieved in case nobody else was waiting
+                future.exception()
+            raise
+        future.set_result(result)
+        return result
+
+    def stats(self):
+        with self._lock:
+            return {'requests': self.requests, 'upstream_calls': self.calls, 'window': self.window}